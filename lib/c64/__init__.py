@@ -1,3 +1,7 @@
+from __future__ import with_statement
+
+import mmap
+
 
 def blocks(bytes, block_size, offset=0, max=0):
     i = offset
@@ -9,3 +13,19 @@ def blocks(bytes, block_size, offset=0, max=0):
 
 def struct_doc(format):
     return ''.join(x.partition('#')[0].strip() for x in format.splitlines())
+
+def map_file(filename, writable=False):
+    """Return a memory map of the given file.
+    
+    Only the pages that are actually sliced get read from disk, so
+    containers built on a mapped file can skip most of a large image.
+    The map is read-only unless `writable` is True, in which case 
+    changes are written through to the file.
+    Empty files can't be mapped; an empty string is returned instead.
+    """
+    with open(filename, 'r+b' if writable else 'rb') as f:
+        f.seek(0, 2)
+        if f.tell() == 0:
+            return ''
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        return mmap.mmap(f.fileno(), 0, access=access)
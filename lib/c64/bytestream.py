@@ -1,7 +1,20 @@
 from __future__ import with_statement
 
+import struct
+
+_BYTE = struct.Struct('<B')
+_WORD = struct.Struct('<H')
+
 class ByteStream(object):
-    """Represents a stream of little-endian bytes (stored originally as a string)."""
+    """Represents a stream of little-endian bytes (stored originally as a string).
+    
+    The bytes may also be a bytearray or a memory map; nothing is copied
+    until it is read, and strings read are always returned as `str`.
+    Reading past the end raises IndexError.
+    """
+    
+    # Compiled readers for `words`, by count.
+    _word_structs = dict()
     
     def __init__(self, s):
         self.bytes = s
@@ -21,50 +34,85 @@ class ByteStream(object):
         
     def word(self):
         "Read the next two bytes from the stream, and convert them to an integer (little-endian)."
-        lo = ord(self.bytes[self.pos])
-        hi = ord(self.bytes[self.pos+1])
+        try:
+            (value,) = _WORD.unpack_from(self.bytes, self.pos)
+        except struct.error:
+            raise IndexError, "Read past end of stream."
         self.pos += 2
-        return lo + hi*256
+        return value
+        
+    def words(self, n):
+        "Read the next n words from the stream, as a tuple of integers."
+        reader = self._word_structs.get(n)
+        if reader is None:
+            reader = self._word_structs[n] = struct.Struct('<%dH' % n)
+        try:
+            values = reader.unpack_from(self.bytes, self.pos)
+        except struct.error:
+            raise IndexError, "Read past end of stream."
+        self.pos += 2 * n
+        return values
         
     def byte(self):
         "Read the next byte form the strea, and convert to an integer."
-        lo = ord(self.bytes[self.pos])
+        lo = self.peek()
         self.pos += 1
         return lo
         
+    def bytes_array(self, n):
+        "Read the next n bytes from the stream, as a bytearray of integers."
+        if self.pos + n > len(self.bytes):
+            raise IndexError, "Read past end of stream."
+        result = bytearray(buffer(self.bytes, self.pos, n))
+        self.pos += n
+        return result
+        
+    def peek(self):
+        "Return the next byte as an integer, without advancing the stream."
+        try:
+            return _BYTE.unpack_from(self.bytes, self.pos)[0]
+        except struct.error:
+            raise IndexError, "Read past end of stream."
+        
     def chars(self, n):
         "Return the next n bytes from the stream as a string."
-        s = self.bytes[self.pos:self.pos+n]
+        s = str(self.bytes[self.pos:self.pos+n])
         self.pos += n
         return s
         
+    def view(self, n):
+        "Return the next n bytes from the stream as a buffer, without copying."
+        b = buffer(self.bytes, self.pos, n)
+        self.pos += len(b)
+        return b
+        
     def rest(self):
         "Return the unread bytes from this stream, but do not advance the stream position."
-        return self.bytes[self.pos:]
+        return str(self.bytes[self.pos:])
         
     def dump(self):
         "Return a hex representation of the bytes remaining in this stream."
-        return ' '.join(['%02X' % (ord(b)) for b in r.rest()])
-
+        return ' '.join(['%02X' % (ord(b)) for b in self.rest()])
+        
     def eof(self):
         "Are we at the end of the stream?"
         return self.pos >= len(self.bytes)
-
+        
     def read_until(self, b, keep=True):
         "Return a string up to the character or byte 'b', or the end of the string if b isn't found."
         # b can be a character or integer
         if isinstance(b, int):
             b = chr(b)
-        
-        j = self.pos
-        while j < len(self.bytes) and self.bytes[j] != b:
-            j += 1
-        
+            
+        j = self.bytes.find(b, self.pos)
+        if j < 0:
+            j = len(self.bytes)
+            
         cut_off = j+1 if keep else j
-        result = self.bytes[self.pos:cut_off]
-
+        result = str(self.bytes[self.pos:cut_off])
+        
         self.pos = j+1
-
+        
         return result
 
 def load(filename):
@@ -0,0 +1,181 @@
+"""A persistent SQLite catalog of image contents.
+
+The catalog records each image's header and directory, with a SHA-1 hash
+of the image and of every file in it. Re-indexing an image is skipped when
+its modification time and size are unchanged, or when its contents hash
+the same as last time, so a large archive can be refreshed cheaply.
+
+Names are stored both as raw PETSCII bytes and as printable strings (see
+`petscii_str`); the printable form is what lookups match against.
+"""
+from __future__ import with_statement
+
+import hashlib
+import os
+import sqlite3
+
+from c64.formats.loaders import get_loader
+from c64.formats.names import fold_case
+from c64.formats.petscii import petscii_str
+
+__all__ = ['Catalog']
+
+_SCHEMA = '''
+create table if not exists images (
+    id integer primary key,
+    path text unique not null,
+    mtime real,
+    size integer,
+    hash text,
+    image_type text,
+    disk_name text,
+    disk_id text,
+    error text
+);
+
+create table if not exists entries (
+    image_id integer not null references images(id),
+    idx integer not null,
+    name text,
+    folded_name text,
+    raw_name blob,
+    filetype integer,
+    geos_type integer,
+    size integer,
+    hash text
+);
+
+create index if not exists entries_image on entries(image_id);
+create index if not exists entries_name on entries(name);
+create index if not exists entries_folded_name on entries(folded_name);
+create index if not exists entries_hash on entries(hash);
+create index if not exists images_hash on images(hash);
+'''
+
+_HASH_BLOCK_SIZE = 64 * 1024
+
+def _hash_file(filename):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(_HASH_BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class Catalog(object):
+    """An SQLite-backed index of disk and tape images.
+    
+    `filename` is the database file; use ':memory:' for a throwaway
+    catalog.
+    """
+    
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.text_factory = str
+        self.db.executescript(_SCHEMA)
+        
+    def close(self):
+        self.db.close()
+        
+    def index(self, path):
+        """Add or refresh the image at `path`.
+        
+        Returns True if the image was (re-)parsed, and False if it was
+        unchanged since it was last indexed.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self.db.execute(
+            'select id, mtime, size, hash from images where path = ?', 
+            (path,)).fetchone()
+            
+        if row is not None and row[1] == st.st_mtime and row[2] == st.st_size:
+            return False
+        
+        image_hash = _hash_file(path)
+        if row is not None and row[3] == image_hash:
+            with self.db:
+                self.db.execute('update images set mtime = ?, size = ? where id = ?',
+                    (st.st_mtime, st.st_size, row[0]))
+            return False
+            
+        with self.db:
+            if row is not None:
+                self.db.execute('delete from entries where image_id = ?', (row[0],))
+                self.db.execute('delete from images where id = ?', (row[0],))
+            self._add(path, st, image_hash)
+        return True
+        
+    def index_all(self, paths):
+        """Index each of `paths`, returning the number of images parsed."""
+        return sum(1 for path in paths if self.index(path))
+        
+    def _add(self, path, st, image_hash):
+        try:
+            d = get_loader(path)(path, mapped=True)
+            disk_name = d.disk_name if hasattr(d, 'disk_name') else d.label
+            entries = list(d.entries)
+        except Exception, e:
+            self.db.execute('insert into images (path, mtime, size, hash, error) '
+                'values (?, ?, ?, ?, ?)', (path, st.st_mtime, st.st_size, 
+                    image_hash, '%s: %s' % (e.__class__.__name__, e)))
+            return
+        
+        cursor = self.db.execute('insert into images '
+            '(path, mtime, size, hash, image_type, disk_name, disk_id) '
+            'values (?, ?, ?, ?, ?, ?, ?)', (path, st.st_mtime, st.st_size, 
+                image_hash, d.image_type, petscii_str(disk_name), 
+                petscii_str(getattr(d, 'disk_id', ''))))
+        image_id = cursor.lastrowid
+        
+        rows = list()
+        for i, e in enumerate(entries):
+            try:
+                file_hash = hashlib.sha1(d.file(i)).hexdigest()
+            except Exception:
+                file_hash = None
+                
+            rows.append((image_id, i, petscii_str(e.name), 
+                petscii_str(fold_case(e.name)), buffer(e.raw_name),
+                e.filetype, getattr(e, 'geos_type', 0), 
+                getattr(e, 'size', None), file_hash))
+                
+        self.db.executemany('insert into entries values (?, ?, ?, ?, ?, ?, ?, ?, ?)', 
+            rows)
+        
+    def images_containing(self, name, ignore_case=False):
+        """Return a list of (image path, entry index) for files named `name`."""
+        if ignore_case:
+            column, name = 'folded_name', petscii_str(fold_case(name))
+        else:
+            column = 'name'
+            
+        return self.db.execute('select images.path, entries.idx '
+            'from entries join images on images.id = entries.image_id '
+            'where entries.%s = ? order by images.path, entries.idx' % (column,), 
+            (name,)).fetchall()
+            
+    def images_with_hash(self, file_hash):
+        """Return a list of (image path, entry index, name) for every file
+        whose contents hash to `file_hash`."""
+        return self.db.execute('select images.path, entries.idx, entries.name '
+            'from entries join images on images.id = entries.image_id '
+            'where entries.hash = ? order by images.path, entries.idx', 
+            (file_hash,)).fetchall()
+            
+    def entries(self, path):
+        """Return (index, name, filetype, size, hash) for each entry of 
+        the image at `path`."""
+        return self.db.execute('select idx, entries.name, filetype, entries.size, '
+            'entries.hash from entries join images on images.id = entries.image_id '
+            'where images.path = ? order by idx', 
+            (os.path.abspath(path),)).fetchall()
+            
+    def image(self, path):
+        """Return (image type, disk name, disk id, error) for the image 
+        at `path`, or None if it hasn't been indexed."""
+        return self.db.execute('select image_type, disk_name, disk_id, error '
+            'from images where path = ?', (os.path.abspath(path),)).fetchone()
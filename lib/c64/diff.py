@@ -0,0 +1,189 @@
+"""Compare disk images, and search collections for similar images.
+
+`diff_disks` compares two CBM-DOS disks at the sector, directory entry
+and file level. `SimilarityIndex` finds images that share sectors with a
+given image, using an inverted index of per-sector fingerprints, so a 
+query only looks at images that have at least one sector in common.
+"""
+import hashlib
+
+__all__ = ['DiskDiff', 'diff_disks', 'fingerprint', 'SimilarityIndex']
+
+
+def _file_hashes(d):
+    """Return a list of (entry, content hash) for the live entries of `d`.
+    Files that can't be read get a hash of None."""
+    result = list()
+    for i, e in enumerate(d.entries):
+        try:
+            h = hashlib.sha1(d.file(i)).hexdigest()
+        except Exception:
+            h = None
+        result.append((e, h))
+    return result
+
+
+class DiskDiff(object):
+    """The differences between two disks, `a` and `b`.
+    
+    `changed_sectors` lists the (track, sector) locations whose bytes
+    differ; it is None if the disks have different geometries.
+    
+    The file-level lists hold names (or pairs of names):
+      `identical`: same name and same contents.
+      `moved`: same name and contents, stored at a different track/sector.
+      `changed`: same name, different contents.
+      `renamed`: (old name, new name) pairs with the same contents.
+      `added`, `removed`: everything else.
+    """
+    
+    def __init__(self):
+        self.changed_sectors = list()
+        self.identical = list()
+        self.moved = list()
+        self.changed = list()
+        self.renamed = list()
+        self.added = list()
+        self.removed = list()
+        
+    @property
+    def same(self):
+        "Are the disks the same? Disks of different geometries never are."
+        return self.changed_sectors is not None and not (
+            self.changed_sectors or self.moved or self.changed or
+            self.renamed or self.added or self.removed)
+        
+    def __str__(self):
+        s = list()
+        if self.changed_sectors is None:
+            s.append("Disk geometries differ; sectors not compared.")
+        else:
+            s.append("%d changed sectors." % (len(self.changed_sectors),))
+            
+        for label, names in (
+                ('Identical', self.identical), ('Moved', self.moved),
+                ('Changed', self.changed), ('Added', self.added),
+                ('Removed', self.removed)):
+            for name in names:
+                s.append('%-10s "%s"' % (label + ':', name))
+                
+        for old, new in self.renamed:
+            s.append('%-10s "%s" -> "%s"' % ('Renamed:', old, new))
+            
+        return '\n'.join(s)
+
+
+def diff_disks(a, b):
+    """Return a `DiskDiff` describing how DosDisk `b` differs from `a`."""
+    result = DiskDiff()
+    
+    desc = a.disk._desc
+    if desc.sectors_per_track == b.disk._desc.sectors_per_track:
+        size = desc.total_sectors * 256
+        if a.disk.bytes[:size] != b.disk.bytes[:size]:
+            result.changed_sectors = [location 
+                for location in desc.locations
+                if str(a.disk.get_sector(*location)) != 
+                    str(b.disk.get_sector(*location))]
+    else:
+        result.changed_sectors = None
+    
+    a_files = _file_hashes(a)
+    b_files = _file_hashes(b)
+    b_by_name = dict()
+    for e, h in b_files:
+        b_by_name.setdefault(e.name, []).append((e, h))
+        
+    # Entries of `b` are matched by id, since names need not be unique.
+    matched = set()
+    unmatched_a = list()
+    for e, h in a_files:
+        candidates = b_by_name.get(e.name)
+        if not candidates:
+            unmatched_a.append((e, h))
+            continue
+            
+        other, other_hash = candidates.pop(0)
+        matched.add(id(other))
+        if h != other_hash or h is None:
+            result.changed.append(e.name)
+        elif (e.track, e.sector) != (other.track, other.sector):
+            result.moved.append(e.name)
+        else:
+            result.identical.append(e.name)
+            
+    by_hash = dict()
+    for e, h in b_files:
+        if id(e) not in matched and h is not None:
+            by_hash.setdefault(h, []).append(e)
+        
+    for e, h in unmatched_a:
+        if by_hash.get(h):
+            other = by_hash[h].pop(0)
+            matched.add(id(other))
+            result.renamed.append((e.name, other.name))
+        else:
+            result.removed.append(e.name)
+            
+    result.added = [e.name for e, h in b_files if id(e) not in matched]
+    return result
+
+
+def _is_blank(sector):
+    "Sectors filled with a single byte value are too common to compare on."
+    return sector[2:].count(sector[2]) == len(sector) - 2
+
+def fingerprint(d):
+    """Return the set of sector hashes for the non-blank sectors of
+    the DosDisk `d`."""
+    result = set()
+    for location in d.disk._desc.locations:
+        sector = str(d.disk.get_sector(*location))
+        if not _is_blank(sector):
+            result.add(hashlib.md5(sector).digest()[:8])
+    return result
+
+
+class SimilarityIndex(object):
+    """An inverted index from sector fingerprints to image keys."""
+    
+    def __init__(self):
+        self._postings = dict()
+        self._sizes = dict()
+        
+    def add(self, key, d):
+        "Index the DosDisk `d` under `key`."
+        self.add_fingerprint(key, fingerprint(d))
+        
+    def add_fingerprint(self, key, prints):
+        "Index a set of sector fingerprints (see `fingerprint`) under `key`."
+        self._sizes[key] = len(prints)
+        for p in prints:
+            self._postings.setdefault(p, []).append(key)
+            
+    def __len__(self):
+        return len(self._sizes)
+        
+    def query(self, d, limit=10, min_score=0.0):
+        """Return up to `limit` (key, score) pairs for the indexed images
+        most similar to the DosDisk `d`, best first.
+        
+        The score is the Jaccard similarity of the sector fingerprints:
+        1.0 means the same set of sectors.
+        """
+        return self.query_fingerprint(fingerprint(d), limit, min_score)
+        
+    def query_fingerprint(self, prints, limit=10, min_score=0.0):
+        shared = dict()
+        for p in prints:
+            for key in self._postings.get(p, ()):
+                shared[key] = shared.get(key, 0) + 1
+                
+        scores = list()
+        for key, n in shared.iteritems():
+            score = float(n) / (len(prints) + self._sizes[key] - n)
+            if score >= min_score:
+                scores.append((key, score))
+                
+        scores.sort(key=lambda x: (-x[1], x[0]))
+        return scores[:limit]
@@ -0,0 +1,230 @@
+"""Support for the CBM-DOS Block Availability Map (BAM).
+
+The BAM records, for every track, a count of free sectors and a bitmap
+with one bit per sector (a set bit means the sector is free.) Where the
+BAM lives and how its entries are laid out depends on the disk geometry;
+see `BAM_LAYOUT` on the `DiskDescription` subclasses. Each layout entry is
+
+    (BAM sector, offset of first entry, first track, last track, 
+        entry size, count table)
+
+where `count table` is None if each entry starts with its track's free
+count, or else the (BAM sector, offset) of a separate table of one-byte
+counts, in which case the entries hold only the bitmaps.
+"""
+import re
+
+__all__ = ['BlockAvailabilityMap', 'DiskFullError']
+
+class DiskFullError(Exception): pass
+
+_RE_FREE_RUN = re.compile('1+')
+
+
+class BlockAvailabilityMap(object):
+    """Represents the BAM of a disk image.
+    
+    The free bitmaps of all tracks are packed into one integer, indexed by
+    linear block number (see `DiskDescription.block_number`), so that
+    whole-disk queries need only a single pass over the bits.
+    """
+    
+    def __init__(self, disk):
+        """Read the BAM from the given DiskImage."""
+        self._desc = desc = disk._desc
+        
+        # free_counts[t] is the free sector count stored for track t.
+        self.free_counts = [0] * (desc.tracks + 1)
+        
+        bits = 0
+        for location, offset, first, last, entry_size, counts in desc.BAM_LAYOUT:
+            sector = disk.get_sector(*location)
+            count_sector, count_offset, count_size, bitmap_offset, bitmap_size =\
+                self._entry_layout(sector, offset, entry_size, counts, 
+                    disk.get_sector)
+                
+            for track in range(first, last + 1):
+                i = track - first
+                self.free_counts[track] = ord(count_sector[count_offset + i * count_size])
+                
+                # The bitmap bytes are little-endian, sector 0 in bit 0.
+                ofs = bitmap_offset + i * entry_size
+                raw_bits = sector[ofs:ofs + bitmap_size][::-1]
+                track_bits = int(raw_bits.encode('hex'), 16)
+                mask = (1 << desc.sectors_per_track[track]) - 1
+                bits |= (track_bits & mask) << desc.track_offsets[track]
+                
+        self.free_bits = bits
+        
+    @staticmethod
+    def _entry_layout(sector, offset, entry_size, counts, get_sector):
+        """Return (count sector, count offset, count stride, bitmap offset,
+        bitmap size) for one `BAM_LAYOUT` entry."""
+        if counts is None:
+            # Each entry is a count byte followed by the bitmap.
+            return sector, offset, entry_size, offset + 1, entry_size - 1
+            
+        # The counts are in a separate table, one byte per track.
+        return get_sector(*counts[0]), counts[1], 1, offset, entry_size
+        
+    @classmethod
+    def blank(cls, description):
+        "Return a BAM for a freshly formatted disk of the given geometry."
+        bam = cls.__new__(cls)
+        bam._desc = description
+        bam.free_counts = list(description.sectors_per_track)
+        bam.free_bits = (1 << description.total_sectors) - 1
+        
+        for location in description.SYSTEM_SECTORS:
+            bam.allocate(*location)
+        return bam
+        
+    def write(self, disk):
+        "Write this BAM's counts and bitmaps back to the given DiskImage."
+        desc = self._desc
+        sectors = dict()
+        def sector(location):
+            if location not in sectors:
+                sectors[location] = bytearray(disk.get_sector(*location))
+            return sectors[location]
+            
+        for location, offset, first, last, entry_size, counts in desc.BAM_LAYOUT:
+            bitmap_sector = sector(location)
+            count_sector, count_offset, count_size, bitmap_offset, bitmap_size =\
+                self._entry_layout(bitmap_sector, offset, entry_size, counts, 
+                    lambda *location: sector(location))
+                
+            for track in range(first, last + 1):
+                i = track - first
+                count_sector[count_offset + i * count_size] = self.free_counts[track]
+                
+                mask = (1 << desc.sectors_per_track[track]) - 1
+                track_bits = (self.free_bits >> desc.track_offsets[track]) & mask
+                ofs = bitmap_offset + i * entry_size
+                for j in range(bitmap_size):
+                    bitmap_sector[ofs + j] = track_bits & 0xFF
+                    track_bits >>= 8
+                    
+        for (t, s), bytes in sectors.iteritems():
+            disk.write_sector(t, s, str(bytes))
+        
+    def is_free(self, track, sector):
+        block = self._desc.block_number(track, sector)
+        return (self.free_bits >> block) & 1 == 1
+        
+    def is_allocated(self, track, sector):
+        return not self.is_free(track, sector)
+        
+    def allocate(self, track, sector):
+        "Mark the given sector as in use."
+        block = self._desc.block_number(track, sector)
+        if (self.free_bits >> block) & 1:
+            self.free_bits &= ~(1 << block)
+            self.free_counts[track] -= 1
+            
+    def free(self, track, sector):
+        "Mark the given sector as free."
+        block = self._desc.block_number(track, sector)
+        if not (self.free_bits >> block) & 1:
+            self.free_bits |= 1 << block
+            self.free_counts[track] += 1
+            
+    def _track_order(self):
+        # Data tracks in order of distance from the directory track, 
+        # alternating below and above it, as CBM-DOS allocates them.
+        directory_track = self._desc.DIRECTORY_HEADER[0]
+        order = list()
+        for distance in range(1, self._desc.tracks):
+            for track in (directory_track - distance, directory_track + distance):
+                if 1 <= track <= self._desc.tracks:
+                    order.append(track)
+        return order
+        
+    def free_on_track_from(self, track, start):
+        """Return the first free sector on `track` at or after `start`,
+        wrapping around the track, or None if the track is full."""
+        n = self._desc.sectors_per_track[track]
+        track_bits = (self.free_bits >> self._desc.track_offsets[track]) & ((1 << n) - 1)
+        if not track_bits:
+            return None
+            
+        for i in range(n):
+            sector = (start + i) % n
+            if (track_bits >> sector) & 1:
+                return sector
+                
+    def find_free(self, previous=None):
+        """Return a free (track, sector), without allocating it.
+        
+        The first block of a file goes on the track nearest to the 
+        directory. Following blocks are placed `INTERLEAVE` sectors after
+        the `previous` block, moving outwards to the next track when the
+        current one fills up.
+        """
+        order = self._track_order()
+        if previous is not None:
+            track, sector = previous
+            n = self._desc.sectors_per_track[track]
+            found = self.free_on_track_from(track, 
+                (sector + self._desc.INTERLEAVE) % n)
+            if found is not None:
+                return (track, found)
+            
+            if track in order:
+                i = order.index(track)
+                order = order[i+1:] + order[:i]
+                
+        for track in order:
+            found = self.free_on_track_from(track, 0)
+            if found is not None:
+                return (track, found)
+                
+        raise DiskFullError, "No free blocks left on disk."
+        
+    def allocate_next(self, previous=None):
+        "Find a free (track, sector) with `find_free`, and allocate it."
+        location = self.find_free(previous)
+        self.allocate(*location)
+        return location
+        
+    def free_on_track(self, track):
+        "Return the number of free sectors on `track`, counted from the bitmap."
+        mask = (1 << self._desc.sectors_per_track[track]) - 1
+        return bin((self.free_bits >> self._desc.track_offsets[track]) & mask).count('1')
+        
+    @property
+    def blocks_free(self):
+        """The "blocks free" count, as shown in a directory listing.
+        
+        Like CBM-DOS, this sums the stored free counts and leaves out
+        the directory track.
+        """
+        directory_track = self._desc.DIRECTORY_HEADER[0]
+        return sum(n for t, n in enumerate(self.free_counts) 
+            if t != directory_track)
+            
+    @property
+    def data_blocks_free(self):
+        """Number of free blocks in the bitmap that `find_free` can hand
+        out; the directory track is left out."""
+        return sum(self.free_on_track(t) for t in self._track_order())
+        
+    @property
+    def total_free(self):
+        "Number of free blocks in the bitmap, on all tracks."
+        return bin(self.free_bits).count('1')
+        
+    def _bit_string(self):
+        # One character per linear block, '1' for free; block 0 first.
+        return bin(self.free_bits)[2:].zfill(self._desc.total_sectors)[::-1]
+        
+    def allocation_map(self):
+        """Return a list of flags, indexed by linear block number,
+        that are True for allocated blocks."""
+        return [c == '0' for c in self._bit_string()]
+        
+    def free_extents(self):
+        """Return a list of (first block, length) runs of free blocks, 
+        in linear block order."""
+        return [(m.start(), m.end() - m.start()) 
+            for m in _RE_FREE_RUN.finditer(self._bit_string())]
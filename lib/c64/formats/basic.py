@@ -1,4 +1,6 @@
-"""Module for de-tokenizing C64 BASIC programs."""
+"""Module for de-tokenizing C64 and C128 BASIC programs."""
+
+import re
 
 from basic_tokens import *
 from c64.formats import *
@@ -16,10 +18,150 @@ class BasicVersion(object):
         
 VERSIONS = (
     BasicVersion(0x0801, "Basic 2", TOKEN_MAP, "Basic 2 - C64"),
-    BasicVersion(0, "Basic 7", None, "Basic 7 - C128"),
+    BasicVersion(0x1c01, "Basic 7", BASIC7_TOKEN_MAP, "Basic 7 - C128"),
+    BasicVersion(0x0801, "Simons' Basic", SIMONS_TOKEN_MAP, 
+        "Simons' Basic - C64"),
     )
 
 
+UNKNOWN_TOKEN = "{UNKNOWN}"
+
+_tables = dict()
+
+def expansion_tables(tokens):
+    """Return (plain, quoted, unknown, prefixes) tables for the token map
+    `tokens`, built once per map.
+    
+    `plain` and `quoted` give the text of each byte value outside and 
+    inside of quotes, and `unknown` is the set of bytes that aren't
+    tokens. `prefixes` maps the prefix byte of each two-byte token to a 
+    dict of the text of each second byte.
+    """
+    key = id(tokens)
+    if key not in _tables:
+        prefixes = dict()
+        for token, keyword in tokens.iteritems():
+            if token > 0xFF:
+                prefixes.setdefault(chr(token >> 8), dict())[
+                    chr(token & 0xFF)] = keyword
+                    
+        plain = [quote_petscii(c) for c in range(256)]
+        for c in range(0x80, 0x100):
+            plain[c] = tokens.get(c, UNKNOWN_TOKEN)
+        quoted = [quote_petscii(c) for c in range(256)]
+        unknown = frozenset(chr(c) for c in range(0x80, 0x100) 
+            if c not in tokens and chr(c) not in prefixes)
+        _tables[key] = (tokens, plain, quoted, unknown, prefixes)
+    return _tables[key][1:]
+
+
+def _expand_prefixed(part, plain, prefixes):
+    """Expand unquoted text holding two-byte tokens. Returns (text, True
+    if an unknown token was found)."""
+    out = list()
+    unknown_opcode = False
+    i = 0
+    while i < len(part):
+        c = part[i]
+        if c in prefixes:
+            keyword = prefixes[c].get(part[i+1:i+2])
+            if keyword is not None:
+                out.append(keyword)
+                i += 2
+                continue
+            if c >= '\x80':
+                # A prefix that is only ever a token.
+                out.append(UNKNOWN_TOKEN)
+                unknown_opcode = True
+                i += 2
+                continue
+        out.append(plain[ord(c)])
+        i += 1
+    return ''.join(out), unknown_opcode
+
+
+# Prefix bytes of the two-byte tokens of every version, and a pattern
+# finding each (possibly overlapping) prefix pair.
+_PREFIXES = frozenset(chr(token >> 8) for version in VERSIONS 
+    for token in version.tokens if token > 0xFF)
+_PREFIX_PAIR = re.compile('(?=([%s].))' % (
+    ''.join([re.escape(p) for p in sorted(_PREFIXES)]),), re.DOTALL)
+_LOW_BYTES = ''.join([chr(c) for c in range(0x80)])
+
+# Detection only reads the lines in this many bytes from the start of
+# the program, so that it costs the same for any length of program.
+DETECT_SIZE = 4096
+
+# When a program decodes as BASIC 2 without unknown tokens, an extension
+# is only picked if at least this many of its two-byte tokens are used;
+# a stray pair of characters that happens to match one isn't enough.
+MIN_EXTENSION_TOKENS = 3
+
+def _histogram(bytes, start):
+    """Return (counts, pairs) for the unquoted text of the lines in the
+    first `DETECT_SIZE` bytes of the program in `bytes` from `start`: 
+    the count of each byte from $80 up, and of each
+    prefix pair, keyed as in the token maps (prefix << 8 | byte.)"""
+    code = list()
+    pos = start
+    limit = min(len(bytes), start + DETECT_SIZE)
+    while pos + 4 <= limit:
+        if bytes[pos:pos+2] == '\x00\x00':
+            break
+        end = bytes.find('\x00', pos + 4, limit)
+        if end < 0:
+            end = limit
+        code.extend(str(bytes[pos+4:end]).split('"')[::2])
+        pos = end + 1
+    # Separated by zero bytes, so no pair spans two parts.
+    code = '\x00'.join(code)
+    
+    high = code.translate(None, _LOW_BYTES)
+    counts = dict((c, high.count(c)) for c in set(high))
+    pairs = dict()
+    for pair in _PREFIX_PAIR.findall(code):
+        token = (ord(pair[0]) << 8) | ord(pair[1])
+        pairs[token] = pairs.get(token, 0) + 1
+    return counts, pairs
+
+
+def detect_version(bytes, start, load_address):
+    """Guess the `BasicVersion` of the program in `bytes` from `start`.
+    
+    Each version is scored, from one histogram of the unquoted text at
+    the start of the program (see `DETECT_SIZE`), by the bytes it can't
+    decode, the two-byte tokens it recognises, and whether 
+    `load_address` is its usual one. A version loaded elsewhere is only
+    picked if its two-byte tokens are used, and a program that BASIC 2
+    decodes cleanly stays BASIC 2 unless an extension's tokens are used 
+    `MIN_EXTENSION_TOKENS` times. Ties go to the earlier version in 
+    `VERSIONS`. A program at $0801 without prefix pairs is BASIC 2.
+    """
+    counts, pairs = _histogram(bytes, start)
+    if not pairs and load_address == VERSIONS[0].start_address:
+        return VERSIONS[0]
+    
+    def bad_and_known(version):
+        plain, quoted, unknown, prefixes = expansion_tables(version.tokens)
+        bad = sum(counts.get(c, 0) for c in unknown) +\
+            sum(counts.get(p, 0) for p in prefixes if p >= '\x80')
+        known = sum(pairs.get(token, 0) for token in version.tokens 
+            if token > 0xFF)
+        return bad - known, known
+        
+    basic2_clean = bad_and_known(VERSIONS[0])[0] == 0
+    
+    def score(version):
+        bad, known = bad_and_known(version)
+        at_home = load_address == version.start_address
+        if basic2_clean and version is not VERSIONS[0] and\
+                0 < known < MIN_EXTENSION_TOKENS:
+            return (-1, -bad, known, at_home)
+        return (int(at_home or known > 0), -bad, known, at_home)
+        
+    return max(VERSIONS, key=score)
+
+
 class BasicLine(object):
     """Represents a single decoded line of BASIC."""
 
@@ -34,8 +176,13 @@ class Basic(object):
     
     BASIC_RAM = 0x0801
     
-    def __init__(self, bytes, has_header=True, show_ml_bytes=True):
-        """Initialize a Basic object from the given bytes."""
+    def __init__(self, bytes, has_header=True, show_ml_bytes=True, 
+            version=None):
+        """Initialize a Basic object from the given bytes.
+        
+        `version` is one of `VERSIONS`; by default it is detected from
+        the load address and the tokens used, when it is first needed.
+        """
         self.bytes = c64.bytestream.ByteStream(bytes)
         self.show_ml_bytes = show_ml_bytes
 
@@ -46,16 +193,80 @@ class Basic(object):
         if has_header:
             self.load_address = self.bytes.word()
             
+        self._version = version
+            
         self.listing = list()
         self.errors = list()
         self.parsed = False
 
-    def verify(self):
-        if not self.parsed:
-            self.parse()
+    @property
+    def version(self):
+        "The `BasicVersion` of the program."
+        if self._version is None:
+            self._version = detect_version(
+                self.bytes.bytes, self.bytes.pos, self.load_address)
+        return self._version
         
+    def lines(self):
+        """Yield each line of the program as a `BasicLine`, as it is decoded.
+        
+        Only the bytes up to the last line asked for are read, so a caller
+        can stop early. Once every line has been read, `ml_bytes` holds any
+        bytes after the end of the program, or None.
+        """
+        plain, quoted, unknown, prefixes = expansion_tables(self.version.tokens)
+        stream = c64.bytestream.ByteStream(self.bytes.bytes)
+        stream.reset(self.bytes.pos)
+        data = stream.bytes
+        
+        while not stream.eof():
+            stream.mark()
+            
+            link = stream.word()
+            if link == 0:
+                break
+            
+            line_number = stream.word()
+            
+            # Find the end of this basic line in one go; if there's no
+            # terminator, either the file is corrupt or it isn't a BASIC 
+            # program, and the line runs to the end.
+            start = stream.pos
+            end = data.find('\x00', start)
+            if end < 0:
+                end = len(data)
+            stream.reset(min(end + 1, len(data)))
+            
+            # Quote characters toggle quote mode, so the odd parts of the
+            # line between quotes are quoted text; the even parts hold
+            # tokens.
+            parts = str(data[start:end]).split('"')
+            unknown_opcode = False
+            for i, part in enumerate(parts):
+                if i % 2:
+                    table = quoted
+                else:
+                    table = plain
+                    unknown_opcode = unknown_opcode or\
+                        not unknown.isdisjoint(part)
+                    if [c for c in prefixes if c in part]:
+                        parts[i], bad = _expand_prefixed(part, plain, prefixes)
+                        unknown_opcode = unknown_opcode or bad
+                        continue
+                parts[i] = ''.join([table[c] for c in bytearray(part)])
+                    
+            text = '%d %s' % (line_number, '"'.join(parts))
+            yield BasicLine(stream.since_mark(), line_number, text, unknown_opcode)
+            
+        self.ml_bytes = None
+        if not stream.eof():
+            self.ml_bytes = stream.rest()
+            
+    def verify(self):
+        """Check that lines are in order and not too long, stopping at the
+        first bad line; the problem is added to `errors`."""
         line = -1
-        for l in self.listing:
+        for l in self.lines():
             if l.byte_count > 255:
                 self.errors.append("Program line %d too long." % (l.line_number,))
                 return False
@@ -69,6 +280,13 @@ class Basic(object):
             line = l.line_number
             
         return True
+        
+    def find_line(self, line_number):
+        "Return the first `BasicLine` numbered `line_number`, or None."
+        for l in self.lines():
+            if l.line_number == line_number:
+                return l
+        return None
 
     def list(self):
         if not self.parsed:
@@ -76,55 +294,30 @@ class Basic(object):
             
         return self.report
         
-    def parse(self):
-        prg = list()
-        
-        while not self.bytes.eof():
-            self.bytes.mark()
+    def _report(self, listing=None):
+        """Yield the lines of the listing text, adding each `BasicLine` to
+        `listing` if given."""
+        for l in self.lines():
+            if listing is not None:
+                listing.append(l)
+            yield l.line
             
-            link = self.bytes.word()
-            if link == 0:
-                break
-            
-            line_number = self.bytes.word()
-            
-            line = [str(line_number), ' ']
-            quote_mode = False
-            unknown_opcode = False
-
-            # Parse this basic line; stop if we hit eof(), which means 
-            # either the file is corrupt or it isn't a BASIC program.
-            while not self.bytes.eof():
-                c = self.bytes.byte()
-                if c == 0:
-                    break
-                    
-                if c == 34:
-                    # quote characters toggle quote_mode
-                    quote_mode = not quote_mode
-                    line.append(chr(c))
-                elif not quote_mode and 0x80 <= c:
-                    # Parse an opcode token; they have the high bit set
-                    opcode = TOKEN_MAP.get(c, "{UNKNOWN}")
-                    unknown_opcode = unknown_opcode or opcode == '{UNKNOWN}'
-                    line.append(opcode)
-                else:
-                    # Convert a "PETSCII" to host ASCII
-                    line.append(quote_petscii(c))
-                    
-            text = ''.join(line)
-            prg.append(text)
-
-            self.listing.append(
-                BasicLine(self.bytes.since_mark(), line_number, text, unknown_opcode))
-        
-        if not self.bytes.eof():
-            self.ml_bytes = self.bytes.rest()
+        if self.ml_bytes is not None:
             n = len(self.ml_bytes)
             s = 's' if n != 1 else ''
-            prg.append('\n%d more byte%s beyond end of BASIC program:' % (n, s))
+            yield '\n%d more byte%s beyond end of BASIC program:' % (n, s)
             if self.show_ml_bytes:
-                prg.append('%s' % format_bytes(self.ml_bytes))
-            
+                yield '%s' % format_bytes(self.ml_bytes)
+                
+    def write_listing(self, f):
+        """Write the listing to the file object `f` as it is decoded, 
+        one line at a time."""
+        for i, text in enumerate(self._report()):
+            if i:
+                f.write('\n')
+            f.write(text)
+        
+    def parse(self):
+        self.listing = list()
+        self.report = '\n'.join(self._report(self.listing))
         self.parsed = True
-        self.report = '\n'.join(prg)
@@ -0,0 +1,170 @@
+"""Module for tokenizing C64 BASIC listings back into programs.
+
+Listings are read in the form `Basic.list()` writes them: keywords are
+lower case, other PETSCII characters in the printable range are written
+as themselves, and the rest are written as control names from
+`petscii.CONTROL_MAP` (such as `{clr}`) or as `{$xx}`. Letters typed in
+lower case that don't start a keyword are read as the plain letter.
+
+Other dialects are tokenized with their own token map, such as
+`BASIC7_TOKEN_MAP`; two-byte tokens are written as their prefix byte
+followed by the token byte.
+"""
+
+import re
+
+from basic_tokens import TOKEN_MAP
+from c64.formats.petscii import CONTROL_MAP
+
+__all__ = ['Tokenizer', 'TokenizeError', 'tokenize']
+
+class TokenizeError(Exception): pass
+
+# Marks the end of a keyword in the trie; the value is the token's bytes.
+_END = None
+
+# Keywords for which CBM BASIC stops tokenizing: the rest of the line
+# after REM, and up to the next statement after DATA.
+_REM = '\x8f'
+_DATA = '\x83'
+
+_HEX_NAME = re.compile(r'\{\$([0-9a-fA-F]{2})\}$')
+_LINE_NUMBER = re.compile(r'\s*(\d+) ?')
+
+_CONTROL_CODES = dict((name, chr(c)) for c, name in CONTROL_MAP.iteritems())
+
+
+class Tokenizer(object):
+    """Tokenizes listing text using the keywords of a token map.
+
+    The keywords are kept in a trie, so the longest keyword at each
+    position is found in one walk over the text, rather than by trying
+    every keyword in turn.
+    """
+
+    def __init__(self, tokens=TOKEN_MAP):
+        self.trie = dict()
+        for token, keyword in tokens.iteritems():
+            node = self.trie
+            for c in keyword:
+                node = node.setdefault(c, dict())
+            if token > 0xFF:
+                node[_END] = chr(token >> 8) + chr(token & 0xFF)
+            else:
+                node[_END] = chr(token)
+
+    def _match(self, text, i, alphabetic_only=False):
+        """Return (token bytes, length) of the longest keyword at
+        `text[i:]`, or (None, 0). With `alphabetic_only`, only keywords starting with
+        a letter are matched."""
+        if alphabetic_only and not text[i].isalpha():
+            return None, 0
+
+        node = self.trie
+        found = (None, 0)
+        j = i
+        while j < len(text) and text[j] in node:
+            node = node[text[j]]
+            j += 1
+            if _END in node:
+                found = (node[_END], j - i)
+        return found
+
+    def _escape(self, text, i):
+        "Return (byte, length) of the `{name}` escape at `text[i:]`."
+        end = text.find('}', i)
+        if end < 0:
+            raise TokenizeError, "Unterminated {name} at column %d." % (i,)
+        name = text[i:end+1]
+        if name in _CONTROL_CODES:
+            return _CONTROL_CODES[name], len(name)
+        m = _HEX_NAME.match(name)
+        if m:
+            return chr(int(m.group(1), 16)), len(name)
+        raise TokenizeError, "Unknown character name %s." % (name,)
+
+    def line(self, text):
+        """Tokenize one listing line. Returns (line number, bytes), where
+        the bytes are the line's contents, without link, line number or
+        terminator."""
+        m = _LINE_NUMBER.match(text)
+        if not m:
+            raise TokenizeError, "Line has no line number: %r" % (text,)
+        line_number = int(m.group(1))
+        if line_number > 0xFFFF:
+            raise TokenizeError, "Line number %d out of range." % (line_number,)
+
+        out = list()
+        quote_mode = False
+        # Literal mode is set after REM and DATA, where symbols such as
+        # + and - are kept as characters, not tokens.
+        literal = None
+        i = m.end()
+        while i < len(text):
+            c = text[i]
+            if c == '"':
+                quote_mode = not quote_mode
+                out.append(c)
+                i += 1
+                continue
+
+            if c == '{':
+                byte, n = self._escape(text, i)
+                out.append(byte)
+                i += n
+                continue
+
+            if not quote_mode:
+                if c == ':' and literal == _DATA:
+                    literal = None
+                token, n = self._match(text, i, literal is not None)
+                if token is not None:
+                    out.append(token)
+                    if token in (_REM, _DATA) and literal != _REM:
+                        literal = token
+                    i += n
+                    continue
+
+            if 'a' <= c <= 'z':
+                c = c.upper()
+            elif not ' ' <= c <= '_':
+                raise TokenizeError, "Can't tokenize %r in line %d." % (
+                    c, line_number)
+            out.append(c)
+            i += 1
+
+        return line_number, ''.join(out)
+
+    def program(self, lines, load_address=0x0801):
+        """Return the bytes of a program (with its load address) holding
+        the listing `lines`, an iterable of strings. Blank lines are
+        skipped. The link pointers are set for `load_address`."""
+        out = [chr(load_address & 0xFF), chr(load_address >> 8)]
+        address = load_address
+        for text in lines:
+            if not text.strip():
+                continue
+            line_number, bytes = self.line(text)
+
+            # Link to the next line: this line's link, number, bytes
+            # and terminator.
+            address += 5 + len(bytes)
+            out.extend([chr(address & 0xFF), chr(address >> 8),
+                chr(line_number & 0xFF), chr(line_number >> 8),
+                bytes, '\x00'])
+
+        out.append('\x00\x00')
+        return ''.join(out)
+
+
+# Tokenizers by the id of their token map, with the map itself kept
+# alive so that its id isn't reused.
+_tokenizers = dict()
+
+def tokenize(text, load_address=0x0801, tokens=TOKEN_MAP):
+    """Return the bytes of a BASIC program from its listing text, using
+    the token map `tokens` (C64 BASIC 2 by default.)"""
+    key = id(tokens)
+    if key not in _tokenizers:
+        _tokenizers[key] = (tokens, Tokenizer(tokens))
+    return _tokenizers[key][1].program(text.splitlines(), load_address)
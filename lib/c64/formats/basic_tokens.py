@@ -1,10 +1,16 @@
-"This module contains a mapping for CBM Basic 2.0 tokens."
-__all__ = ['TOKEN_MAP']
+"""This module contains mappings for CBM Basic 2.0 tokens, and for the
+tokens of Basic 7.0 (C128) and Simons' Basic.
+
+Two-byte tokens are keyed by the prefix byte and the token byte together,
+e.g. $CE02 for Basic 7.0's POT.
+"""
+__all__ = ['TOKEN_MAP', 'BASIC7_TOKEN_MAP', 'SIMONS_TOKEN_MAP']
 
 # http://www.viceteam.org/plain/cbm_basic_tokens.txt
 
 def split_words(d):
-    return [x.split() for x in d.splitlines()]
+    # Some extension keywords contain a space.
+    return [x.split(None, 1) for x in d.splitlines()]
 
 TOKENS = """
 80	end
@@ -87,3 +93,228 @@ ff	pi
 """.strip()
 
 TOKEN_MAP = dict( (int(x[0],16), x[1]) for x in split_words(TOKENS) )
+
+# Basic 7.0 adds single-byte tokens after Basic 2.0's, and two sets of
+# two-byte tokens, behind the prefixes $CE and $FE.
+BASIC7_TOKENS = """
+cc	rgr
+cd	rclr
+cf	joy
+d0	rdot
+d1	dec
+d2	hex$
+d3	err$
+d4	instr
+d5	else
+d6	resume
+d7	trap
+d8	tron
+d9	troff
+da	sound
+db	vol
+dc	auto
+dd	pudef
+de	graphic
+df	paint
+e0	char
+e1	box
+e2	circle
+e3	gshape
+e4	sshape
+e5	draw
+e6	locate
+e7	color
+e8	scnclr
+e9	scale
+ea	help
+eb	do
+ec	loop
+ed	exit
+ee	directory
+ef	dsave
+f0	dload
+f1	header
+f2	scratch
+f3	collect
+f4	copy
+f5	rename
+f6	backup
+f7	delete
+f8	renumber
+f9	key
+fa	monitor
+fb	using
+fc	until
+fd	while
+ce02	pot
+ce03	bump
+ce04	pen
+ce05	rsppos
+ce06	rsprite
+ce07	rspcolor
+ce08	xor
+ce09	rwindow
+ce0a	pointer
+fe02	bank
+fe03	filter
+fe04	play
+fe05	tempo
+fe06	movspr
+fe07	sprite
+fe08	sprcolor
+fe09	rreg
+fe0a	envelope
+fe0b	sleep
+fe0c	catalog
+fe0d	dopen
+fe0e	append
+fe0f	dclose
+fe10	bsave
+fe11	bload
+fe12	record
+fe13	concat
+fe14	dverify
+fe15	dclear
+fe16	sprsav
+fe17	collision
+fe18	begin
+fe19	bend
+fe1a	window
+fe1b	boot
+fe1c	width
+fe1d	sprdef
+fe1e	quit
+fe1f	stash
+fe21	fetch
+fe23	swap
+fe24	off
+fe25	fast
+fe26	slow
+""".strip()
+
+BASIC7_TOKEN_MAP = dict(TOKEN_MAP)
+BASIC7_TOKEN_MAP.update( (int(x[0],16), x[1]) for x in split_words(BASIC7_TOKENS) )
+
+# Simons' Basic keeps Basic 2.0's tokens, and adds two-byte tokens behind
+# the prefix $64. Tokens marked ">>" in the reference are unused.
+SIMONS_TOKENS = """
+6401	hires
+6402	plot
+6403	line
+6404	block
+6405	fchr
+6406	fcol
+6407	fill
+6408	rec
+6409	rot
+640a	draw
+640b	char
+640c	hi col
+640d	inv
+640e	frac
+640f	move
+6410	place
+6411	upb
+6412	upw
+6413	leftw
+6414	leftb
+6415	downb
+6416	downw
+6417	rightb
+6418	rightw
+6419	multi
+641a	colour
+641b	mmob
+641c	bflash
+641d	mob set
+641e	music
+641f	flash
+6420	repeat
+6421	play
+6423	centre
+6424	envelope
+6425	cgoto
+6426	wave
+6427	fetch
+6428	at(
+6429	until
+642c	use
+642e	global
+6430	reset
+6431	proc
+6432	call
+6433	exec
+6434	end proc
+6435	exit
+6436	end loop
+6437	on key
+6438	disable
+6439	resume
+643a	loop
+643b	delay
+6440	secure
+6441	disapa
+6442	circle
+6443	on error
+6444	no error
+6445	local
+6446	rcomp
+6447	else
+6448	retrace
+6449	trace
+644a	dir
+644b	page
+644c	dump
+644d	find
+644e	option
+644f	auto
+6450	old
+6451	joy
+6452	mod
+6453	div
+6455	dup
+6456	inkey
+6457	inst
+6458	test
+6459	lin
+645a	exor
+645b	insert
+645c	pot
+645d	penx
+645f	peny
+6460	sound
+6461	graphics
+6462	design
+6463	rlocmob
+6464	cmob
+6465	bckgnds
+6466	pause
+6467	nrm
+6468	mob off
+6469	off
+646a	angl
+646b	arc
+646c	cold
+646d	scrsv
+646e	scrld
+646f	text
+6470	cset
+6471	vol
+6472	disk
+6473	hrdcpy
+6474	key
+6475	paint
+6476	low col
+6477	copy
+6478	merge
+6479	renumber
+647a	mem
+647b	detect
+647c	check
+647d	display
+647e	err
+647f	out
+""".strip()
+
+SIMONS_TOKEN_MAP = dict(TOKEN_MAP)
+SIMONS_TOKEN_MAP.update( (int(x[0],16), x[1]) for x in split_words(SIMONS_TOKENS) )
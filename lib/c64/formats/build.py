@@ -0,0 +1,99 @@
+"""This module builds whole CBM-DOS disk images in a single pass.
+
+Writing files one at a time through `DosDisk.write_file` updates the
+directory once per file. A `DiskBuilder` instead collects all of the
+files first, plans every block allocation up front, and then writes each
+file chain, the directory and the BAM exactly once.
+"""
+from c64.formats.bam import BlockAvailabilityMap, DiskFullError
+from c64.formats.cbmdos import (DiskImage, pack_entry, 
+    BYTES_PER_SECTOR, DATA_BYTES_PER_SECTOR)
+
+__all__ = ['DiskBuilder', 'build_image']
+
+ENTRIES_PER_SECTOR = 8
+
+
+class DiskBuilder(object):
+    """Lay out a new disk image from a list of files.
+    
+    `description` is the `DiskDescription` of the disk geometry to build;
+    `disk_name` and `disk_id` are PETSCII strings for the header.
+    """
+    
+    def __init__(self, description, disk_name='', disk_id=''):
+        self._desc = description
+        self.disk_name = disk_name
+        self.disk_id = disk_id
+        self.files = list()
+        
+    def add(self, name, bytes, filetype=2):
+        "Add a file to the disk; `filetype` is a `FILE_TYPES` key."
+        self.files.append((name, filetype, bytes))
+        
+    def _plan(self, bam):
+        """Allocate the directory sectors and every file chain.
+        
+        Returns the list of directory sector locations, and a list of 
+        block locations for each file.
+        """
+        desc = self._desc
+        directory = [desc.DIRECTORY_ENTRIES]
+        needed = max(1, -(-len(self.files) // ENTRIES_PER_SECTOR))
+        while len(directory) < needed:
+            t, s = directory[-1]
+            s = bam.free_on_track_from(t, 
+                (s + desc.DIRECTORY_INTERLEAVE) % desc.sectors_per_track[t])
+            if s is None:
+                raise DiskFullError, "Too many files for the directory."
+            bam.allocate(t, s)
+            directory.append((t, s))
+            
+        chains = list()
+        for name, filetype, bytes in self.files:
+            count = max(1, -(-len(bytes) // DATA_BYTES_PER_SECTOR))
+            locations = list()
+            previous = None
+            for i in range(count):
+                previous = bam.allocate_next(previous)
+                locations.append(previous)
+            chains.append(locations)
+            
+        return directory, chains
+        
+    def build(self):
+        "Return the bytes of the finished disk image, as a string."
+        desc = self._desc
+        disk = DiskImage(desc, bytearray(desc.total_sectors * BYTES_PER_SECTOR))
+        for (t, s), bytes in desc.header_sectors(self.disk_name, self.disk_id):
+            disk.write_sector(t, s, bytes)
+            
+        bam = BlockAvailabilityMap.blank(desc)
+        directory, chains = self._plan(bam)
+        
+        entries = list()
+        for (name, filetype, bytes), locations in zip(self.files, chains):
+            disk.write_chain(locations, bytes)
+            entries.append(pack_entry(name, filetype, locations[0], len(locations)))
+            
+        for i, (t, s) in enumerate(directory):
+            if i + 1 < len(directory):
+                link = chr(directory[i+1][0]) + chr(directory[i+1][1])
+            else:
+                link = '\x00\xff'
+                
+            sector_entries = entries[i*ENTRIES_PER_SECTOR:(i+1)*ENTRIES_PER_SECTOR]
+            disk.write_sector(t, s, link + 
+                '\x00\x00'.join(sector_entries))
+        
+        bam.write(disk)
+        return str(disk.bytes)
+
+
+def build_image(description, files, disk_name='', disk_id=''):
+    """Return the bytes of a new disk image of the geometry `description`
+    holding `files`, a list of (name, filetype, bytes) tuples."""
+    builder = DiskBuilder(description, disk_name, disk_id)
+    for name, filetype, bytes in files:
+        builder.add(name, bytes, filetype)
+    return builder.build()
@@ -1,19 +1,28 @@
 """This is a support module for all CBM-DOS formats."""
 from __future__ import with_statement
 
+import copy
 import itertools
+import mmap
 import struct
 
-from c64 import struct_doc, blocks
+from c64 import struct_doc, blocks, map_file
 from c64.bytestream import ByteStream
+from c64.formats.bam import BlockAvailabilityMap, DiskFullError
+from c64.formats.geos import GeosInfo, VlirFile
+from c64.formats.names import NameIndex, name_matches
 
 __all__ = [
-    'FILE_TYPES', 'GEOS_FILE_TYPES'
+    'FILE_TYPES', 'GEOS_FILE_TYPES',
     'DirectorySector', 'BootSector',
-    'DiskImage', 'DosDisk', 'DiskDescription',
-    'CircularFileError', 'FileNotFoundError', 'FormatError', 'IllegalSectorError'
+    'ChainReader', 'RelativeFile', 'DiskImage', 'DosDisk', 'DiskDescription',
+    'pack_entry', 'description_for_size', 'disk_loader',
+    'BadSectorError', 'CircularFileError', 'FileNotFoundError', 'FormatError', 
+    'IllegalSectorError', 'SECTOR_ERRORS',
+    'DiskFullError'
     ]
 
+class BadSectorError(Exception): pass
 class CircularFileError(Exception): pass
 class FileNotFoundError(Exception): pass
 class FormatError(Exception): pass
@@ -46,57 +55,105 @@ GEOS_FILE_TYPES = {
     0x0E: "Auto-Execute File",
 }
 
-"""
-  Byte: $00-01: Contains $00/$FF since its only 1 sector long
-         02-04: Information sector ID bytes (03 15 BF). The "03" is  likely
-                the bitmap width, and the "15" is likely the bitmap height,
-                but rare exceptions do exist to this!
-         05-43: Icon bitmap (sprite format, 63 bytes)
-            44: C64 filetype (same as that from the directory entry)
-            45: GEOS filetype (same as that from the directory entry)
-            46: GEOS file structure (same as that from the dir entry)
-         47-48: Program load address
-         49-4A: Program end address (only with accessories)
-         4B-4C: Program start address
-         4D-60: Class text (terminated with a $00)
-         61-74: Author (with application data: name  of  application  disk,
-                terminated with a $00. This string may not  necessarily  be
-                set, or it may contain invalid data)
-                The following GEOS files have authors:
-                  1 - BASIC
-                  2 - Assembler
-                  5 - Desk Accessory
-                  6 - Application
-                  9 - Printer Driver
-                 10 - Input Driver
-         75-88: If a document, the name of the application that created it.
-         89-9F: Available for applications, unreserved.
-         A0-FF: Description (terminated with a $00)
-"""
-
-_STRUCT_GEOS_INFO_BLOCK = struct_doc('''
-<       # Little-endian
-xx      # $00,$FF (no next sector, all bytes in this sector are valid data.)
-xxx     # ID bytes ($03 $15 $BF)
-63b     # Icon bitmap in sprite format
-b       # C64 filetype (same as in directory entry)
-b       # GEOS filtetype (same as in directory entry)
-b       # GEOS file structure (same as in directory entry)
-H       # Program load address
-H       # Program end address (for accessories)
-H       # Program start address
-20s     # Class text
-20s     # Author
-20s     # Document Application
-20b     # Application specific
-96s     # Description
-''')
+# Error bytes, as stored after the sectors of some images, mapped to 
+# the CBM-DOS error number and message that reading the sector would give.
+# Codes 0 and 1 both mean the sector is good.
+SECTOR_ERRORS = {
+    0x00: (0, "OK"),
+    0x01: (0, "OK"),
+    0x02: (20, "READ ERROR (header block not found)"),
+    0x03: (21, "READ ERROR (no sync character)"),
+    0x04: (22, "READ ERROR (data block not present)"),
+    0x05: (23, "READ ERROR (checksum error in data block)"),
+    0x06: (24, "READ ERROR (byte decoding error)"),
+    0x07: (25, "WRITE ERROR (write-verify error)"),
+    0x08: (26, "WRITE PROTECT ON"),
+    0x09: (27, "READ ERROR (checksum error in header)"),
+    0x0A: (28, "WRITE ERROR (long data block)"),
+    0x0B: (29, "DISK ID MISMATCH"),
+    0x0F: (74, "DRIVE NOT READY"),
+}
 
 BYTES_PER_SECTOR = 256
 
+# Data bytes in each sector of a linked file chain; the first two bytes
+# of each sector link to the next one.
+DATA_BYTES_PER_SECTOR = BYTES_PER_SECTOR - 2
+
 class DiskDescription(object):
+    """Describe a disk geometry.
+    
+    Subclasses provide `_SECTOR_COUNTS`; the per-track sector counts,
+    the cumulative track offsets and the linear block number mapping
+    are all computed once here, so that sector addressing is a table
+    lookup rather than a sum over the preceding tracks.
+    
+    Subclasses also give the `BAM_LAYOUT`, a tuple of (BAM sector, offset
+    of first entry, first track, last track, entry size, count table) 
+    entries; see c64.formats.bam.
+    """
     def __init__(self):
         self.sectors_per_track = _make_sector_table(self._SECTOR_COUNTS)
+        
+        # track_offsets[t] is the linear block number of sector 0 on track t.
+        self.track_offsets = _make_offset_table(self.sectors_per_track)
+        self.total_sectors = self.track_offsets[-1]
+        self.tracks = len(self.sectors_per_track) - 1
+        self.image_size = self.total_sectors * BYTES_PER_SECTOR
+        
+        # Images may carry one trailing error byte per sector.
+        self.error_image_size = self.image_size + self.total_sectors
+        
+        # locations[n] is the (track, sector) pair of linear block n.
+        self.locations = [(t, s) 
+            for t in range(1, self.tracks + 1)
+            for s in range(self.sectors_per_track[t])]
+        
+    def block_number(self, track, sector):
+        "Return the linear block number of the given track/sector."
+        return self.track_offsets[track] + sector
+        
+    def location(self, block):
+        "Return the (track, sector) pair of the given linear block number."
+        return self.locations[block]
+
+
+def description_for_size(descriptions, size):
+    """Return the first of `descriptions` whose images (with or without 
+    error bytes) are `size` bytes long, or the first description if none
+    match."""
+    for d in descriptions:
+        if size in (d.image_size, d.error_image_size):
+            return d
+    return descriptions[0]
+
+
+def disk_loader(open_disk, description):
+    """Return a `load(filename, mapped=False, lazy=False, writable=False)`
+    function for a disk image format.
+    
+    `open_disk(bytes, lazy)` returns the `DosDisk` for an image's bytes,
+    and `description` names the format in the loader's docstring.
+    """
+    def load(filename, mapped=False, lazy=False, writable=False):
+        if mapped:
+            bytes = map_file(filename, writable)
+        else:
+            with open(filename, 'rb') as f:
+                bytes = f.read()
+            if writable:
+                bytes = bytearray(bytes)
+        return open_disk(bytes, lazy=lazy)
+        
+    load.__doc__ = """Load %s image from `filename`.
+    
+    If `mapped` is True, the image is memory-mapped rather than read
+    into memory, and sectors are returned as buffers over the map.
+    If `lazy` is True, the directory is read on demand.
+    If `writable` is True, the image can be changed; a mapped image
+    is changed in place, otherwise use `save` to write it out.
+    """ % (description,)
+    return load
 
 
 # C128 Boot Sector information:
@@ -157,6 +214,17 @@ def _make_sector_table(sector_counts):
     return [s for start, end, sectors in sector_counts 
             for s in itertools.repeat(sectors, end - start + 1)]
 
+def _make_offset_table(sectors_per_track):
+    """Return the running block totals for a sector table.
+    
+    The returned list has one more element than `sectors_per_track`;
+    the last element is the total number of blocks on the disk.
+    """
+    offsets = [0]
+    for sectors in sectors_per_track:
+        offsets.append(offsets[-1] + sectors)
+    return offsets
+
 
 _STRUCT_ENTRY = struct_doc('''
     <       # Little-endian
@@ -178,16 +246,45 @@ _STRUCT_ENTRY = struct_doc('''
     ''')
 
 
+def pack_entry(name, filetype, location, size):
+    """Return the bytes of a closed directory entry, for a file starting at
+    `location` and `size` blocks long.
+    
+    The first two bytes of the entry, which are the directory chain link
+    in the first entry of each sector, are left off.
+    """
+    return struct.pack(_STRUCT_ENTRY, 0x80 | filetype, 
+        location[0], location[1], name[:16].ljust(16, '\xa0'), 
+        0, 0, 0, 0, size)[2:]
+
+
 class DirectoryEntry(object):
-    """Represents a single CBM-DOS directory entry."""
+    """Represents a single CBM-DOS directory entry.
+    
+    The entry bytes are only unpacked the first time one of the decoded
+    fields is accessed, so scanning a directory for a single name doesn't
+    pay for decoding every entry up front.
+    """
+    
+    _FIELDS = frozenset(['typeflags', 'track', 'sector', 'raw_name', 
+        'geos_info_location', 'geos_structure', 'geos_type', 'size', 'name'])
 
     def __init__(self, bytes):
         self.bytes = bytes
         
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set yet.
+        if name not in self._FIELDS:
+            raise AttributeError, name
+        
+        self._decode()
+        return self.__dict__[name]
+        
+    def _decode(self):
         (self.typeflags, self.track, self.sector, self.raw_name, 
             info_t, info_s, self.geos_structure, self.geos_type, 
             self.size) =\
-                struct.unpack(_STRUCT_ENTRY, bytes)
+                struct.unpack(_STRUCT_ENTRY, self.bytes)
                 
         self.geos_info_location = (info_t, info_s)
             
@@ -195,13 +292,23 @@ class DirectoryEntry(object):
         # Strip these off so we can print the names.
         self.name = self.raw_name.rstrip('\xa0')
         
+    @property
+    def in_use(self):
+        "Does this entry have a non-zero size? (Checked without decoding.)"
+        return self.bytes[30:32] != '\x00\x00'
+        
     @property
     def filetype(self):
-        return self.typeflags & 0x03
+        return self.typeflags & 0x07
         
     @property
     def format(self):
-        return FILE_TYPES[self.typeflags & 0x03]
+        return FILE_TYPES.get(self.typeflags & 0x07, "???")
+        
+    @property
+    def record_length(self):
+        "Record length of a REL file (shares a byte with `geos_structure`.)"
+        return self.geos_structure
         
     @property
     def splat(self):
@@ -231,6 +338,179 @@ class DirectorySector(object):
         self.entries = [DirectoryEntry(x) for x in blocks(bytes, 32)]
 
 
+class ChainReader(object):
+    """A read-only file object over a "linked sectors" file chain.
+    
+    Sectors are only read from the disk image as the data is consumed,
+    so a file can be hashed or parsed without holding all of it at once.
+    Iterating over a reader yields the remaining data one sector-sized
+    chunk at a time.
+    """
+    
+    def __init__(self, disk, track, sector):
+        self._sectors = disk.walk_sectors(track, sector)
+        self._chunk = ''
+        self._pos = 0
+        
+    def _next_chunk(self):
+        "Load the next sector's data; returns False at the end of the chain."
+        for block, t, s in self._sectors:
+            # In the last sector, the "sector" link is the index
+            # of the last used byte.
+            byte_size = DATA_BYTES_PER_SECTOR if t > 0 else s - 1
+            self._chunk = block[2:2+byte_size]
+            self._pos = 0
+            return True
+            
+        self._chunk = ''
+        self._pos = 0
+        return False
+        
+    def read(self, n=-1):
+        "Read up to `n` bytes, or to the end of the file if `n` is negative."
+        parts = list()
+        while n != 0:
+            if self._pos >= len(self._chunk) and not self._next_chunk():
+                break
+                
+            if n < 0:
+                end = len(self._chunk)
+            else:
+                end = min(len(self._chunk), self._pos + n)
+                n -= end - self._pos
+                
+            parts.append(self._chunk[self._pos:end])
+            self._pos = end
+            
+        return ''.join(parts)
+        
+    def readinto(self, b):
+        """Read bytes into the bytearray `b`, up to its length. 
+        Returns the number of bytes read."""
+        filled = 0
+        while filled < len(b):
+            if self._pos >= len(self._chunk) and not self._next_chunk():
+                break
+                
+            end = min(len(self._chunk), self._pos + len(b) - filled)
+            b[filled:filled + end - self._pos] = self._chunk[self._pos:end]
+            filled += end - self._pos
+            self._pos = end
+            
+        return filled
+        
+    def __iter__(self):
+        if self._pos < len(self._chunk):
+            chunk = self._chunk[self._pos:]
+            self._pos = len(self._chunk)
+            yield chunk
+            
+        while self._next_chunk():
+            self._pos = len(self._chunk)
+            yield self._chunk
+        
+    def close(self):
+        self._sectors = iter(())
+        self._chunk = ''
+        self._pos = 0
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RelativeFile(object):
+    """Gives random access to the records of a REL file.
+    
+    The side sectors are read once, when the file is opened, giving the
+    location of every data block; reading a record then only reads the
+    one or two blocks holding it. 1581 REL files have a "super side 
+    sector" in front of the side sectors, which is skipped.
+    
+    Records are returned as stored, `record_length` bytes each; CBM-DOS
+    marks unused records with a leading $FF.
+    """
+    
+    # Byte 2 of a super side sector; in normal side sectors, it is the
+    # number of the side sector (0-5) within its group.
+    SUPER_SIDE_SECTOR = 0xFE
+    
+    def __init__(self, disk, entry):
+        self.disk = disk
+        self.record_length = entry.record_length
+        if not self.record_length:
+            raise FormatError, "%s has no record length." % (entry.name,)
+            
+        self.blocks = list()
+        side_sectors = disk.walk_sectors(*entry.geos_info_location)
+        for i, (block, t, s) in enumerate(side_sectors):
+            if i == 0 and ord(block[2]) == self.SUPER_SIDE_SECTOR:
+                continue
+            # In the last side sector, the "sector" link is the index
+            # of the last used byte.
+            end = BYTES_PER_SECTOR if t > 0 else s + 1
+            pointers = str(block[16:end])
+            for j in xrange(0, len(pointers) - 1, 2):
+                if pointers[j] == '\x00':
+                    break
+                self.blocks.append((ord(pointers[j]), ord(pointers[j+1])))
+                
+        # The number of bytes used in the last data block is only known
+        # from its link, so read it.
+        self.data_size = 0
+        if self.blocks:
+            last = disk.get_sector(*self.blocks[-1])
+            self.data_size = (DATA_BYTES_PER_SECTOR * (len(self.blocks) - 1) + 
+                ord(last[1]) - 1)
+                
+    def __len__(self):
+        return self.data_size // self.record_length
+        
+    def record(self, n):
+        "Return the bytes of record `n`, counting from 0."
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError, "Record %d out of range." % (n,)
+            
+        block, offset = divmod(n * self.record_length, DATA_BYTES_PER_SECTOR)
+        parts = list()
+        needed = self.record_length
+        while needed > 0:
+            data = self.disk.get_sector(*self.blocks[block])
+            part = data[2 + offset:2 + min(offset + needed, 
+                DATA_BYTES_PER_SECTOR)]
+            parts.append(part)
+            needed -= len(part)
+            block, offset = block + 1, 0
+            
+        return ''.join(parts)
+        
+    __getitem__ = record
+    
+    def records(self, start=0):
+        "Yield each record in turn from `start`, reading each block once."
+        size = self.record_length
+        count = len(self)
+        n = start
+        block, offset = divmod(n * size, DATA_BYTES_PER_SECTOR)
+        pending = ''
+        while n < count:
+            data = self.disk.get_sector(*self.blocks[block])
+            pending += str(data[2 + offset:2 + DATA_BYTES_PER_SECTOR])
+            block, offset = block + 1, 0
+            
+            whole = min(len(pending) // size, count - n)
+            for i in xrange(whole):
+                yield pending[i * size:(i + 1) * size]
+            pending = pending[whole * size:]
+            n += whole
+            
+    __iter__ = records
+
+
 class DiskImage(object):
     """Handle standard Commodore Disk Images.
     
@@ -244,7 +524,20 @@ class DiskImage(object):
     def __init__(self, description, bytes):
         self._desc = description
         self.bytes = bytes
-        self.bootsector = BootSector(self.bytes[0:BYTES_PER_SECTOR])
+        
+        # Sectors of a memory-mapped or mutable image are handed out as 
+        # zero-copy buffers, rather than as copied strings.
+        self.zero_copy = isinstance(bytes, (mmap.mmap, bytearray))
+        self.bootsector = BootSector(str(self.bytes[0:BYTES_PER_SECTOR]))
+        
+        # The error bytes, one per linear block, if the image has them.
+        self.errors = None
+        if len(bytes) == description.error_image_size:
+            self.errors = bytearray(bytes[description.image_size:])
+            
+        # If True, reading a sector flagged with an error raises
+        # BadSectorError rather than returning the sector's bytes.
+        self.check_errors = False
 
     @property
     def has_bootsector(self):
@@ -252,37 +545,139 @@ class DiskImage(object):
 
     def get_byte_offset(self, track, sector):
         "Return the byte-offset of the given sector."
-        ofs = sector + sum(self._desc.sectors_per_track[i] for i in range(1, track))
-        return ofs * BYTES_PER_SECTOR
+        return (self._desc.track_offsets[track] + sector) * BYTES_PER_SECTOR
+    
+    def view(self, description):
+        """Return a DiskImage over the same bytes, with its directory 
+        described by `description` (which must have the same geometry.)
+        Used for partitions, which have their own directory and BAM."""
+        view = copy.copy(self)
+        view._desc = description
+        return view
+        
+    def _check_location(self, track, sector):
+        if not (0 < track <= self._desc.tracks and 
+                sector < self._desc.sectors_per_track[track]):
+            raise IllegalSectorError, "Illegal track/sector: %s" % (
+                (track, sector),)
+    
+    def sector_error(self, track, sector):
+        "Return the raw error byte for the given sector (1 if none.)"
+        if self.errors is None:
+            return 1
+        return self.errors[self._desc.track_offsets[track] + sector]
+        
+    def is_bad(self, track, sector):
+        "Is the given sector flagged with a read error?"
+        return self.sector_error(track, sector) > 1
+        
+    def bad_sectors(self):
+        "Return a list of ((track, sector), error byte) for flagged sectors."
+        if self.errors is None:
+            return list()
+        return [(self._desc.location(block), code) 
+            for block, code in enumerate(self.errors) if code > 1]
+            
+    def error_summary(self):
+        "Return a dict mapping CBM-DOS error numbers to sector counts."
+        summary = dict()
+        if self.errors is not None:
+            for code in self.errors:
+                if code > 1:
+                    number = SECTOR_ERRORS.get(code, (code, None))[0]
+                    summary[number] = summary.get(number, 0) + 1
+        return summary
+        
+    def _raise_bad_sector(self, block):
+        code = self.errors[block]
+        number, message = SECTOR_ERRORS.get(code, (code, "UNKNOWN ERROR"))
+        raise BadSectorError, "%d, %s at %s" % (
+            number, message, self._desc.location(block))
     
     def get_sector(self, track, sector):
-        ofs = self.get_byte_offset(track, sector)
+        self._check_location(track, sector)
+        if self.check_errors and self.is_bad(track, sector):
+            self._raise_bad_sector(self._desc.block_number(track, sector))
+        ofs = (self._desc.track_offsets[track] + sector) * BYTES_PER_SECTOR
+        if self.zero_copy:
+            return buffer(self.bytes, ofs, BYTES_PER_SECTOR)
         return self.bytes[ofs:ofs + BYTES_PER_SECTOR]
         
     def walk_sectors(self, track, sector):
-        sectors_seen = set()
+        track_offsets = self._desc.track_offsets
+        tracks = self._desc.tracks
+        sectors_per_track = self._desc.sectors_per_track
+        blocks_seen = set()
 
         while track > 0:
-            if (track, sector) in sectors_seen:
+            if track > tracks or sector >= sectors_per_track[track]:
+                raise IllegalSectorError, "Illegal track/sector link: %s" % (
+                    (track, sector),)
+                    
+            block = track_offsets[track] + sector
+            if block in blocks_seen:
                 raise CircularFileError, "Circular file detected: %s, %s" % (
-                    (track, sector), sectors_seen)
+                    (track, sector), 
+                    set(self._desc.location(b) for b in blocks_seen))
 
-            sectors_seen.add( (track, sector) )
-            raw_bytes = self.get_sector(track, sector)
+            blocks_seen.add(block)
+            if self.check_errors and self.errors and self.errors[block] > 1:
+                self._raise_bad_sector(block)
+                
+            ofs = block * BYTES_PER_SECTOR
+            if self.zero_copy:
+                raw_bytes = buffer(self.bytes, ofs, BYTES_PER_SECTOR)
+            else:
+                raw_bytes = self.bytes[ofs:ofs + BYTES_PER_SECTOR]
             track, sector = ord(raw_bytes[0]), ord(raw_bytes[1])
             yield raw_bytes, track, sector
             
+    def open_file(self, track, sector):
+        """Return a `ChainReader` over the file starting at the given 
+        track/sector."""
+        return ChainReader(self, track, sector)
+        
     def read_file(self, track, sector):
         """Read file bytes from the given starting track/sector, assuming 
         the common "linked sectors" format used by CBM-DOS."""
+        return ''.join(ChainReader(self, track, sector))
         
-        file_bytes = list()
+    def write_sector(self, track, sector, bytes):
+        """Overwrite the given sector; `bytes` is padded with zeros.
         
-        for (block, t, s) in self.walk_sectors(track, sector):
-            byte_size = 254 if t > 0 else s
-            file_bytes.append(block[2:2+byte_size])
-
-        return ''.join(file_bytes)
+        The image must be backed by a mutable buffer (a bytearray, or a
+        memory map opened for writing.)
+        """
+        ofs = (self._desc.track_offsets[track] + sector) * BYTES_PER_SECTOR
+        self.bytes[ofs:ofs + BYTES_PER_SECTOR] =\
+            bytes[:BYTES_PER_SECTOR].ljust(BYTES_PER_SECTOR, '\x00')
+            
+    def write_chain(self, locations, bytes):
+        """Write `bytes` as a linked-sector file chain over the list of
+        (track, sector) `locations`, which must be long enough."""
+        last = len(locations) - 1
+        for i, (t, s) in enumerate(locations):
+            chunk = bytes[i*DATA_BYTES_PER_SECTOR:(i+1)*DATA_BYTES_PER_SECTOR]
+            if i < last:
+                link = chr(locations[i+1][0]) + chr(locations[i+1][1])
+            else:
+                link = '\x00' + chr(len(chunk) + 1)
+            self.write_sector(t, s, link + chunk)
+            
+    def save(self, filename=None):
+        """Write the whole image to `filename` in one write.
+        
+        With no `filename`, a writable memory-mapped image is flushed
+        back to the file it was mapped from.
+        """
+        if filename is None:
+            if not isinstance(self.bytes, mmap.mmap):
+                raise ValueError, "Image isn't memory-mapped; give a filename."
+            self.bytes.flush()
+            return
+            
+        with open(filename, 'wb') as f:
+            f.write(self.bytes)
 
     def __str__(self):
         return "<Disk image: %d bytes>" % (len(self.bytes))
@@ -293,45 +688,271 @@ class DosDisk(object):
 
     def __init__(self, disk, 
             header_sector=None, entries_sector=None, 
-            image_type='Abstract CBM DOS disk'):
+            image_type='Abstract CBM DOS disk', lazy=False):
+        """Initialize a DosDisk over the given DiskImage.
+        
+        If `lazy` is True, only the directory header is read up front;
+        the directory chain is walked as entries are iterated (see
+        `iter_entries`), or in full the first time `entries` is used.
+        """
         
         self.disk = disk
         self._desc = disk._desc
-        self._read_directory()
+        self._directory_sectors = None
+        self._name_index = None
+        self._bam = None
+        self._geos_info = dict()
+        self._read_header()
+        if not lazy:
+            self._read_directory()
         self.image_type = image_type
         
-    def _read_directory(self):
+    def _read_header(self):
         self.raw_disk_name, self.disk_id =\
             struct.unpack(
                 self._desc.STRUCT_HEADER,
                 self.disk.get_sector( *self._desc.DIRECTORY_HEADER ))
 
         self.disk_name = self.raw_disk_name.strip('\xA0')
-        self.directory_sectors = [DirectorySector(*x)
-            for x in self.disk.walk_sectors( *self._desc.DIRECTORY_ENTRIES )]
-
-        self.raw_entries = [e for s in self.directory_sectors for e in s.entries]
-        self.entries = [e for e in self.raw_entries if e.size > 0]
+        
+    def _read_directory(self):
+        self._directory_sectors = list(self._walk_directory())
+        self._raw_entries = [e for s in self._directory_sectors for e in s.entries]
+        self._entries = [e for e in self._raw_entries if e.in_use]
+        
+    def _walk_directory(self):
+        location = self._desc.DIRECTORY_ENTRIES
+        for raw_bytes, t, s in self.disk.walk_sectors(*location):
+            yield DirectorySector(raw_bytes, *location)
+            location = (t, s)
+            
+    @property
+    def directory_sectors(self):
+        if self._directory_sectors is None:
+            self._read_directory()
+        return self._directory_sectors
+        
+    @property
+    def raw_entries(self):
+        if self._directory_sectors is None:
+            self._read_directory()
+        return self._raw_entries
+        
+    @property
+    def entries(self):
+        if self._directory_sectors is None:
+            self._read_directory()
+        return self._entries
+        
+    def iter_entries(self):
+        """Iterate over the live directory entries.
+        
+        If the directory hasn't been read yet, directory sectors are
+        only read as the iteration reaches them, so a caller that stops
+        early never touches the rest of the chain.
+        """
+        if self._directory_sectors is not None:
+            return iter(self._entries)
+        
+        return (e for s in self._walk_directory() 
+            for e in s.entries if e.in_use)
             
     def file(self, i):
         """Return file bytes for entry at index i."""
         e = self.entries[i]
         return self.disk.read_file(e.track, e.sector)
         
-    def find(self, filename, ignore_case=False):
-        for e in self.entries:
-            if e.name == filename:
-                return self.disk.read_file(e.track, e.sector)
+    @property
+    def bam(self):
+        "The disk's `BlockAvailabilityMap`, read on first use."
+        if self._bam is None:
+            self._bam = BlockAvailabilityMap(self.disk)
+        return self._bam
+        
+    @property
+    def name_index(self):
+        "A `NameIndex` over the live entries, built on first use."
+        if self._name_index is None:
+            self._name_index = NameIndex(self.entries)
+        return self._name_index
+        
+    def find_entries(self, pattern, ignore_case=False):
+        """Return a list of all entries matching `pattern`.
+        
+        `pattern` may contain CBM-DOS wildcards (`*` and `?`).
+        """
+        return self.name_index.lookup(pattern, ignore_case)
+        
+    def _find_entry(self, filename, ignore_case):
+        # A lazy disk that hasn't read its whole directory yet is scanned
+        # only as far as the first match, rather than indexed.
+        if self._directory_sectors is None:
+            for e in self.iter_entries():
+                if name_matches(filename, e.name, ignore_case):
+                    return e
+        else:
+            found = self.name_index.lookup(filename, ignore_case)
+            if found:
+                return found[0]
+        
         raise FileNotFoundError, 'File "%s" not found on disk.' % (filename)
+        
+    def find(self, filename, ignore_case=False):
+        """Return file bytes for the first entry matching `filename`."""
+        e = self._find_entry(filename, ignore_case)
+        return self.disk.read_file(e.track, e.sector)
+    
+    def open(self, filename, ignore_case=False):
+        """Return a `ChainReader` for the first entry matching `filename`."""
+        e = self._find_entry(filename, ignore_case)
+        return self.disk.open_file(e.track, e.sector)
+    
+    def open_relative(self, filename, ignore_case=False):
+        """Return a `RelativeFile` for the first entry matching `filename`,
+        which must be a REL file."""
+        e = self._find_entry(filename, ignore_case)
+        if e.filetype != 4:
+            raise FormatError, 'File "%s" is not a REL file.' % (e.name,)
+        return RelativeFile(self.disk, e)
+    
+    def entry_geos_info(self, e):
+        """Return the `GeosInfo` for entry `e`, or None if it isn't a GEOS
+        file. Info blocks are decoded once, and kept for later calls."""
+        if e.geos_type <= 0 or not e.geos_info_location[0]:
+            return None
+        
+        location = e.geos_info_location
+        if location not in self._geos_info:
+            self._geos_info[location] = GeosInfo(self.disk.get_sector(*location))
+        return self._geos_info[location]
     
     def geos_info(self, filename, ignore_case=False):
-        for e in self.entries:
-            if e.name == filename:
-                info = self.disk.get_sector(*e.geos_info_location)
-                # Actually, want to unpack the info before returning it.
-                return info
-        raise FileNotFoundError, 'File "%s" not found on disk.' % (filename)
+        """Return the `GeosInfo` for the first entry matching `filename`."""
+        return self.entry_geos_info(self._find_entry(filename, ignore_case))
+        
+    def geos_entries(self):
+        """Return a list of (entry, GeosInfo) for each GEOS file."""
+        return [(e, info) for e, info in 
+            ((e, self.entry_geos_info(e)) for e in self.entries) if info]
+    
+    def open_vlir(self, filename, ignore_case=False):
+        """Return a `VlirFile` for the first entry matching `filename`,
+        which must be a GEOS VLIR file."""
+        e = self._find_entry(filename, ignore_case)
+        if e.geos_type <= 0 or e.geos_structure != 1:
+            raise FormatError, 'File "%s" is not a VLIR file.' % (e.name,)
+        return VlirFile(self.disk, e.track, e.sector)
     
+    def _directory_changed(self):
+        self._directory_sectors = None
+        self._name_index = None
+        self._geos_info = dict()
+        
+    def _entry_slot(self, entry):
+        "Return the (track, sector, byte offset) of a directory entry."
+        for d in self.directory_sectors:
+            for i, e in enumerate(d.entries):
+                if e is entry:
+                    return d.location + (i * 32,)
+        raise FileNotFoundError, 'Entry "%s" not in directory.' % (entry.name)
+        
+    def _write_entry_bytes(self, track, sector, offset, bytes):
+        data = str(self.disk.get_sector(track, sector))
+        self.disk.write_sector(track, sector, 
+            data[:offset] + bytes + data[offset + len(bytes):])
+            
+    def _free_slot(self):
+        """Return the (track, sector, byte offset) of an unused directory
+        entry, extending the directory chain if it is full."""
+        for d in self.directory_sectors:
+            for i, e in enumerate(d.entries):
+                if e.bytes[2] == '\x00':
+                    return d.location + (i * 32,)
+                    
+        # Link a new sector onto the end of the directory chain.
+        last = self.directory_sectors[-1].location
+        t = last[0]
+        s = self.bam.free_on_track_from(t, 
+            (last[1] + self._desc.DIRECTORY_INTERLEAVE) % self._desc.sectors_per_track[t])
+        if s is None:
+            raise DiskFullError, "Directory is full."
+        
+        self.bam.allocate(t, s)
+        self.disk.write_sector(t, s, '\x00\xff')
+        self._write_entry_bytes(last[0], last[1], 0, chr(t) + chr(s))
+        self._directory_changed()
+        return (t, s, 0)
+        
+    def add_entry(self, name, filetype, location, size):
+        """Add a closed directory entry for a file starting at `location`.
+        
+        `name` is a PETSCII string of at most 16 characters.
+        """
+        t, s, offset = self._free_slot()
+        self._write_entry_bytes(t, s, offset + 2, 
+            pack_entry(name, filetype, location, size))
+        self._directory_changed()
+        
+    def write_file(self, name, bytes, filetype=2):
+        """Write `bytes` as a new file on this disk, and add its entry.
+        
+        Blocks are allocated from the BAM; call `flush` or `save` to
+        write the updated BAM back to the image.
+        """
+        count = max(1, -(-len(bytes) // DATA_BYTES_PER_SECTOR))
+        if count > self.bam.data_blocks_free:
+            raise DiskFullError, "Not enough free blocks for %d byte file." % (
+                len(bytes))
+        
+        locations = list()
+        previous = None
+        try:
+            for i in range(count):
+                previous = self.bam.allocate_next(previous)
+                locations.append(previous)
+        except DiskFullError:
+            # Leave the BAM as it was.
+            for location in locations:
+                self.bam.free(*location)
+            raise
+            
+        self.disk.write_chain(locations, bytes)
+        self.add_entry(name, filetype, locations[0], count)
+        
+    def delete_file(self, filename, ignore_case=False):
+        """Scratch the first file matching `filename`, freeing its blocks."""
+        # Read the whole directory, so the entry found is the one 
+        # `_entry_slot` will look for.
+        self.directory_sectors
+        e = self._find_entry(filename, ignore_case)
+        
+        chains = [(e.track, e.sector)]
+        if e.filetype == 4:
+            # REL files also own a chain of side-sectors.
+            chains.append(e.geos_info_location)
+            
+        for location in chains:
+            for raw_bytes, t, s in self.disk.walk_sectors(*location):
+                self.bam.free(*location)
+                location = (t, s)
+                
+        # Clear the file type, as CBM-DOS does, and also the size so that
+        # the entry no longer counts as live.
+        t, s, offset = self._entry_slot(e)
+        self._write_entry_bytes(t, s, offset + 2, '\x00')
+        self._write_entry_bytes(t, s, offset + 30, '\x00\x00')
+        self._directory_changed()
+        
+    def flush(self):
+        "Write any changes to the BAM back to the disk image."
+        if self._bam is not None:
+            self._bam.write(self.disk)
+            
+    def save(self, filename=None):
+        "Flush the BAM, and save the image with `DiskImage.save`."
+        self.flush()
+        self.disk.save(filename)
+        
     def __str__(self):
         return '<DosDisk: %s "%s" "%s">' % (
             self.image_type, self.disk_name, self.disk_id)
@@ -0,0 +1,219 @@
+"""Whole-disk consistency checks for CBM-DOS disk images.
+
+`check_disk` reads the link bytes of every sector at once (with strided
+slices of the image, rather than a sector at a time), builds the full
+track/sector link graph as arrays indexed by linear block number, and then
+follows every chain on the disk through those arrays. One pass finds:
+
+  * illegal track/sector references,
+  * circular chains,
+  * cross-linked files (blocks claimed by more than one chain),
+  * orphaned blocks (allocated in the BAM, but not part of any chain),
+  * blocks in use but marked free in the BAM, and
+  * tracks whose stored free count disagrees with the BAM bitmap.
+"""
+from array import array
+
+from c64.formats.cbmdos import BYTES_PER_SECTOR, DirectorySector
+
+__all__ = ['DiskCheck', 'check_disk']
+
+# Values in the link array that aren't block numbers.
+_END = -1
+_ILLEGAL = -2
+
+_NO_OWNER = -1
+
+# CBM-DOS file type of 1581 partitions, which are contiguous block ranges
+# rather than chains.
+_PARTITION = 5
+
+
+class DiskCheck(object):
+    """The problems found on a disk by `check_disk`.
+    
+    Locations are (track, sector) pairs; chains are named by the file
+    name, or '<directory>', '<header>' and so on for system chains.
+    """
+    
+    def __init__(self):
+        self.illegal = list()       # (chain name, (track, sector) referenced)
+        self.cycles = list()        # chain names
+        self.cross_linked = list()  # (location, first owner, second owner)
+        self.orphans = list()       # locations
+        self.used_but_free = list() # locations
+        self.count_mismatches = list() # (track, stored count, bitmap count)
+        
+    @property
+    def ok(self):
+        return not (self.illegal or self.cycles or self.cross_linked or 
+            self.orphans or self.used_but_free or self.count_mismatches)
+            
+    def problems(self):
+        "Return a list of descriptions of each problem found."
+        s = list()
+        s.extend('Illegal track/sector %s in "%s"' % (loc, name) 
+            for name, loc in self.illegal)
+        s.extend('Circular chain in "%s"' % (name,) for name in self.cycles)
+        s.extend('Sector %s cross-linked between "%s" and "%s"' % x 
+            for x in self.cross_linked)
+        s.extend('Sector %s allocated but not used' % (loc,) 
+            for loc in self.orphans)
+        s.extend('Sector %s used but not allocated' % (loc,) 
+            for loc in self.used_but_free)
+        s.extend('Track %d free count is %d, BAM bitmap has %d' % x
+            for x in self.count_mismatches)
+        return s
+        
+    def __str__(self):
+        return '\n'.join(self.problems()) or 'No problems found.'
+
+
+class _Checker(object):
+    def __init__(self, d):
+        self.d = d
+        self.desc = desc = d.disk._desc
+        self.result = DiskCheck()
+        self.names = list()
+        
+        # Link bytes for every sector, pulled out with two strided slices.
+        size = desc.total_sectors * BYTES_PER_SECTOR
+        link_tracks = bytearray(d.disk.bytes[0:size:BYTES_PER_SECTOR])
+        link_sectors = bytearray(d.disk.bytes[1:size:BYTES_PER_SECTOR])
+        
+        # A lookup table of block numbers, indexed by track * 256 + sector;
+        # illegal locations map to _ILLEGAL.
+        self.block_table = block_table = array('i', [_ILLEGAL]) * (256 * 256)
+        for t in range(1, desc.tracks + 1):
+            for s in range(desc.sectors_per_track[t]):
+                block_table[t * 256 + s] = desc.track_offsets[t] + s
+        for s in range(256):
+            block_table[s] = _END
+        
+        self.links = array('i', [block_table[t * 256 + s] 
+            for t, s in zip(link_tracks, link_sectors)])
+        self.owners = array('i', [_NO_OWNER]) * desc.total_sectors
+        
+    def claim(self, name, location, chain=True, count=1):
+        """Mark the blocks of a chain (or of `count` contiguous blocks,
+        if `chain` is False) as owned by `name`. Returns the list of 
+        blocks claimed, in chain order, up to the first fault."""
+        owner = len(self.names)
+        self.names.append(name)
+        claimed = list()
+        
+        block = self.block_table[location[0] * 256 + location[1]]
+        if block == _ILLEGAL:
+            self.result.illegal.append((name, location))
+            return claimed
+            
+        remaining = count
+        while block >= 0:
+            current = self.owners[block]
+            if current == owner:
+                self.result.cycles.append(name)
+                return claimed
+            if current != _NO_OWNER:
+                self.result.cross_linked.append(
+                    (self.desc.location(block), self.names[current], name))
+                return claimed
+            self.owners[block] = owner
+            claimed.append(block)
+            
+            if chain:
+                next_block = self.links[block]
+                if next_block == _ILLEGAL:
+                    self.result.illegal.append((name, self._link_of(block)))
+                block = next_block
+            else:
+                remaining -= 1
+                block = block + 1 if remaining and block + 1 < len(self.owners) else _END
+        return claimed
+                
+    def _link_of(self, block):
+        sector = self.d.disk.get_sector(*self.desc.location(block))
+        return (ord(sector[0]), ord(sector[1]))
+        
+    def claim_vlir(self, name, location):
+        "Claim a GEOS VLIR index block and the record chains it lists."
+        self.claim(name, location, chain=False)
+        block = self.block_table[location[0] * 256 + location[1]]
+        if block < 0:
+            return
+            
+        index = self.d.disk.get_sector(*location)
+        for i in range(2, BYTES_PER_SECTOR, 2):
+            t, s = ord(index[i]), ord(index[i+1])
+            if t:
+                self.claim('%s record %d' % (name, i / 2 - 1), (t, s))
+                
+    def claim_entry(self, e):
+        "Claim all of the blocks used by a directory entry."
+        if e.typeflags == 0:
+            # Scratched files own nothing.
+            return
+            
+        if e.typeflags & 0x07 == _PARTITION:
+            self.claim(e.name, (e.track, e.sector), chain=False, count=e.size)
+            return
+        
+        if e.geos_type > 0 and e.geos_structure == 1:
+            self.claim_vlir(e.name, (e.track, e.sector))
+        else:
+            self.claim(e.name, (e.track, e.sector))
+            
+        if e.typeflags & 0x07 == 4:
+            self.claim(e.name + ' side sectors', e.geos_info_location)
+        elif e.geos_type > 0 and e.geos_info_location[0]:
+            self.claim(e.name + ' info', e.geos_info_location, chain=False)
+                
+    def run(self):
+        d, desc = self.d, self.desc
+        
+        self.claim('<header>', desc.DIRECTORY_HEADER, chain=False)
+        # The BAM, and anything else reserved when the disk is formatted.
+        for location in desc.SYSTEM_SECTORS:
+            if location not in (desc.DIRECTORY_HEADER, desc.DIRECTORY_ENTRIES):
+                self.claim('<system>', location, chain=False)
+        # The directory is read from the blocks its chain claims, rather
+        # than through `d.entries`, so a faulty directory chain is 
+        # reported instead of raised.
+        for block in self.claim('<directory>', desc.DIRECTORY_ENTRIES):
+            location = desc.location(block)
+            for e in DirectorySector(d.disk.get_sector(*location), 
+                    *location).entries:
+                if e.in_use:
+                    self.claim_entry(e)
+            
+        # GEOS disks keep an extra "border" directory block, named in the
+        # header, for files that are off the desktop.
+        header = d.disk.get_sector(*desc.DIRECTORY_HEADER)
+        if header[0xAD:0xB8] == 'GEOS format':
+            border = (ord(header[0xAB]), ord(header[0xAC]))
+            self.claim('<geos border>', border, chain=False)
+            if self.block_table[border[0] * 256 + border[1]] >= 0:
+                for e in DirectorySector(d.disk.get_sector(*border), *border).entries:
+                    if e.in_use:
+                        self.claim_entry(e)
+                
+        self.check_bam()
+        return self.result
+        
+    def check_bam(self):
+        bam = self.d.bam
+        allocated = bam.allocation_map()
+        for block, owner in enumerate(self.owners):
+            if owner == _NO_OWNER and allocated[block]:
+                self.result.orphans.append(self.desc.location(block))
+            elif owner != _NO_OWNER and not allocated[block]:
+                self.result.used_but_free.append(self.desc.location(block))
+                
+        for t in range(1, self.desc.tracks + 1):
+            n = bam.free_on_track(t)
+            if n != bam.free_counts[t]:
+                self.result.count_mismatches.append((t, bam.free_counts[t], n))
+
+
+def check_disk(d):
+    """Check the DosDisk `d`, and return a `DiskCheck` of the problems."""
+    return _Checker(d).run()
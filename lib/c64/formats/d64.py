@@ -5,7 +5,9 @@ from __future__ import with_statement
 import struct
 
 from c64 import struct_doc
-from c64.formats.cbmdos import DosDisk, DiskImage, DiskDescription
+from c64.formats.cbmdos import DosDisk, DiskImage, DiskDescription,\
+    description_for_size, disk_loader
+from c64.formats.build import build_image
 
 class D64_Description(DiskDescription):
     """Describe the 1541 disk geometry and related CBM-DOS version."""
@@ -21,6 +23,13 @@ class D64_Description(DiskDescription):
     DIRECTORY_HEADER = (18, 0)
     DIRECTORY_ENTRIES = (18, 1)
     
+    # Sector interleave for file data and for directory sectors.
+    INTERLEAVE = 10
+    DIRECTORY_INTERLEAVE = 3
+    
+    BAM_LAYOUT = (
+        ((18, 0), 0x04, 1, 35, 4, None),)
+    
     STRUCT_HEADER = struct_doc('''
 <       # Little-endian
 xx      # Track/sector of first directory block; should always be 18/1 for normal disks
@@ -36,14 +45,63 @@ xxxx    # Shifted spaces ($A0)
 85x     # Rest of sector is unused.
 ''')
 
+    # Sectors allocated when a disk is formatted: the header/BAM and the
+    # first directory sector.
+    SYSTEM_SECTORS = ((18, 0), (18, 1))
+    
+    def header_sectors(self, disk_name, disk_id):
+        """Return a list of (location, bytes) for the header sectors of a
+        newly formatted disk. The BAM entries are left empty."""
+        header = ''.join([
+            '\x12\x01A\x00', '\x00' * 140,
+            disk_name[:16].ljust(16, '\xa0'), '\xa0\xa0',
+            disk_id[:2].ljust(2, '\xa0'), '\xa02A', '\xa0' * 4])
+        return [((18, 0), header)]
+
+
+class D64_40_Description(D64_Description):
+    """Describe a 40-track 1541 disk.
+    
+    The free counts and bitmaps of tracks 36-40 follow the SpeedDOS
+    layout, after the disk ID in the header sector.
+    """
+    
+    _SECTOR_COUNTS = D64_Description._SECTOR_COUNTS + ((36, 40, 17),)
+    
+    BAM_LAYOUT = D64_Description.BAM_LAYOUT + (
+        ((18, 0), 0xC0, 36, 40, 4, None),)
+        
+
+class D64_42_Description(D64_Description):
+    """Describe a 42-track 1541 disk, with the SpeedDOS BAM layout 
+    extended to cover tracks 41 and 42."""
+    
+    _SECTOR_COUNTS = D64_Description._SECTOR_COUNTS + ((36, 42, 17),)
+    
+    BAM_LAYOUT = D64_Description.BAM_LAYOUT + (
+        ((18, 0), 0xC0, 36, 42, 4, None),)
+
+
 _desc = D64_Description()
 
+# All 1541 geometries, told apart by image size; 35 tracks is the default.
+GEOMETRIES = (_desc, D64_40_Description(), D64_42_Description())
+
 class D64Disk(DosDisk):
-    def __init__(self, bytes):
-        DosDisk.__init__(self, DiskImage(_desc, bytes),
-                image_type="1541 Diskette")
+    def __init__(self, bytes, lazy=False):
+        desc = description_for_size(GEOMETRIES, len(bytes))
+        DosDisk.__init__(self, DiskImage(desc, bytes),
+                image_type="1541 Diskette", lazy=lazy)
+
+
+def build(files, disk_name='', disk_id='', tracks=35):
+    """Return the bytes of a new 1541 disk image holding `files`, 
+    a list of (name, filetype, bytes) tuples. See `DiskBuilder`.
+    
+    `tracks` may be 35, 40 or 42.
+    """
+    desc = [d for d in GEOMETRIES if d.tracks == tracks][0]
+    return build_image(desc, files, disk_name, disk_id)
 
 
-def load(filename):
-    with open(filename) as f:
-        return D64Disk(f.read())
+load = disk_loader(D64Disk, 'a 1541 disk')
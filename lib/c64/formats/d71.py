@@ -0,0 +1,63 @@
+"""This module provides support for reading "D71" (1571) disk images."""
+
+from __future__ import with_statement
+
+import struct
+
+from c64.formats.cbmdos import DosDisk, DiskImage, disk_loader
+from c64.formats.build import build_image
+from c64.formats.d64 import D64_Description
+
+
+class D71_Description(D64_Description):
+    """Describe the double-sided 1571 disk geometry.
+    
+    The first side is laid out as a 1541 disk. The second side's BAM
+    bitmaps are in track 53, sector 0, and its free counts follow the 
+    disk ID in the header sector.
+    """
+    
+    _SECTOR_COUNTS = D64_Description._SECTOR_COUNTS + (
+        (36, 52, 21),
+        (53, 59, 19),
+        (60, 65, 18),
+        (66, 70, 17))
+
+    # Sector interleave for file data.
+    INTERLEAVE = 6
+    
+    BAM_LAYOUT = (
+        ((18, 0), 0x04, 1, 35, 4, None),
+        ((53, 0), 0x00, 36, 70, 3, ((18, 0), 0xDD)))
+    
+    # Sectors allocated when a disk is formatted: the header/BAM, the
+    # first directory sector, and all of track 53 (the second BAM track.)
+    SYSTEM_SECTORS = ((18, 0), (18, 1)) + tuple((53, s) for s in range(19))
+    
+    def header_sectors(self, disk_name, disk_id):
+        """Return a list of (location, bytes) for the header sectors of a
+        newly formatted disk. The BAM entries are left empty."""
+        (location, header), = D64_Description.header_sectors(
+            self, disk_name, disk_id)
+        # Byte 3 flags a double-sided disk.
+        return [(location, header[:3] + '\x80' + header[4:])]
+
+
+_desc = D71_Description()
+
+# All geometries this module loads, told apart by image size.
+GEOMETRIES = (_desc,)
+
+class D71Disk(DosDisk):
+    def __init__(self, bytes, lazy=False):
+        DosDisk.__init__(self, DiskImage(_desc, bytes),
+                image_type="1571 Diskette", lazy=lazy)
+
+
+def build(files, disk_name='', disk_id=''):
+    """Return the bytes of a new 1571 disk image holding `files`, 
+    a list of (name, filetype, bytes) tuples. See `DiskBuilder`."""
+    return build_image(_desc, files, disk_name, disk_id)
+
+
+load = disk_loader(D71Disk, 'a 1571 disk')
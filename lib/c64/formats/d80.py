@@ -0,0 +1,128 @@
+"""This module provides support for reading "D80" (8050) and "D82" (8250)
+disk images."""
+
+from __future__ import with_statement
+
+import struct
+
+from c64 import struct_doc
+from c64.formats.cbmdos import DosDisk, DiskImage, DiskDescription,\
+    description_for_size, disk_loader
+from c64.formats.build import build_image
+
+
+class D80_Description(DiskDescription):
+    """Describe the single-sided 8050 disk geometry and CBM-DOS 2.7.
+    
+    The header is on track 39; the BAM is a chain of sectors on track 38,
+    each covering up to 50 tracks.
+    """
+    
+    _SECTOR_COUNTS = (
+        # (starting track, ending track, sectors in this track group)
+        (0, 0, 0),
+        (1,  39, 29),
+        (40, 53, 27),
+        (54, 64, 25),
+        (65, 77, 23))
+
+    DIRECTORY_HEADER = (39, 0)
+    DIRECTORY_ENTRIES = (39, 1)
+    
+    # Sector interleave for file data and for directory sectors.
+    INTERLEAVE = 1
+    DIRECTORY_INTERLEAVE = 1
+    
+    BAM_LAYOUT = (
+        ((38, 0), 0x06, 1, 50, 5, None),
+        ((38, 3), 0x06, 51, 77, 5, None))
+    
+    STRUCT_HEADER = struct_doc('''
+<       # Little-endian
+xx      # Track/sector of first BAM block; 38/0 for normal disks
+x       # 'C' (DOS format.)
+xxx     # 0 Null bytes.
+16s     # Disk name, PET-ASCII, $A0 padded
+xx      # Two shift-spaces
+2s      # Disk ID
+x       # $A0
+xx      # '2C' (DOS version and format type.)
+xxxx    # Shifted spaces ($A0)
+223x    # Rest of sector is unused.
+''')
+
+    # Sectors allocated when a disk is formatted: the header, the BAM
+    # sectors and the first directory sector.
+    SYSTEM_SECTORS = ((39, 0), (39, 1), (38, 0), (38, 3))
+    
+    def header_sectors(self, disk_name, disk_id):
+        """Return a list of (location, bytes) for the header sectors of a
+        newly formatted disk. The BAM entries are left empty."""
+        header = ''.join([
+            '\x26\x00C\x00\x00\x00', disk_name[:16].ljust(16, '\xa0'), 
+            '\xa0\xa0', disk_id[:2].ljust(2, '\xa0'), '\xa02C', '\xa0' * 4])
+            
+        # Each BAM sector links to the next (the last one to the directory),
+        # and records the DOS version and the range of tracks it covers.
+        sectors = [((39, 0), header)]
+        bam = [x[0] for x in self.BAM_LAYOUT] + [self.DIRECTORY_ENTRIES]
+        for i, (location, offset, first, last, size, counts) in enumerate(
+                self.BAM_LAYOUT):
+            sectors.append((location, chr(bam[i+1][0]) + chr(bam[i+1][1]) + 
+                'C\x00' + chr(first) + chr(last + 1)))
+        return sectors
+
+
+class D82_Description(D80_Description):
+    """Describe the double-sided 8250 disk geometry; each side is laid out
+    as an 8050 disk."""
+    
+    _SECTOR_COUNTS = D80_Description._SECTOR_COUNTS + (
+        (78, 116, 29),
+        (117, 130, 27),
+        (131, 141, 25),
+        (142, 154, 23))
+        
+    BAM_LAYOUT = (
+        ((38, 0), 0x06, 1, 50, 5, None),
+        ((38, 3), 0x06, 51, 100, 5, None),
+        ((38, 6), 0x06, 101, 150, 5, None),
+        ((38, 9), 0x06, 151, 154, 5, None))
+        
+    SYSTEM_SECTORS = ((39, 0), (39, 1), (38, 0), (38, 3), (38, 6), (38, 9))
+
+
+_desc = D80_Description()
+_desc_82 = D82_Description()
+
+# All geometries this module loads, told apart by image size.
+GEOMETRIES = (_desc, _desc_82)
+
+class D80Disk(DosDisk):
+    def __init__(self, bytes, lazy=False):
+        DosDisk.__init__(self, DiskImage(_desc, bytes),
+                image_type="8050 Diskette", lazy=lazy)
+
+
+class D82Disk(DosDisk):
+    def __init__(self, bytes, lazy=False):
+        DosDisk.__init__(self, DiskImage(_desc_82, bytes),
+                image_type="8250 Diskette", lazy=lazy)
+
+
+def build(files, disk_name='', disk_id='', double_sided=False):
+    """Return the bytes of a new 8050 (or, if `double_sided`, 8250) disk
+    image holding `files`, a list of (name, filetype, bytes) tuples. 
+    See `DiskBuilder`."""
+    return build_image(_desc_82 if double_sided else _desc, files, 
+        disk_name, disk_id)
+
+
+def _open_disk(bytes, lazy=False):
+    "Open an 8050 or 8250 image; the two are told apart by size."
+    if description_for_size(GEOMETRIES, len(bytes)) is _desc_82:
+        return D82Disk(bytes, lazy=lazy)
+    return D80Disk(bytes, lazy=lazy)
+
+
+load = disk_loader(_open_disk, 'an 8050 or 8250 disk')
@@ -5,7 +5,10 @@ from __future__ import with_statement
 import struct
 
 from c64 import struct_doc
-from c64.formats.cbmdos import DosDisk, DiskImage, DiskDescription
+from c64.formats.cbmdos import DosDisk, DiskImage, DiskDescription,\
+    DiskFullError, FormatError, disk_loader
+from c64.formats.bam import BlockAvailabilityMap
+from c64.formats.build import build_image
 
 
 class D81_Description(DiskDescription):
@@ -19,6 +22,17 @@ class D81_Description(DiskDescription):
     DIRECTORY_HEADER = (40, 0)
     DIRECTORY_ENTRIES = (40, 3)
     
+    # First and last track of the disk, or of a partition.
+    tracks_used = (1, 80)
+    
+    # Sector interleave for file data and for directory sectors.
+    INTERLEAVE = 1
+    DIRECTORY_INTERLEAVE = 1
+    
+    BAM_LAYOUT = (
+        ((40, 1), 0x10, 1, 40, 6, None),
+        ((40, 2), 0x10, 41, 80, 6, None))
+    
     STRUCT_HEADER = struct_doc('''
 <       # Little-endian
 xx      # Track/sector of first directory block; 40/3 for normal disks
@@ -34,14 +48,170 @@ xx      # Shifted spaces ($A0)
 ''')
 
 
+    # Sectors allocated when a disk is formatted: the header, both BAM 
+    # sectors and the first directory sector.
+    SYSTEM_SECTORS = ((40, 0), (40, 1), (40, 2), (40, 3))
+    
+    def header_sectors(self, disk_name, disk_id):
+        """Return a list of (location, bytes) for the header sectors of a
+        newly formatted disk. The BAM entries are left empty."""
+        track = self.DIRECTORY_HEADER[0]
+        disk_id = disk_id[:2].ljust(2, '\xa0')
+        header = ''.join([
+            chr(track), '\x03D\x00', disk_name[:16].ljust(16, '\xa0'), 
+            '\xa0\xa0', disk_id, '\xa03D\xa0\xa0'])
+        
+        # Each BAM sector starts with its link, the DOS version and its
+        # complement, the disk ID, and the I/O and auto-boot flags.
+        bam_info = 'D\xbb' + disk_id + '\xc0\x00'
+        return [
+            ((track, 0), header),
+            ((track, 1), chr(track) + '\x02' + bam_info),
+            ((track, 2), '\x00\xff' + bam_info)]
+
+
+class D81_Partition_Description(D81_Description):
+    """Describe a 1581 sub-directory: a partition of whole tracks, 
+    starting at `track`, formatted with its own header, BAM and directory
+    in its first track. Track numbers stay those of the whole disk."""
+    
+    def __init__(self, track, tracks):
+        D81_Description.__init__(self)
+        self.tracks_used = (track, track + tracks - 1)
+        self.DIRECTORY_HEADER = (track, 0)
+        self.DIRECTORY_ENTRIES = (track, 3)
+        self.BAM_LAYOUT = (
+            ((track, 1), 0x10, 1, 40, 6, None),
+            ((track, 2), 0x10, 41, 80, 6, None))
+        self.SYSTEM_SECTORS = tuple((track, s) for s in range(4))
+
+
 _desc = D81_Description()
 
+# All geometries this module loads, told apart by image size.
+GEOMETRIES = (_desc,)
+
+# File type of partition entries.
+PARTITION = 5
+
+# The smallest partition that can hold a sub-directory, in tracks.
+MIN_DIRECTORY_TRACKS = 3
+
 class D81Disk(DosDisk):
-    def __init__(self, bytes):
+    def __init__(self, bytes, lazy=False):
         DosDisk.__init__(self, DiskImage(_desc, bytes),
-                image_type="1581 Diskette")
+                image_type="1581 Diskette", lazy=lazy)
+    
+    def is_directory(self, e):
+        """Is entry `e` a partition formatted as a sub-directory?
+        
+        Other partitions are just reserved blocks, with no directory. A
+        sub-directory must lie within this directory's tracks, and not
+        include its header track."""
+        if e.filetype != PARTITION or e.sector != 0:
+            return False
+        first, last = self._desc.tracks_used
+        if not first <= e.track <= last:
+            return False
+        tracks, rest = divmod(e.size, self._desc.sectors_per_track[e.track])
+        end = e.track + tracks - 1
+        if (rest or tracks < MIN_DIRECTORY_TRACKS or end > last
+                or e.track <= self._desc.DIRECTORY_HEADER[0] <= end):
+            return False
+        header = self.disk.get_sector(e.track, 0)
+        return header[0:3] == chr(e.track) + '\x03D'
+    
+    @property
+    def partitions(self):
+        "A list of the sub-directories in this directory."
+        return [e for e in self.entries if self.is_directory(e)]
+        
+    def open_partition(self, e):
+        """Return a `D81Partition` for the sub-directory entry `e`, or for
+        the first entry matching it if it's a name."""
+        if isinstance(e, basestring):
+            e = self._find_entry(e, False)
+        if not self.is_directory(e):
+            raise FormatError, '"%s" is not a sub-directory.' % (e.name,)
+        return D81Partition(self, e)
+        
+    def walk(self):
+        """Yield (path, entry) for every entry on the disk, descending into
+        sub-directories; `path` is the tuple of partition names above the
+        entry. Every partition shares this disk's image bytes, and is 
+        only descended into once, even on a corrupt disk."""
+        pending = [((), self)]
+        visited = set([self._desc.DIRECTORY_HEADER[0]])
+        while pending:
+            path, d = pending.pop(0)
+            for e in d.entries:
+                yield path, e
+                if d.is_directory(e) and e.track not in visited:
+                    visited.add(e.track)
+                    pending.append((path + (e.name,), d.open_partition(e)))
+                    
+    def create_partition(self, name, track, tracks, disk_id=None):
+        """Reserve `tracks` whole tracks from `track` as a partition, and
+        format it as a sub-directory. Returns its `D81Partition`.
+        
+        The tracks must be free, and the image writable. The new entry
+        and the BAM are written at once.
+        """
+        desc = self._desc
+        last = track + tracks - 1
+        first_used, last_used = desc.tracks_used
+        if (tracks < MIN_DIRECTORY_TRACKS or track < first_used 
+                or last > last_used or track <= desc.DIRECTORY_HEADER[0] <= last):
+            raise FormatError, "Can't make a partition of tracks %d-%d." % (
+                track, last)
+        
+        locations = [(t, s) for t in range(track, last + 1) 
+            for s in range(desc.sectors_per_track[t])]
+        if not all(self.bam.is_free(*location) for location in locations):
+            raise DiskFullError, "Tracks %d-%d are not free." % (track, last)
+        for location in locations:
+            self.bam.allocate(*location)
+        self.add_entry(name, PARTITION, (track, 0), len(locations))
+        self.flush()
+        
+        # The partition's own BAM has only its own tracks free.
+        part_desc = D81_Partition_Description(track, tracks)
+        disk = self.disk.view(part_desc)
+        if disk_id is None:
+            disk_id = self.disk_id
+        for (t, s), bytes in part_desc.header_sectors(name, disk_id):
+            disk.write_sector(t, s, bytes)
+        disk.write_sector(track, 3, '\x00\xff')
+        
+        bam = BlockAvailabilityMap.blank(part_desc)
+        for t, s in desc.locations:
+            if not track <= t <= last:
+                bam.allocate(t, s)
+        bam.write(disk)
+        
+        return self.open_partition(name)
+        
+
+class D81Partition(D81Disk):
+    """A 1581 sub-directory, read as a disk of its own.
+    
+    The partition is a view on the parent's `DiskImage`: the bytes are
+    shared, not copied, and changes to either are seen by both.
+    """
+    
+    def __init__(self, parent, entry):
+        self.parent = parent
+        self.entry = entry
+        desc = D81_Partition_Description(entry.track, 
+            entry.size // parent._desc.sectors_per_track[entry.track])
+        DosDisk.__init__(self, parent.disk.view(desc), 
+            image_type="1581 Partition")
+
+
+def build(files, disk_name='', disk_id=''):
+    """Return the bytes of a new 1581 disk image holding `files`, 
+    a list of (name, filetype, bytes) tuples. See `DiskBuilder`."""
+    return build_image(_desc, files, disk_name, disk_id)
 
 
-def load(filename):
-    with open(filename) as f:
-        return D81Disk(f.read())
+load = disk_loader(D81Disk, 'a 1581 disk')
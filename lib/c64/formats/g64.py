@@ -0,0 +1,283 @@
+"""This module provides support for reading "G64" (1541 GCR) disk images.
+
+A G64 image holds the raw GCR bit stream of each (half) track, as read
+from the disk surface. Tracks are decoded into sectors up front, giving
+a D64 image with error bytes for any sectors that could not be decoded;
+the result is read through the usual `DiskImage` and `DosDisk` classes.
+"""
+
+from __future__ import with_statement
+
+import re
+import struct
+
+from c64 import struct_doc
+from c64.formats.cbmdos import DosDisk, DiskImage, BYTES_PER_SECTOR,\
+    description_for_size
+from c64.formats import d64
+
+__all__ = ['G64Disk', 'G64FormatError', 'decode', 'encode', 'load']
+
+class G64FormatError(Exception): pass
+
+SIGNATURE = 'GCR-1541'
+
+STRUCT_HEADER = struct_doc('''
+<       # Little-endian
+8s      # Signature, "GCR-1541"
+B       # Version, 0
+B       # Number of half-tracks in the image
+H       # Maximum size of a track, in bytes
+''')
+
+# Each 4-bit nibble is written to disk as a 5-bit GCR code.
+GCR_ENCODE = (
+    0x0A, 0x0B, 0x12, 0x13, 0x0E, 0x0F, 0x16, 0x17,
+    0x09, 0x19, 0x1A, 0x1B, 0x0D, 0x1D, 0x1E, 0x15)
+
+# Decoding tables: `_DECODE_BYTE` maps a 10-bit pair of GCR codes
+# straight to the decoded byte (as a character), or to None for a code
+# that no byte encodes. `_BITS` gives the 8-character bit string of each
+# byte value, for converting a whole track in one go.
+_DECODE_BYTE = [None] * 1024
+for _hi in range(16):
+    for _lo in range(16):
+        _DECODE_BYTE[(GCR_ENCODE[_hi] << 5) | GCR_ENCODE[_lo]] = \
+            chr((_hi << 4) | _lo)
+_BITS = [''.join([str((i >> b) & 1) for b in range(7, -1, -1)])
+    for i in range(256)]
+
+# A sync mark is a run of at least 10 one-bits; a block starts with the
+# first zero bit after it.
+_SYNC = re.compile('1{10,}')
+
+HEADER_ID = 0x08
+DATA_ID = 0x07
+
+# Decoded lengths of the header block (ID, checksum, sector, track,
+# ID2, ID1, two $0F pads) and the data block (ID, sector data, checksum,
+# two pad bytes).
+HEADER_SIZE = 8
+DATA_SIZE = BYTES_PER_SECTOR + 4
+
+# Error bytes (see cbmdos.SECTOR_ERRORS) recorded for bad sectors.
+_NO_HEADER = 0x02
+_NO_DATA = 0x04
+_DATA_CHECKSUM = 0x05
+_BAD_GCR = 0x06
+_HEADER_CHECKSUM = 0x09
+
+# Speed zone and track length (in bytes) of each 1541 track group.
+_ZONES = (
+    # (first track, last track, speed zone, track length)
+    (1, 17, 3, 7692),
+    (18, 24, 2, 7142),
+    (25, 30, 1, 6666),
+    (31, 42, 0, 6250))
+
+MAX_TRACK_SIZE = 7928
+HALF_TRACKS = 84
+
+
+def _checksum(bytes):
+    value = 0
+    for c in bytes:
+        value ^= ord(c)
+    return value
+
+
+def _decode_bits(bits, start, length):
+    """Decode `length` bytes from the GCR bit string `bits`, starting
+    at bit `start`. Returns None if any code is invalid."""
+    end = start + length * 10
+    if end > len(bits):
+        return None
+    decode = _DECODE_BYTE
+    chars = [decode[int(bits[i:i+10], 2)] for i in xrange(start, end, 10)]
+    if None in chars:
+        return None
+    return ''.join(chars)
+
+
+def decode_track(track_bytes):
+    """Decode a raw GCR track.
+
+    Returns a dict mapping sector number to (error byte, bytes), where
+    bytes is the 256-byte sector data, or None if it could not be read.
+    The track number stored in each sector header is not checked.
+    """
+    bits = ''.join([_BITS[ord(c)] for c in track_bytes])
+    length = len(bits)
+
+    # The track is circular; a block may wrap around its end.
+    bits += bits[:DATA_SIZE * 10 + 80]
+
+    sectors = dict()
+    header = None
+    for m in _SYNC.finditer(bits):
+        if m.start() >= length:
+            break
+        start = m.end()
+        first = _decode_bits(bits, start, 1)
+
+        if first == chr(HEADER_ID):
+            block = _decode_bits(bits, start, HEADER_SIZE)
+            if block is None:
+                header = None
+                continue
+            header = ord(block[2])
+            if header in sectors:
+                continue
+            if _checksum(block[1:6]) != 0:
+                sectors[header] = (_HEADER_CHECKSUM, None)
+            else:
+                sectors[header] = (_NO_DATA, None)
+
+        elif first == chr(DATA_ID) and header is not None:
+            sector, header = header, None
+            if sectors[sector][0] != _NO_DATA:
+                continue
+            block = _decode_bits(bits, start, DATA_SIZE)
+            if block is None:
+                sectors[sector] = (_BAD_GCR, None)
+            elif _checksum(block[1:BYTES_PER_SECTOR + 2]) != 0:
+                sectors[sector] = (_DATA_CHECKSUM, block[1:-3])
+            else:
+                sectors[sector] = (1, block[1:-3])
+
+    return sectors
+
+
+def _read_tracks(bytes):
+    "Return a dict of full track number to raw track bytes."
+    if bytes[0:8] != SIGNATURE:
+        raise G64FormatError, "Not a G64 image."
+
+    (signature, version, half_tracks, max_size) =\
+        struct.unpack(STRUCT_HEADER, bytes[0:12])
+    offsets = struct.unpack('<%dL' % half_tracks,
+        bytes[12:12 + half_tracks * 4])
+
+    tracks = dict()
+    # Half-tracks between the full tracks are not read by CBM-DOS.
+    for i in range(0, half_tracks, 2):
+        ofs = offsets[i]
+        if ofs == 0:
+            continue
+        (size,) = struct.unpack('<H', bytes[ofs:ofs+2])
+        if size > max_size or ofs + 2 + size > len(bytes):
+            raise G64FormatError, "Track %d runs past end of image." % (
+                i // 2 + 1)
+        tracks[i // 2 + 1] = bytes[ofs+2:ofs+2+size]
+    return tracks
+
+
+def decode(bytes):
+    """Decode a G64 image into D64 image bytes, followed by one error
+    byte per sector. Returns (description, bytes).
+
+    The geometry used is the smallest 1541 geometry holding every track
+    with readable sectors.
+    """
+    decoded = dict((track, decode_track(raw))
+        for track, raw in _read_tracks(bytes).iteritems())
+
+    last_track = max([t for t, sectors in decoded.iteritems() if sectors]
+        or [0])
+    desc = [d for d in d64.GEOMETRIES if d.tracks >= last_track]
+    if not desc:
+        raise G64FormatError, "Track %d is beyond any 1541 geometry." % (
+            last_track,)
+    desc = desc[0]
+
+    blank = '\x00' * BYTES_PER_SECTOR
+    image = list()
+    errors = bytearray()
+    for track, sector in desc.locations:
+        error, data = decoded.get(track, {}).get(sector, (_NO_HEADER, None))
+        image.append(data or blank)
+        errors.append(error)
+
+    return desc, ''.join(image) + str(errors)
+
+
+def _encode_bytes(bytes):
+    "GCR-encode `bytes`, whose length must be a multiple of 4."
+    out = list()
+    for i in xrange(0, len(bytes), 4):
+        value = 0
+        for c in bytes[i:i+4]:
+            n = ord(c)
+            value = (value << 10) | (GCR_ENCODE[n >> 4] << 5) |\
+                GCR_ENCODE[n & 0x0F]
+        out.append(struct.pack('>BL', value >> 32, value & 0xFFFFFFFF))
+    return ''.join(out)
+
+
+def encode(bytes, disk_id=None):
+    """Return the bytes of a G64 image holding the sectors of the D64
+    image `bytes` (of any 1541 geometry; error bytes are ignored.)
+
+    Sector headers carry `disk_id`, by default the ID from the BAM.
+    """
+    desc = description_for_size(d64.GEOMETRIES, len(bytes))
+    if disk_id is None:
+        ofs = desc.block_number(*desc.DIRECTORY_HEADER) * BYTES_PER_SECTOR
+        disk_id = bytes[ofs + 0xA2:ofs + 0xA4]
+    id1, id2 = [ord(c) for c in disk_id[:2].ljust(2, '\xa0')]
+
+    sync = '\xff' * 5
+    tracks = list()
+    speeds = list()
+    for track in range(1, desc.tracks + 1):
+        zone, length = [(z, n) for first, last, z, n in _ZONES
+            if first <= track <= last][0]
+
+        blocks = list()
+        for sector in range(desc.sectors_per_track[track]):
+            ofs = (desc.track_offsets[track] + sector) * BYTES_PER_SECTOR
+            data = str(bytes[ofs:ofs + BYTES_PER_SECTOR])
+            header = struct.pack('8B', HEADER_ID,
+                sector ^ track ^ id2 ^ id1, sector, track, id2, id1,
+                0x0F, 0x0F)
+            blocks.extend([sync, _encode_bytes(header), '\x55' * 9,
+                sync, _encode_bytes(chr(DATA_ID) + data +
+                    chr(_checksum(data)) + '\x00\x00'), '\x55' * 8])
+        raw = ''.join(blocks)
+        tracks.append(raw + '\x55' * (length - len(raw)))
+        speeds.append(zone)
+
+    # Full tracks only; the half-tracks are left empty.
+    offsets = [0] * HALF_TRACKS
+    zones = [0] * HALF_TRACKS
+    ofs = 12 + HALF_TRACKS * 8
+    for i, raw in enumerate(tracks):
+        offsets[i * 2] = ofs
+        zones[i * 2] = speeds[i]
+        ofs += 2 + MAX_TRACK_SIZE
+
+    return ''.join([
+        struct.pack(STRUCT_HEADER, SIGNATURE, 0, HALF_TRACKS,
+            MAX_TRACK_SIZE),
+        struct.pack('<%dL' % HALF_TRACKS, *offsets),
+        struct.pack('<%dL' % HALF_TRACKS, *zones)] +
+        [struct.pack('<H', len(raw)) + raw.ljust(MAX_TRACK_SIZE, '\x00')
+            for raw in tracks])
+
+
+class G64Disk(DosDisk):
+    def __init__(self, bytes, lazy=False):
+        desc, image = decode(bytes)
+        DosDisk.__init__(self, DiskImage(desc, image),
+                image_type="1541 GCR Image", lazy=lazy)
+
+
+def load(filename, mapped=False, lazy=False):
+    """Load a G64 image from `filename`.
+
+    The image is always decoded into memory; `mapped` is accepted for
+    compatibility with the other loaders.
+    """
+    with open(filename, 'rb') as f:
+        bytes = f.read()
+    return G64Disk(bytes, lazy=lazy)
@@ -0,0 +1,153 @@
+"""This module provides support for GEOS files on CBM-DOS disks.
+
+GEOS files have an info block, holding the file's icon and descriptive
+text, and are either sequential or VLIR files. A VLIR file has an index
+block listing up to 127 records, each its own sector chain.
+"""
+
+import struct
+
+from c64 import struct_doc
+
+__all__ = ['GeosInfo', 'VlirFile', 'VlirFormatError']
+
+class VlirFormatError(Exception): pass
+
+"""
+  Byte: $00-01: Contains $00/$FF since its only 1 sector long
+         02-04: Information sector ID bytes (03 15 BF). The "03" is  likely
+                the bitmap width, and the "15" is likely the bitmap height,
+                but rare exceptions do exist to this!
+         05-43: Icon bitmap (sprite format, 63 bytes)
+            44: C64 filetype (same as that from the directory entry)
+            45: GEOS filetype (same as that from the directory entry)
+            46: GEOS file structure (same as that from the dir entry)
+         47-48: Program load address
+         49-4A: Program end address (only with accessories)
+         4B-4C: Program start address
+         4D-60: Class text (terminated with a $00)
+         61-74: Author (with application data: name  of  application  disk,
+                terminated with a $00. This string may not  necessarily  be
+                set, or it may contain invalid data)
+                The following GEOS files have authors:
+                  1 - BASIC
+                  2 - Assembler
+                  5 - Desk Accessory
+                  6 - Application
+                  9 - Printer Driver
+                 10 - Input Driver
+         75-88: If a document, the name of the application that created it.
+         89-9F: Available for applications, unreserved.
+         A0-FF: Description (terminated with a $00)
+"""
+
+STRUCT_INFO_BLOCK = struct_doc('''
+<       # Little-endian
+xx      # $00,$FF (no next sector, all bytes in this sector are valid data.)
+xxx     # ID bytes ($03 $15 $BF)
+63s     # Icon bitmap in sprite format
+B       # C64 filetype (same as in directory entry)
+B       # GEOS filetype (same as in directory entry)
+B       # GEOS file structure (same as in directory entry)
+H       # Program load address
+H       # Program end address (for accessories)
+H       # Program start address
+20s     # Class text
+20s     # Author
+20s     # Document Application
+23s     # Application specific
+96s     # Description
+''')
+
+
+# Size of the icon bitmap: 3 bytes (24 pixels) wide, 21 rows high.
+ICON_WIDTH = 3
+ICON_HEIGHT = 21
+
+
+def _c_string(s):
+    "Return `s` up to its terminating $00."
+    return s.split('\x00', 1)[0]
+
+
+class GeosInfo(object):
+    """A decoded GEOS info block."""
+    
+    def __init__(self, bytes):
+        bytes = str(bytes)
+        (self.icon, self.filetype, self.geos_type, self.structure, 
+            self.load_address, self.end_address, self.start_address, 
+            geos_class, author, application, self.application_data,
+            description) = struct.unpack(STRUCT_INFO_BLOCK, bytes)
+        
+        self.icon_size = (ord(bytes[2]), ord(bytes[3]))
+        self.geos_class = _c_string(geos_class)
+        self.author = _c_string(author)
+        self.application = _c_string(application)
+        self.description = _c_string(description)
+        
+    def icon_rows(self, on='#', off='.'):
+        "Return the icon bitmap as a list of strings, one per pixel row."
+        rows = list()
+        for y in range(ICON_HEIGHT):
+            row = self.icon[y * ICON_WIDTH:(y + 1) * ICON_WIDTH]
+            rows.append(''.join([(ord(c) >> b) & 1 and on or off
+                for c in row for b in range(7, -1, -1)]))
+        return rows
+        
+    def __str__(self):
+        return "<GEOS Info '%s' by '%s'>" % (self.geos_class, self.author)
+        
+
+class VlirFile(object):
+    """Gives random access to the records of a GEOS VLIR file.
+    
+    The index block is read once; each record is its own sector chain,
+    read from `disk` only when asked for. Missing records (listed as 
+    track 0 in the index) read as None.
+    """
+    
+    # The maximum number of records in the index block.
+    MAX_RECORDS = 127
+    
+    def __init__(self, disk, track, sector):
+        self.disk = disk
+        index = str(disk.get_sector(track, sector))
+        if index[0:2] != '\x00\xff':
+            raise VlirFormatError, "No VLIR index block at %s." % (
+                (track, sector),)
+        
+        # A track of 0 marks an empty record (sector $FF) or the end of
+        # the records (sector 0.)
+        self.locations = list()
+        for i in range(2, 2 + self.MAX_RECORDS * 2, 2):
+            t, s = ord(index[i]), ord(index[i+1])
+            if t == 0 and s == 0:
+                break
+            self.locations.append(t and (t, s) or None)
+            
+    def __len__(self):
+        return len(self.locations)
+        
+    def record(self, n):
+        "Return the bytes of record `n`, or None if it is empty."
+        location = self.locations[n]
+        if location is None:
+            return None
+        return self.disk.read_file(*location)
+        
+    __getitem__ = record
+    
+    def open_record(self, n):
+        "Return a `ChainReader` for record `n`, or None if it is empty."
+        location = self.locations[n]
+        if location is None:
+            return None
+        return self.disk.open_file(*location)
+        
+    def records(self):
+        "Yield the bytes of each record in turn (None for empty records.)"
+        for n in range(len(self)):
+            yield self.record(n)
+            
+    __iter__ = records
@@ -46,9 +46,17 @@ class FileContaner(object):
         be relied upon.
         
         Filenames are case-sensitive, unless `ignore_case` is 
-        passed as `True`.
+        passed as `True`. CBM-DOS wildcards (`*` and `?`) are allowed,
+        in which case the first matching entry is used.
         """
         raise FileNotFoundError
+        
+    def find_entries(self, pattern, ignore_case=False):
+        """Return a list of all entries matching `pattern`.
+        
+        Matching follows the same rules as `find`.
+        """
+        return list()
 
 
 # Entry formats are container-specific, as the entry will have properties
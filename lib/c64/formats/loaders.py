@@ -0,0 +1,41 @@
+"""This module maps image file names to the loader for their format.
+
+Images are matched by extension first. Images with an unknown extension
+are matched by their size, against the sizes of the known disk geometries.
+"""
+import os
+
+from c64.formats import d64, d71, d80, d81, g64, t64
+
+__all__ = ['LOADERS', 'get_loader', 'UnknownFormatError']
+
+class UnknownFormatError(Exception): pass
+
+LOADERS = (
+    ('.d64', d64.load),
+    ('.t64', t64.load),
+    ('.d71', d71.load),
+    ('.d80', d80.load),
+    ('.d81', d81.load),
+    ('.d82', d80.load),
+    ('.g64', g64.load),
+    )
+    
+# Image sizes of each disk geometry, with and without error bytes.
+SIZES = dict((size, module.load) 
+    for module in (d64, d71, d80, d81)
+    for desc in module.GEOMETRIES
+    for size in (desc.image_size, desc.error_image_size))
+
+def get_loader(image_name):
+    """Get a loader that can handle a given image type."""
+    for ext, loader in LOADERS:
+        if image_name.lower().endswith(ext):
+            return loader
+            
+    if os.path.isfile(image_name):
+        loader = SIZES.get(os.path.getsize(image_name))
+        if loader is not None:
+            return loader
+
+    raise UnknownFormatError, "Unknown image type '%s'" % (image_name, )
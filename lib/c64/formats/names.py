@@ -0,0 +1,75 @@
+"""Filename lookups for file containers.
+
+A `NameIndex` is built once over a container's entries, and supports
+exact, case-insensitive and CBM-DOS wildcard lookups.
+
+CBM-DOS wildcards work as in the drive's own pattern matching: `?`
+matches any single character, and `*` matches the rest of the name
+(anything in the pattern after a `*` is ignored.)
+"""
+import string
+
+__all__ = ['NameIndex', 'fold_case', 'has_wildcards', 'name_matches']
+
+# Fold both host lowercase ($61-$7A) and shifted PETSCII letters ($C1-$DA)
+# onto the unshifted PETSCII letters ($41-$5A).
+_FOLD_TABLE = string.maketrans(
+    string.ascii_lowercase + ''.join(chr(c) for c in range(0xC1, 0xDB)),
+    string.ascii_uppercase * 2)
+
+def fold_case(name):
+    "Return `name` with PETSCII and ASCII letters folded to one case."
+    return name.translate(_FOLD_TABLE)
+
+def has_wildcards(pattern):
+    return '*' in pattern or '?' in pattern
+
+def name_matches(pattern, name, ignore_case=False):
+    "Does `name` match the CBM-DOS style `pattern`?"
+    if ignore_case:
+        pattern = fold_case(pattern)
+        name = fold_case(name)
+        
+    for i, c in enumerate(pattern):
+        if c == '*':
+            return True
+        if i >= len(name):
+            return False
+        if c != '?' and c != name[i]:
+            return False
+    
+    return len(pattern) == len(name)
+
+
+class NameIndex(object):
+    """Index a list of entries by name.
+    
+    Each entry must have a `name` attribute. Lookups return a list of
+    all matching entries, in their original order.
+    """
+    
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._exact = dict()
+        self._folded = dict()
+        
+        for e in self.entries:
+            self._exact.setdefault(e.name, []).append(e)
+            self._folded.setdefault(fold_case(e.name), []).append(e)
+            
+    def lookup(self, pattern, ignore_case=False):
+        "Return a list of the entries matching `pattern`."
+        if has_wildcards(pattern):
+            return [e for e in self.entries 
+                if name_matches(pattern, e.name, ignore_case)]
+        
+        if ignore_case:
+            return list(self._folded.get(fold_case(pattern), ()))
+        
+        return list(self._exact.get(pattern, ()))
+        
+    def __contains__(self, name):
+        return name in self._exact
+        
+    def __len__(self):
+        return len(self.entries)
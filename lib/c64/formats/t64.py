@@ -1,8 +1,10 @@
 """This module provides support for reading "T64" tape images."""
 
 from __future__ import with_statement
+import mmap
 import struct
-from c64 import struct_doc, blocks
+from c64 import struct_doc, blocks, map_file
+from c64.formats.names import NameIndex
 
 class FileNotFoundError(Exception): pass
 class FormatError(Exception): pass
@@ -11,7 +13,7 @@ TAPE_HEADER = struct_doc('''
 <   # Little-endian
 xx  # Tape version, unused
 H   # Max no. of directory entries
-xx  # Used directory entries; non-normative
+H   # Used directory entries; non-normative
 xx  # Unused
 24s # Tape name
 ''')
@@ -28,15 +30,53 @@ xxxx # unused
 16s # Filename, PET-ASCII, $20 padded
 ''')
 
+# Offset of the directory, and the size of each of its entries.
+DIRECTORY_OFFSET = 0x40
+ENTRY_SIZE = 0x20
+
 
 class TapeEntry(object):
+    """A single T64 directory entry.
+    
+    As with disk directory entries, the bytes are only unpacked when one
+    of the decoded fields is first used. `length` is set by the `T64`
+    holding the entry, once it has checked the entry against the others.
+    """
+    
+    _FIELDS = frozenset(['c64s_filetype', 'filetype', 'start', 'end', 
+        'offset', 'raw_name', 'name'])
+    
     def __init__(self, bytes):
         self.bytes = bytes
         
-        self.c64s_filetype, self.filetype, self.start, self.end, self.offset, self.raw_name=\
-            struct.unpack(TAPE_ENTRY, bytes)
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set yet.
+        if name not in self._FIELDS:
+            raise AttributeError, name
+        
+        self._decode()
+        return self.__dict__[name]
+        
+    def _decode(self):
+        (self.c64s_filetype, self.filetype, self.start, self.end, 
+            self.offset, self.raw_name) = struct.unpack(TAPE_ENTRY, self.bytes)
             
         self.name = self.raw_name.strip()
+        
+    @property
+    def in_use(self):
+        "Is this entry used? (Checked without decoding.)"
+        return self.bytes[0] != '\x00'
+        
+    @property
+    def declared_length(self):
+        "The payload length given by the entry's load addresses."
+        return max(0, self.end - self.start)
+        
+    @property
+    def repaired(self):
+        "Was the length of this entry corrected by the tape?"
+        return self.length != self.declared_length
             
     def __str__(self):
         return self.name
@@ -46,41 +86,134 @@ class TapeEntry(object):
 
 
 class T64(object):
+    """A T64 tape image.
+    
+    Only the tape header is read up front; the directory is read the
+    first time the entries are used. Payloads are found from each entry's
+    `offset`, with a length from its load addresses that is checked 
+    against the image: see `_measure`. If the image is memory-mapped, 
+    `payload` returns buffers over the map rather than copies.
+    """
+    
     def __init__(self, bytes):
         self.image_type = "T64 Tape Container"
         self.bytes = bytes
+        self.zero_copy = isinstance(bytes, (mmap.mmap, bytearray))
         self._validate()
         
-        self.directory_size, self.raw_label =\
-            struct.unpack(TAPE_HEADER, bytes[0x20:0x40])
+        self.directory_size, self.entries_used, self.raw_label =\
+            struct.unpack(TAPE_HEADER, str(bytes[0x20:0x40]))
             
         self.label = self.raw_label.strip()
-        
-        self.entries = [
-            TapeEntry(x) for x in
-            blocks(self.bytes, 0x20, offset=0x40, max=self.directory_size) ]
+        self._raw_entries = None
+        self._name_index = None
         
     def _validate(self):
-        if not self.bytes.startswith('C64'):
+        if self.bytes[0:3] != 'C64':
             raise FormatError, "Invalid tape file."
             
     def __str__(self):
         return ", ".join(
             str(x) for x in 
-            [self.directory_size, self.directory_entries, self.label] )
+            [self.directory_size, self.entries_used, self.label] )
+
+    @property
+    def raw_entries(self):
+        "All directory slots, used or not."
+        if self._raw_entries is None:
+            # Tapes often claim no, or too many, entries; read at least
+            # one, and stop where the directory runs into a payload.
+            count = max(1, self.directory_size)
+            first_payload = len(self.bytes)
+            self._raw_entries = list()
+            for x in blocks(self.bytes, ENTRY_SIZE, offset=DIRECTORY_OFFSET, 
+                    max=count):
+                ofs = DIRECTORY_OFFSET + len(self._raw_entries) * ENTRY_SIZE
+                if ofs + ENTRY_SIZE > first_payload:
+                    break
+                e = TapeEntry(str(x))
+                if e.in_use and e.offset >= ofs + ENTRY_SIZE:
+                    first_payload = min(first_payload, e.offset)
+                self._raw_entries.append(e)
+            self._measure([e for e in self._raw_entries if e.in_use])
+        return self._raw_entries
+        
+    @property
+    def entries(self):
+        "The used directory entries."
+        return [e for e in self.raw_entries if e.in_use]
+        
+    @property
+    def name_index(self):
+        if self._name_index is None:
+            self._name_index = NameIndex(self.entries)
+        return self._name_index
+        
+    def _measure(self, entries):
+        """Set the `length` of each of `entries`.
+        
+        The declared length (end - start address) is trusted as far as
+        the next payload in the image, or the end of the image; many
+        converters wrote a bogus end address. Sorting by offset, then one
+        backward pass finds the next higher payload offset of every entry.
+        """
+        size = len(self.bytes)
+        directory_end = DIRECTORY_OFFSET + len(self._raw_entries) * ENTRY_SIZE
+        ordered = sorted(entries, key=lambda e: e.offset)
+        
+        # `bound` is the next offset above the current one, and `above`
+        # the offset of the entry after the current one.
+        bound = above = size
+        for e in reversed(ordered):
+            if e.offset < above:
+                bound = min(above, size)
+            above = e.offset
+            
+            if not directory_end <= e.offset < size:
+                e.length = 0
+                continue
+                
+            e.length = min(e.declared_length, bound - e.offset)
+            if e.end <= e.start:
+                # No usable end address; take everything up to the bound.
+                e.length = bound - e.offset
+                
+    def payload(self, e):
+        """Return the bytes of entry `e`; a buffer over the image if it
+        is memory-mapped."""
+        self.raw_entries
+        if self.zero_copy:
+            return buffer(self.bytes, e.offset, e.length)
+        return self.bytes[e.offset:e.offset + e.length]
 
     def file(self, i):
         """Return file bytes for entry at index i."""
-        e = self.entries[i]
-        return self.bytes[e.start:e.end+1]
+        return str(self.payload(self.entries[i]))
+        
+    def find_entries(self, pattern, ignore_case=False):
+        """Return a list of all entries matching `pattern`.
+        
+        `pattern` may contain CBM-DOS wildcards (`*` and `?`).
+        """
+        return self.name_index.lookup(pattern, ignore_case)
         
     def find(self, filename, ignore_case=False):
-        for e in self.entries:
-            if e.name == filename:
-                return self.bytes[e.start:e.end+1]
-        raise FileNotFoundError, 'File "%s" not found on tape.' % (filename)
+        """Return file bytes for the first entry matching `filename`."""
+        found = self.name_index.lookup(filename, ignore_case)
+        if not found:
+            raise FileNotFoundError, 'File "%s" not found on tape.' % (filename)
+        
+        return str(self.payload(found[0]))
+
 
+def load(filename, mapped=False):
+    """Load a tape image from `filename`.
+    
+    If `mapped` is True, the image is memory-mapped rather than read
+    into memory, and `payload` returns buffers over the map.
+    """
+    if mapped:
+        return T64(map_file(filename))
 
-def load(filename):
-    with open(filename) as f:
+    with open(filename, 'rb') as f:
         return T64(f.read())
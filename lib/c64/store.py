@@ -0,0 +1,331 @@
+"""A content-addressable store for disk images.
+
+Images are split into chunks, and each unique chunk is kept once, named
+by its SHA-1 hash. Every file on a disk is stored as a single chunk, 
+along with the blocks of its sector chain; the link bytes of each sector
+follow from the chain, so the same files laid out in a different order,
+or under different names, still share their storage. All remaining
+sectors (directory, BAM, unused space) are stored as sector-sized 
+chunks. Small chunks are appended to a pack file, rather than each
+taking a file of its own.
+
+A manifest per image records how to put the chunks back together, and
+`ImageStore.rebuild` returns the original bytes exactly. Runs of blocks
+are run-length encoded in the manifest: a chain is a list of block 
+numbers and [first block, count] runs, and the sectors are a list of
+['f', count] runs (blocks rebuilt from file chains) and ['s', hash, 
+count] runs (repeats of one chunk).
+"""
+from __future__ import with_statement
+
+import hashlib
+import json
+import os
+import tempfile
+
+from c64 import blocks
+from c64.formats.cbmdos import BYTES_PER_SECTOR, DATA_BYTES_PER_SECTOR
+from c64.formats.loaders import get_loader
+from c64.formats.petscii import petscii_str
+
+__all__ = ['ChunkStore', 'ImageStore', 'ChunkNotFoundError']
+
+class ChunkNotFoundError(Exception): pass
+
+def _hash(bytes):
+    return hashlib.sha1(bytes).hexdigest()
+
+def _write_atomic(filename, bytes):
+    "Write a file under a temporary name, then rename it into place."
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bytes)
+        os.rename(temp, filename)
+    except:
+        os.remove(temp)
+        raise
+
+
+class ChunkStore(object):
+    """A directory of chunks, each stored once and named by its hash.
+    
+    Chunks shorter than `PACK_LIMIT` bytes are appended to a single pack
+    file, and their hash, offset and length to its index; larger chunks
+    get a file each. Only one process should write to a store at a time.
+    """
+    
+    PACK_LIMIT = 4096
+    
+    def __init__(self, root):
+        self.root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        self._pack_path = os.path.join(root, 'pack')
+        self._index_path = os.path.join(root, 'pack.idx')
+        self._index = None
+            
+    def _path(self, chunk_hash):
+        return os.path.join(self.root, chunk_hash[:2], chunk_hash[2:])
+        
+    @property
+    def index(self):
+        "A dict of packed chunk hash to (offset, length) in the pack."
+        if self._index is None:
+            self._index = dict()
+            if os.path.exists(self._index_path):
+                with open(self._index_path, 'rb') as f:
+                    for line in f:
+                        # A line cut short by a crash is ignored; its 
+                        # chunk will be packed again.
+                        fields = line.split()
+                        if len(fields) == 3 and line.endswith('\n'):
+                            self._index[fields[0]] = (
+                                int(fields[1]), int(fields[2]))
+        return self._index
+        
+    def _pack(self, chunk_hash, bytes):
+        # The chunk is written before its index line, so the index never
+        # names bytes that aren't in the pack.
+        with open(self._pack_path, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(bytes)
+        with open(self._index_path, 'ab') as f:
+            f.write('%s %d %d\n' % (chunk_hash, offset, len(bytes)))
+        self.index[chunk_hash] = (offset, len(bytes))
+        
+    def put(self, bytes):
+        "Store `bytes` if they aren't already stored; return their hash."
+        bytes = str(bytes)
+        chunk_hash = _hash(bytes)
+        if chunk_hash in self:
+            return chunk_hash
+        if len(bytes) < self.PACK_LIMIT:
+            self._pack(chunk_hash, bytes)
+        else:
+            path = self._path(chunk_hash)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            _write_atomic(path, bytes)
+        return chunk_hash
+        
+    def get(self, chunk_hash):
+        if chunk_hash in self.index:
+            offset, length = self.index[chunk_hash]
+            with open(self._pack_path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+        try:
+            with open(self._path(chunk_hash), 'rb') as f:
+                return f.read()
+        except IOError:
+            raise ChunkNotFoundError, 'Chunk %s not in store.' % (chunk_hash,)
+            
+    def __contains__(self, chunk_hash):
+        return chunk_hash in self.index or os.path.exists(self._path(chunk_hash))
+
+
+def _encode_blocks(numbers):
+    "Run-length encode a list of block numbers; see the module notes."
+    runs = list()
+    for n in numbers:
+        if runs and isinstance(runs[-1], list) and\
+                runs[-1][0] + runs[-1][1] == n:
+            runs[-1][1] += 1
+        elif runs and not isinstance(runs[-1], list) and runs[-1] + 1 == n:
+            runs[-1] = [runs[-1], 2]
+        else:
+            runs.append(n)
+    return runs
+    
+def _decode_blocks(runs):
+    "Return the list of block numbers from `_encode_blocks` runs."
+    numbers = list()
+    for x in runs:
+        if isinstance(x, list):
+            numbers.extend(range(x[0], x[0] + x[1]))
+        else:
+            numbers.append(x)
+    return numbers
+
+def _chain_sectors(locations, chain, data):
+    """Return a dict of block number to the sector rebuilt for it, for
+    the file `data` stored along the blocks of `chain`. `locations` maps
+    block numbers to (track, sector), for the link bytes."""
+    sectors = dict()
+    for n, block in enumerate(chain):
+        chunk = data[n*DATA_BYTES_PER_SECTOR:(n+1)*DATA_BYTES_PER_SECTOR]
+        if n + 1 < len(chain):
+            link = '%c%c' % locations[chain[n + 1]]
+        else:
+            link = '\x00%c' % (min(len(chunk) + 1, 0xFF),)
+        sectors.setdefault(block, (link + chunk).ljust(BYTES_PER_SECTOR, '\x00'))
+    return sectors
+
+
+class ImageStore(object):
+    """Deduplicated storage for a collection of disk and tape images.
+    
+    Images are identified by the SHA-1 hash of their bytes.
+    """
+    
+    def __init__(self, root):
+        self.root = root
+        self.chunks = ChunkStore(os.path.join(root, 'chunks'))
+        self._manifests = os.path.join(root, 'manifests')
+        if not os.path.isdir(self._manifests):
+            os.makedirs(self._manifests)
+            
+    def _manifest_path(self, image_hash):
+        return os.path.join(self._manifests, image_hash + '.json')
+        
+    def __contains__(self, image_hash):
+        return os.path.exists(self._manifest_path(image_hash))
+        
+    def add(self, filename):
+        """Store the image in `filename`, and return its hash."""
+        with open(filename, 'rb') as f:
+            bytes = f.read()
+            
+        image_hash = _hash(bytes)
+        if image_hash in self:
+            return image_hash
+            
+        d = get_loader(filename)(filename, mapped=True)
+        manifest = None
+        if hasattr(d, 'disk') and self._is_sector_image(d, bytes):
+            manifest = self._chunk_disk(d, bytes)
+            manifest['size'] = len(bytes)
+            if _hash(self._assemble(manifest)) != image_hash:
+                manifest = None
+                
+        if manifest is None:
+            # Containers without sectors, or whose file isn't the sector
+            # image (such as G64), are chunked in sector-sized blocks.
+            manifest = dict(files=[], sectors=[['s', self.chunks.put(x), 1] 
+                for x in blocks(bytes, BYTES_PER_SECTOR)], tail=None,
+                size=len(bytes))
+            
+        # Never record an image that can't be given back.
+        if _hash(self._assemble(manifest)) != image_hash:
+            raise ChunkNotFoundError, 'Image %s did not rebuild correctly.' % (
+                image_hash,)
+        _write_atomic(self._manifest_path(image_hash), json.dumps(manifest))
+        return image_hash
+        
+    def _is_sector_image(self, d, bytes):
+        "Are the sectors of disk `d` the start of the file `bytes`?"
+        size = d.disk._desc.image_size
+        return len(bytes) >= size and str(d.disk.bytes[:size]) == bytes[:size]
+        
+    def _chunk_disk(self, d, bytes):
+        desc = d.disk._desc
+        
+        # Rebuild each sector of a readable file chain from the file,
+        # keeping the first file to claim a block.
+        rebuilt = dict()
+        files = list()
+        for i, e in enumerate(d.entries):
+            try:
+                data = d.file(i)
+                chain = [desc.block_number(e.track, e.sector)] + [
+                    desc.block_number(t, s)
+                    for raw_bytes, t, s in d.disk.walk_sectors(e.track, e.sector)
+                    if t > 0]
+            except Exception:
+                continue
+                
+            files.append([petscii_str(e.name), self.chunks.put(data), 
+                _encode_blocks(chain)])
+            for block, sector in _chain_sectors(desc.locations, chain, data).iteritems():
+                rebuilt.setdefault(block, sector)
+                    
+        sectors = list()
+        for block, location in enumerate(desc.locations):
+            sector = str(d.disk.get_sector(*location))
+            if rebuilt.get(block) == sector:
+                run = ['f', 1]
+            else:
+                run = ['s', self.chunks.put(sector), 1]
+            if sectors and sectors[-1][:-1] == run[:-1]:
+                sectors[-1][-1] += 1
+            else:
+                sectors.append(run)
+        
+        # The geometry, as [sectors per track, number of tracks] runs, 
+        # gives the locations that the chains' link bytes point to.
+        geometry = list()
+        for count in desc.sectors_per_track[1:]:
+            if geometry and geometry[-1][0] == count:
+                geometry[-1][1] += 1
+            else:
+                geometry.append([count, 1])
+        
+        # Anything after the last sector (such as error bytes) is kept as is.
+        tail = bytes[desc.total_sectors * BYTES_PER_SECTOR:]
+        return dict(files=files, sectors=sectors, geometry=geometry,
+            tail=self.chunks.put(tail) if tail else None)
+        
+    def manifest(self, image_hash):
+        with open(self._manifest_path(image_hash), 'rb') as f:
+            return json.load(f)
+            
+    def files(self, image_hash):
+        "Return a list of (name, file hash) for the files in an image."
+        return [tuple(x[:2]) for x in self.manifest(image_hash)['files']]
+        
+    def chunk_hashes(self, image_hash):
+        "Return the set of chunk hashes an image is built from."
+        m = self.manifest(image_hash)
+        hashes = set(x[1] for x in m['sectors'] if x[0] == 's')
+        hashes.update(x[1] for x in m['files'])
+        if m['tail']:
+            hashes.add(m['tail'])
+        return hashes
+        
+    def rebuild(self, image_hash):
+        "Return the original bytes of a stored image."
+        bytes = self._assemble(self.manifest(image_hash))
+        if _hash(bytes) != image_hash:
+            raise ChunkNotFoundError, 'Image %s did not rebuild correctly.' % (
+                image_hash,)
+        return bytes
+        
+    def _assemble(self, m):
+        "Return the bytes put together from the manifest `m`."
+        cache = dict()
+        def chunk(h):
+            if h not in cache:
+                cache[h] = self.chunks.get(h)
+            return cache[h]
+            
+        rebuilt = dict()
+        if m['files']:
+            counts = list()
+            for count, tracks in m['geometry']:
+                counts.extend([count] * tracks)
+            locations = [(t + 1, s) for t, count in enumerate(counts) 
+                for s in range(count)]
+            for name, file_hash, chain in m['files']:
+                for block, sector in _chain_sectors(locations, 
+                        _decode_blocks(chain), chunk(file_hash)).iteritems():
+                    rebuilt.setdefault(block, sector)
+            
+        parts = list()
+        for x in m['sectors']:
+            if x[0] == 's':
+                parts.extend([chunk(x[1])] * x[2])
+            else:
+                first = len(parts)
+                parts.extend([rebuilt[block] for block in 
+                    range(first, first + x[1])])
+                    
+        if m['tail']:
+            parts.append(chunk(m['tail']))
+            
+        bytes = ''.join(parts)
+        if len(bytes) != m['size']:
+            raise ChunkNotFoundError, 'Image did not rebuild to %d bytes.' % (
+                m['size'],)
+        return bytes
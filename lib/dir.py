@@ -3,9 +3,17 @@ from __future__ import with_statement
 
 import sys
 import os
+import csv
+import glob
+import json
+import multiprocessing
 
-from c64.formats import d64, d81, t64, basic
-from c64.formats.cbmdos import GEOS_FILE_TYPES
+from c64.diff import diff_disks
+from c64.formats import basic
+from c64.formats.loaders import LOADERS, get_loader
+from c64.formats.cbmdos import FILE_TYPES, GEOS_FILE_TYPES
+from c64.formats.check import check_disk
+from c64.formats.petscii import petscii_str
 
 USAGE = """
 List the contents of a 1541 (d64) or 1581 (d81) disk image.
@@ -21,14 +29,18 @@ Extract a file from the image:
     
 Extract a single track/sector (such as a bootsector):
     ./dir.py <disk image name> -s1,0 -e
+    
+Compare two disk images:
+    ./dir.py --diff <disk image name> <other disk image name>
+    
+Check disk images for consistency:
+    ./dir.py --check <disk image name> ...
+    
+List (or, with --check, check) many images at once, given directories 
+or glob patterns:
+    ./dir.py --bulk [--check] [--jobs N] [--format json|csv] <path or pattern> ...
 """
 
-_loaders = (
-    ('.d64', d64.load),
-    ('.t64', t64.load),
-    ('.d81', d81.load),
-    )
-    
 
 def parse_args():
     from optparse import OptionParser
@@ -44,18 +56,29 @@ def parse_args():
         dest='sector',
         help='Track,sector to extract from a disk image.')
         
+    op('-d', '--diff',
+        action='store_true',
+        help='Compare two disk images by sector, directory entry and file.')
+        
+    op('-c', '--check',
+        action='store_true',
+        help='Check images for cross-linked files, BAM errors and bad chains.')
+        
+    op('-b', '--bulk',
+        action='store_true',
+        help='List every image found in the given directories or patterns.')
+        
+    op('-j', '--jobs',
+        type='int', default=0,
+        help='Number of worker processes for --bulk (default: one per CPU.)')
+        
+    op('-f', '--format',
+        choices=('json', 'csv'), default='json',
+        help='Output format for --bulk: JSON lines, or CSV with one row per entry.')
+        
     return p.parse_args()
 
 
-def get_loader(image_name):
-    """Get a loader that can handle a given image type."""
-
-    for ext, loader in _loaders:
-        if image_name.lower().endswith(ext):
-            return loader
-
-    raise Exception, "Unknown image type '%s'" % (image_name, )
-
 def directory(image_name):
     loader = get_loader(image_name)
     d = loader(image_name)
@@ -78,6 +101,134 @@ def directory(image_name):
         print
         print d.disk.bootsector
 
+def find_images(paths):
+    """Yield image file names from a list of files, directories and 
+    glob patterns. Directories are searched recursively for files with a
+    known image extension."""
+    extensions = tuple(ext for ext, loader in LOADERS)
+    for path in paths:
+        for name in (glob.glob(path) or [path]):
+            if not os.path.isdir(name):
+                yield name
+                continue
+                
+            for root, dirs, files in os.walk(name):
+                dirs.sort()
+                for f in sorted(files):
+                    if f.lower().endswith(extensions):
+                        yield os.path.join(root, f)
+
+def scan_image(image_name):
+    """Return a dict describing the header and directory of one image.
+    
+    Errors are captured in the 'error' key instead of being raised, so a
+    bad image doesn't stop a bulk scan.
+    """
+    result = dict(image=image_name, error=None, entries=[])
+    try:
+        d = get_loader(image_name)(image_name, mapped=True)
+        result['image_type'] = d.image_type
+        result['name'] = petscii_str(
+            d.disk_name if hasattr(d, 'disk_name') else d.label)
+        result['id'] = petscii_str(getattr(d, 'disk_id', ''))
+        if hasattr(d, 'disk'):
+            result['sector_errors'] = d.disk.error_summary()
+        
+        # 1581 disks are listed with the files in their sub-directories,
+        # named by their path.
+        if hasattr(d, 'walk'):
+            listing = d.walk()
+        else:
+            listing = (((), e) for e in d.entries)
+            
+        for path, e in listing:
+            result['entries'].append(dict(
+                name='/'.join(petscii_str(x) for x in path + (e.name,)),
+                size=getattr(e, 'size', 0),
+                type=FILE_TYPES.get(e.filetype & 0x07, '???'),
+                geos_type=getattr(e, 'geos_type', 0)))
+    except Exception, e:
+        result['error'] = '%s: %s' % (e.__class__.__name__, e)
+        
+    return result
+
+_CSV_FIELDS = ('image', 'image_type', 'name', 'id', 
+    'entry', 'entry_name', 'size', 'type', 'geos_type', 'error')
+
+def write_csv(writer, result):
+    image = [result.get(x, '') for x in _CSV_FIELDS[:4]]
+    if not result['entries']:
+        writer.writerow(image + ['', '', '', '', '', result['error'] or ''])
+        
+    for i, e in enumerate(result['entries']):
+        writer.writerow(image + 
+            [i+1, e['name'], e['size'], e['type'], e['geos_type'], 
+                result['error'] or ''])
+
+def check_image(image_name):
+    """Return a dict listing the consistency problems found on one image.
+    
+    As with `scan_image`, errors are captured in the 'error' key. 
+    Containers without sectors, such as tapes, have nothing to check, and
+    are returned with 'checked' set to False.
+    """
+    result = dict(image=image_name, error=None, problems=[], checked=False)
+    try:
+        d = get_loader(image_name)(image_name, mapped=True)
+        if hasattr(d, 'disk'):
+            result['problems'] = check_disk(d).problems()
+            result['checked'] = True
+    except Exception, e:
+        result['error'] = '%s: %s' % (e.__class__.__name__, e)
+        
+    return result
+    
+def write_check_csv(writer, result):
+    if not result['checked'] and not result['error']:
+        return
+    for problem in result['problems'] or ['']:
+        writer.writerow([result['image'], problem, result['error'] or ''])
+
+def bulk_directory(paths, jobs=0, format='json', out=sys.stdout, check=False):
+    """Scan all images found in `paths` across a pool of worker processes,
+    writing each result to `out` as soon as it is ready.
+    
+    If `check` is True, images are checked for consistency (see 
+    `check_image`) instead of being listed.
+    """
+    images = find_images(paths)
+    scan = check_image if check else scan_image
+    
+    if format == 'csv':
+        writer = csv.writer(out)
+        if check:
+            writer.writerow(('image', 'problem', 'error'))
+            write = lambda r: write_check_csv(writer, r)
+        else:
+            writer.writerow(_CSV_FIELDS)
+            write = lambda r: write_csv(writer, r)
+    else:
+        write = lambda r: out.write(json.dumps(r) + '\n')
+    
+    if jobs == 1:
+        for r in (scan(x) for x in images):
+            write(r)
+            out.flush()
+        return
+        
+    pool = multiprocessing.Pool(jobs or None)
+    try:
+        for r in pool.imap_unordered(scan, images, chunksize=16):
+            write(r)
+            out.flush()
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+        
 def extract_file(filename, bytes):
     outname = filename.strip() + '.prg'
     if os.path.exists(outname):
@@ -101,7 +252,8 @@ def show_basic(filename, bytes):
     print "Load address: %s %s" % (prg.load_address, msg_address)
 
     if prg.verify():
-        print prg.list()
+        prg.write_listing(sys.stdout)
+        print
     else:
         print 'Warnings (use --xxx to force listing):'
         print '\n'.join(prg.errors)
@@ -137,6 +289,25 @@ def show_file(image_name, options, args):
 
 def main():
     options, args = parse_args()
+    if options.bulk:
+        bulk_directory(args, options.jobs, options.format, check=options.check)
+        return
+        
+    if options.check:
+        for image_name in args:
+            d = get_loader(image_name)(image_name)
+            print '%s:' % (image_name,)
+            print check_disk(d)
+        return
+        
+    if options.diff:
+        if len(args) != 2:
+            print USAGE
+            return
+        a, b = [get_loader(x)(x, mapped=True) for x in args]
+        print diff_disks(a, b)
+        return
+        
     image_name = args.pop(0)
     
     show_dir = (len(args) == 0) and (not options.sector)
@@ -5,3 +5,20 @@ from tests.formatbytes import *
 from tests.petscii import *
 from tests.t64 import *
 from tests.d81 import *
+from tests.geometry import *
+from tests.names import *
+from tests.diskwrite import *
+from tests.build import *
+from tests.chainreader import *
+from tests.catalog import *
+from tests.store import *
+from tests.diff import *
+from tests.check import *
+from tests.geometries import *
+from tests.errorbytes import *
+from tests.g64 import *
+from tests.rel import *
+from tests.geos import *
+from tests.partition import *
+from tests.basic import *
+from tests.tokenizer import *
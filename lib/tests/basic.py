@@ -0,0 +1,121 @@
+"Unit tests for the BASIC detokenizer."
+from __future__ import with_statement
+
+import unittest
+from StringIO import StringIO
+from c64.formats import basic
+
+
+def program(lines, load_address=0x0801):
+    "Return the bytes of a tokenized program of (number, bytes) lines."
+    out = [chr(load_address & 0xFF), chr(load_address >> 8)]
+    address = load_address
+    for number, bytes in lines:
+        address += 5 + len(bytes)
+        out.extend([chr(address & 0xFF), chr(address >> 8),
+            chr(number & 0xFF), chr(number >> 8), bytes, '\x00'])
+    out.append('\x00\x00')
+    return ''.join(out)
+
+
+class BasicTests(unittest.TestCase):
+    def test_tokens_and_quotes(self):
+        # PRINT "PRINT{clr}" : GOTO 10 -- the token is only expanded
+        # outside of the quotes.
+        b = basic.Basic(program([
+            (10, '\x99 "\x99\x93":\x89 10'),
+            (20, '\x80')]))
+        self.assert_(b.verify())
+        self.assertEquals(
+            '10 print "{lgreen}{clr}":goto 10\n20 end', b.list())
+        self.assertEquals([11 + 5, 1 + 5], 
+            [l.byte_count for l in b.listing])
+        self.failIf(any(l.unknown_opcode for l in b.listing))
+        
+    def test_unknown_token(self):
+        b = basic.Basic(program([(10, '\xcc"\xcc"')]))
+        self.assertEquals('10 {UNKNOWN}"{$cc}"', b.list())
+        self.assert_(b.listing[0].unknown_opcode)
+        
+    def test_unterminated(self):
+        b = basic.Basic('\x01\x08\x09\x08\x0a\x00\x99 "A')
+        self.assertEquals('10 print "A', b.list())
+        self.assertEquals(8, b.listing[0].byte_count)
+        
+    def test_ml_bytes(self):
+        b = basic.Basic(program([(10, '\x9e2061')]) + '\xa9\x00')
+        self.assertEquals('10 sys2061\n\n2 more bytes beyond end of '
+            'BASIC program:\na9 00', b.list())
+        
+    def test_order(self):
+        b = basic.Basic(program([(20, '\x80'), (10, '\x80')]))
+        self.failIf(b.verify())
+
+        
+    def test_lines(self):
+        b = basic.Basic(program([(10, '\x80'), (20, '\x99')]) + '\xa9')
+        lines = b.lines()
+        self.assertEquals('10 end', lines.next().line)
+        self.assertEquals(20, lines.next().line_number)
+        self.assertRaises(StopIteration, lines.next)
+        self.assertEquals('\xa9', b.ml_bytes)
+        self.assertEquals('20 print', b.find_line(20).line)
+        self.assertEquals(None, b.find_line(30))
+        
+    def test_verify_stops_early(self):
+        # The second line is out of order, and the rest is garbage that
+        # would fail to decode.
+        b = basic.Basic(program([(20, '\x80'), (10, '\x80')])[:-2] + '\x01')
+        self.failIf(b.verify())
+        self.assertEquals(
+            ['Program lines are not in order (10 follows 20).'], b.errors)
+        
+    def test_write_listing(self):
+        b = basic.Basic(program([(10, '\x9e2061')]) + '\xa9\x00')
+        f = StringIO()
+        b.write_listing(f)
+        self.assertEquals(b.list(), f.getvalue())
+
+
+class DialectTests(unittest.TestCase):
+    def test_basic7(self):
+        # BANK 1 : PRINT POT(1) -- FE and CE prefix two-byte tokens.
+        b = basic.Basic(program([(10, '\xfe\x02 1:\x99 \xce\x02(1)'),
+            (20, '\xfe\x7f')], 0x1c01))
+        self.assertEquals("Basic 7", b.version.format)
+        self.assertEquals('10 bank 1:print pot(1)\n20 {UNKNOWN}', b.list())
+        self.assert_(b.listing[1].unknown_opcode)
+        
+    def test_simons(self):
+        b = basic.Basic(program([(10, '\x64\x01 0,1:\x99 "\x64\x01"'),
+            (20, '\x64\x02 1,1,1:\x64\x03 1,1,9,9,1')]))
+        self.assertEquals("Simons' Basic", b.version.format)
+        self.assertEquals('10 hires 0,1:print "{$64}{$01}"\n'
+            '20 plot 1,1,1:line 1,1,9,9,1', b.list())
+        
+    def test_detection(self):
+        # Plain BASIC 2 stays BASIC 2, even with stray prefix characters.
+        b = basic.Basic(program([(10, '\x99 "\x64\x01":\x99 \x64\x80')]))
+        self.assertEquals("Basic 2", b.version.format)
+        # So does BASIC 2 loaded elsewhere, with one pair that matches a
+        # Simons' Basic token.
+        b = basic.Basic(program([(10, '\x99 \x64\x01'), (20, '\x80')], 0x1001))
+        self.assertEquals("Basic 2", b.version.format)
+        b = basic.Basic(program([(10, '\x99 1')], 0x1c01))
+        self.assertEquals("Basic 7", b.version.format)
+        b = basic.Basic(program([(10, '\xfe\x02 1')]), 
+            version=basic.VERSIONS[0])
+        self.assertEquals('10 {UNKNOWN}{$02} 1', b.list())
+        
+    def test_detection_reads_start(self):
+        # Only the start of the program is read; a pair past it doesn't
+        # count.
+        lines = [(i, '\x99 1') for i in range(basic.DETECT_SIZE // 8)]
+        b = basic.Basic(program(lines + [(10000, '\x64\x01')]))
+        self.assertEquals("Basic 2", b.version.format)
+        b = basic.Basic(program([(1, '\x64\x01:\x64\x02:\x64\x03')] + lines))
+        self.assertEquals("Simons' Basic", b.version.format)
+
+
+if __name__ == "__main__":
+    unittest.main()
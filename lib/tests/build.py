@@ -0,0 +1,49 @@
+"Unit tests for building whole disk images."
+from __future__ import with_statement
+
+import unittest
+from c64.formats import d64, d81
+from c64.formats.cbmdos import DiskFullError
+
+
+def sample_files(n):
+    return [('FILE %d' % i, 2, ''.join(chr(j % 256) for j in range(i * 100)))
+        for i in range(n)]
+
+
+class BuildTests(unittest.TestCase):
+    def test_empty_d64(self):
+        d = d64.D64Disk(d64.build([], 'EMPTY', 'ID'))
+        self.assertEquals('EMPTY', d.disk_name)
+        self.assertEquals('ID', d.disk_id)
+        self.assertEquals(0, len(d.entries))
+        self.assertEquals(664, d.bam.blocks_free)
+        
+    def test_empty_d81(self):
+        d = d81.D81Disk(d81.build([], 'EMPTY', 'ID'))
+        self.assertEquals('EMPTY', d.disk_name)
+        self.assertEquals(3160, d.bam.blocks_free)
+        
+    def test_files(self):
+        files = sample_files(20)
+        d = d64.D64Disk(d64.build(files, 'FILES', '01'))
+        self.assertEquals(3, len(d.directory_sectors))
+        self.assertEquals([f[0] for f in files], [e.name for e in d.entries])
+        for i, (name, filetype, bytes) in enumerate(files):
+            self.assertEquals(bytes, d.file(i))
+            
+        used = sum(e.size for e in d.entries)
+        self.assertEquals(664 - used, d.bam.blocks_free)
+        
+    def test_bam_consistent(self):
+        d = d81.D81Disk(d81.build(sample_files(30)))
+        for t in range(1, 81):
+            self.assertEquals(d.bam.free_counts[t], d.bam.free_on_track(t))
+        
+    def test_full(self):
+        self.assertRaises(DiskFullError, 
+            d64.build, [('BIG', 2, 'x' * 254 * 700)])
+
+
+if __name__ == "__main__":
+    unittest.main()  
@@ -79,6 +79,39 @@ class ByteStreamTests(unittest.TestCase):
         r = b.rest()
         self.assertEquals('vandenberg', r)
 
+    def test_words(self):
+        b = ByteStream(self.sample_bytes)
+        self.assertEquals((2*256+1, 4*256+3), b.words(2))
+        self.assertEquals(6*256+5, b.word())
+        self.assertRaises(IndexError, b.word)
+        self.assertEquals((), b.words(0))
+        self.assertRaises(IndexError, b.words, 1)
+        
+    def test_bytes_array(self):
+        b = ByteStream(bytearray(self.sample_bytes))
+        self.assertEquals(1, b.peek())
+        self.assertEquals(bytearray([1, 2, 3]), b.bytes_array(3))
+        self.assertEquals(4, b.peek())
+        self.assertEquals('\x04\x05', str(b.view(2)))
+        self.assertRaises(IndexError, b.bytes_array, 2)
+        
+    def test_read_until_missing(self):
+        b = ByteStream('adam')
+        self.assertEquals('adam', b.read_until(0, keep=False))
+        self.assert_(b.eof())
+        
+    def test_dump(self):
+        b = ByteStream(self.sample_bytes)
+        b.chars(4)
+        self.assertEquals('05 06', b.dump())
+        
+    def test_bytearray_strings(self):
+        b = ByteStream(bytearray('ab\x00cd\x01\x02'))
+        self.assertEquals(str, type(b.read_until(0)))
+        self.assertEquals('cd', b.chars(2))
+        self.assertEquals(str, type(b.rest()))
+        self.assertEquals('01 02', b.dump())
+
 
 if __name__ == "__main__":
     unittest.main()  
@@ -0,0 +1,83 @@
+"Unit tests for the image catalog."
+from __future__ import with_statement
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from tests.disktest import DiskTestCase
+from c64.catalog import Catalog
+from c64.formats import d64
+
+
+class CatalogTests(DiskTestCase):
+    def setUp(self):
+        self.catalog = Catalog(':memory:')
+        
+    def tearDown(self):
+        self.catalog.close()
+        
+    def test_index(self):
+        path = self.get_disk('1984-05.d64')
+        self.assert_(self.catalog.index(path))
+        self.assertEquals(('1541 Diskette', 'DISK SERVICE', 'Z2', None), 
+            self.catalog.image(path))
+        self.assertEquals(50, len(self.catalog.entries(path)))
+        
+    def test_skip_unchanged(self):
+        path = self.get_disk('1984-05.d64')
+        self.assert_(self.catalog.index(path))
+        self.failIf(self.catalog.index(path))
+        
+    def test_skip_same_hash(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'copy.d64')
+            shutil.copy(self.get_disk('1984-05.d64'), filename)
+            self.assert_(self.catalog.index(filename))
+            os.utime(filename, (0, 0))
+            self.failIf(self.catalog.index(filename))
+        finally:
+            shutil.rmtree(path)
+        
+    def test_images_containing(self):
+        self.catalog.index_all([self.get_disk('1984-05.d64'), 
+            self.get_disk('BARD1A.D64')])
+        found = self.catalog.images_containing('MENU')
+        self.assertEquals([(os.path.abspath(self.get_disk('1984-05.d64')), 0)], found)
+        self.assertEquals(found, self.catalog.images_containing('menu', ignore_case=True))
+        
+    def test_images_with_hash(self):
+        path = self.get_disk('1984-05.d64')
+        self.catalog.index(path)
+        h = hashlib.sha1(d64.load(path).find('PROPS')).hexdigest()
+        self.assertEquals([(os.path.abspath(path), 1, 'PROPS')], 
+            self.catalog.images_with_hash(h))
+            
+    def test_error(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'bad.t64')
+            with open(filename, 'wb') as f:
+                f.write('not a tape')
+            self.assert_(self.catalog.index(filename))
+            self.assert_(self.catalog.image(filename)[3].startswith('FormatError'))
+        finally:
+            shutil.rmtree(path)
+            
+    def test_blank_disk_name(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'blank.d64')
+            with open(filename, 'wb') as f:
+                f.write(d64.build([('HELLO', 2, '\x01\x08')], ''))
+            self.assert_(self.catalog.index(filename))
+            self.assertEquals(None, self.catalog.image(filename)[3])
+            self.assertEquals(1, len(self.catalog.entries(filename)))
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()  
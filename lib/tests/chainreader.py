@@ -0,0 +1,54 @@
+"Unit tests for streaming file chains out of disk images."
+from __future__ import with_statement
+
+import unittest
+from tests.disktest import DiskTestCase
+from c64.formats import d64
+
+
+class ChainReaderTests(DiskTestCase):
+    def setUp(self):
+        self.disk = d64.load(self.get_disk('1984-05.d64'))
+        self.expected = self.disk.find('PROPS')
+        
+    def test_read_all(self):
+        self.assertEquals(self.expected, self.disk.open('PROPS').read())
+        
+    def test_read_pieces(self):
+        f = self.disk.open('PROPS')
+        pieces = list()
+        while True:
+            s = f.read(1000)
+            if not s:
+                break
+            pieces.append(s)
+        self.assertEquals(self.expected, ''.join(pieces))
+        self.assertEquals(1000, len(pieces[0]))
+        
+    def test_iterate(self):
+        chunks = list(self.disk.open('PROPS'))
+        self.assertEquals(254, len(chunks[0]))
+        self.assertEquals(self.expected, ''.join(chunks))
+        
+    def test_read_then_iterate(self):
+        f = self.disk.open('PROPS')
+        start = f.read(10)
+        self.assertEquals(self.expected, start + ''.join(f))
+        self.assertEquals('', f.read())
+        
+    def test_readinto(self):
+        f = self.disk.open('PROPS')
+        b = bytearray(300)
+        self.assertEquals(300, f.readinto(b))
+        self.assertEquals(self.expected[:300], str(b))
+        
+        b = bytearray(len(self.expected))
+        self.assertEquals(len(self.expected) - 300, f.readinto(b))
+        
+    def test_mapped(self):
+        d = d64.load(self.get_disk('1984-05.d64'), mapped=True)
+        self.assertEquals(self.expected, d.open('PROPS').read())
+
+
+if __name__ == "__main__":
+    unittest.main()  
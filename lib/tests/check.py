@@ -0,0 +1,75 @@
+"Unit tests for whole-disk consistency checks."
+from __future__ import with_statement
+
+import unittest
+from tests.disktest import DiskTestCase
+from c64.formats import d64, d81
+from c64.formats.check import check_disk
+from c64.formats.cbmdos import IllegalSectorError
+
+
+class CheckTests(DiskTestCase):
+    def load(self):
+        return d64.load(self.get_disk('1984-05.d64'), writable=True)
+        
+    def relink(self, d, location, link):
+        sector = str(d.disk.get_sector(*location))
+        d.disk.write_sector(location[0], location[1], 
+            chr(link[0]) + chr(link[1]) + sector[2:])
+        
+    def test_clean(self):
+        self.assert_(check_disk(d64.load(self.get_disk('1984-05.d64'))).ok)
+        self.assert_(check_disk(d81.load(self.get_disk('bbs/drive8.d81'))).ok)
+        self.assert_(check_disk(d64.load(self.get_disk('geos/GEOS64/GEOS64.D64'))).ok)
+        
+    def test_cycle(self):
+        d = self.load()
+        e = d.entries[1]
+        self.relink(d, (e.track, e.sector), (e.track, e.sector))
+        self.assertEquals([e.name], check_disk(d).cycles)
+        
+    def test_cross_linked(self):
+        d = self.load()
+        a, b = d.entries[1], d.entries[2]
+        self.relink(d, (a.track, a.sector), (b.track, b.sector))
+        r = check_disk(d)
+        self.assertEquals([((b.track, b.sector), a.name, b.name)], r.cross_linked)
+        # The rest of the first file's chain is now orphaned.
+        self.assert_(r.orphans)
+        
+    def test_illegal(self):
+        d = self.load()
+        e = d.entries[1]
+        self.relink(d, (e.track, e.sector), (40, 0))
+        self.assertEquals([(e.name, (40, 0))], check_disk(d).illegal)
+        self.assertRaises(IllegalSectorError, d.file, 1)
+        
+    def test_directory_chain(self):
+        # A directory that loops back on itself, or links off the disk,
+        # is reported; the entries in the sectors before it are checked.
+        d = self.load()
+        self.relink(d, (18, 1), (18, 1))
+        r = check_disk(d)
+        self.assertEquals(['<directory>'], r.cycles)
+        self.assert_(r.orphans)
+        self.failIf(r.used_but_free)
+        
+        d = self.load()
+        self.relink(d, (18, 1), (40, 0))
+        r = check_disk(d)
+        self.assertEquals([('<directory>', (40, 0))], r.illegal)
+        self.assertEquals([], r.cycles)
+        
+    def test_bam(self):
+        d = self.load()
+        e = d.entries[0]
+        d.bam.free(e.track, e.sector)
+        d.bam.free_counts[e.track] -= 1
+        d.flush()
+        r = check_disk(d)
+        self.assertEquals([(e.track, e.sector)], r.used_but_free)
+        self.assertEquals(1, len(r.count_mismatches))
+
+
+if __name__ == "__main__":
+    unittest.main()  
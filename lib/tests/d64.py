@@ -26,5 +26,49 @@ class D64Tests(DiskTestCase):
         self.assertEqual(True, d.has_bootsector, 
                 "Expected to find a bootsector, but didn't.")
 
+    def test_mapped(self):
+        d = d64.load(self.get_disk('1984-05.d64'))
+        m = d64.load(self.get_disk('1984-05.d64'), mapped=True)
+        self.assertEquals(d.disk_name, m.disk_name)
+        self.assertEquals([e.name for e in d.entries], 
+            [e.name for e in m.entries])
+        self.assertEquals(d.file(0), m.file(0))
+        self.assertEquals(d.disk.get_sector(18, 0), 
+            str(m.disk.get_sector(18, 0)))
+
+    def test_lazy(self):
+        d = d64.load(self.get_disk('1984-05.d64'), lazy=True)
+        self.assertEquals("DISK SERVICE", d.disk_name)
+        first = d.iter_entries().next()
+        self.assertEquals(None, d._directory_sectors)
+        self.assertEquals(d64.load(self.get_disk('1984-05.d64')).entries[0].name, 
+            first.name)
+        self.assertEquals(50, len(d.entries))
+        
+    def test_lazy_entry_decoding(self):
+        d = d64.load(self.get_disk('1984-05.d64'))
+        e = d.raw_entries[0]
+        self.failIf('name' in e.__dict__)
+        self.assert_(e.in_use)
+        self.assert_(e.size > 0)
+        self.assert_('name' in e.__dict__)
+
+    def test_bam(self):
+        d = d64.load(self.get_disk('1984-05.d64'))
+        self.assertEquals(134, d.bam.blocks_free)
+        # Every used block belongs to a file, on a disk with nothing hidden.
+        self.assertEquals(664 - 134, sum(e.size for e in d.entries))
+        self.assert_(d.bam.is_allocated(18, 0))
+        
+    def test_bam_map(self):
+        d = d64.load(self.get_disk('1984-05.d64'))
+        bam = d.bam
+        allocated = bam.allocation_map()
+        self.assertEquals(683, len(allocated))
+        self.assertEquals(683 - bam.total_free, sum(allocated))
+        self.assertEquals(bam.total_free, sum(n for b, n in bam.free_extents()))
+        for t in range(1, 36):
+            self.assertEquals(bam.free_counts[t], bam.free_on_track(t))
+
 if __name__ == "__main__":
     unittest.main()  
@@ -16,6 +16,13 @@ class D81Tests(DiskTestCase):
         d = d81.load(self.get_disk('bbs/drive8.d81'))
         self.assertEquals(145, len(d.entries))
 
+        
+    def test_bam(self):
+        d = d81.load(self.get_disk('bbs/drive9.d81'))
+        self.assertEquals(3154, d.bam.blocks_free)
+        for t in range(1, 81):
+            self.assertEquals(d.bam.free_counts[t], d.bam.free_on_track(t))
+
 
 if __name__ == "__main__":
     unittest.main()  
@@ -0,0 +1,65 @@
+"Unit tests for comparing disk images."
+from __future__ import with_statement
+
+import unittest
+from tests.disktest import DiskTestCase
+from c64.diff import *
+from c64.formats import d64, d81
+
+
+class DiffTests(DiskTestCase):
+    def test_same(self):
+        a = d64.load(self.get_disk('1984-05.d64'))
+        b = d64.load(self.get_disk('1984-05.d64'), mapped=True)
+        diff = diff_disks(a, b)
+        self.assert_(diff.same)
+        self.assertEquals(50, len(diff.identical))
+        
+    def test_changes(self):
+        a = d64.load(self.get_disk('1984-05.d64'))
+        b = d64.load(self.get_disk('1984-05.d64'), writable=True)
+        props = b.find('PROPS')
+        b.delete_file('PROPS')
+        b.write_file('PROPS COPY', props)
+        b.delete_file('MENU')
+        b.write_file('MENU', 'new menu')
+        b.write_file('EXTRA', 'extra')
+        b.flush()
+        
+        diff = diff_disks(a, b)
+        self.failIf(diff.same)
+        self.assert_(diff.changed_sectors)
+        self.assertEquals([('PROPS', 'PROPS COPY')], diff.renamed)
+        self.assertEquals(['MENU'], diff.changed)
+        self.assertEquals(['EXTRA'], diff.added)
+        self.assertEquals([], diff.removed)
+        
+    def test_geometry(self):
+        a = d64.load(self.get_disk('geos/GEOS64/GEOS64.D64'))
+        b = d81.load(self.get_disk('geos/G641581/GEOS64.D81'))
+        diff = diff_disks(a, b)
+        self.assertEquals(None, diff.changed_sectors)
+        self.assert_(diff.identical or diff.moved)
+        
+        # 35- and 40-track disks with the same files are not the same.
+        files = [('HELLO', 2, 'hello')]
+        diff = diff_disks(d64.D64Disk(d64.build(files)), 
+            d64.D64Disk(d64.build(files, tracks=40)))
+        self.assertEquals(None, diff.changed_sectors)
+        self.failIf(diff.same)
+
+
+class SimilarityTests(DiskTestCase):
+    def test_query(self):
+        index = SimilarityIndex()
+        for name in ('1984-05.d64', 'BARD1A.D64', 'geos/GEOS64/GEOS64.D64', 
+                'geos/GEOS128/GEOS128.D64'):
+            index.add(name, d64.load(self.get_disk(name)))
+        
+        found = index.query(d64.load(self.get_disk('geos/GEOS64/GEOS64.D64')))
+        self.assertEquals(('geos/GEOS64/GEOS64.D64', 1.0), found[0])
+        self.failIf('1984-05.d64' in [k for k, score in found[:1]])
+
+
+if __name__ == "__main__":
+    unittest.main()  
@@ -0,0 +1,98 @@
+"Unit tests for writing to disk images."
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.disktest import DiskTestCase
+from c64.formats import d64, d81
+from c64.formats.cbmdos import DiskFullError, FileNotFoundError
+
+
+class DiskWriteTests(DiskTestCase):
+    def test_write_file(self):
+        d = d64.load(self.get_disk('1984-05.d64'), writable=True)
+        free = d.bam.blocks_free
+        data = ''.join(chr(i % 256) for i in range(1000))
+        d.write_file('NEW FILE', data)
+        
+        self.assertEquals(51, len(d.entries))
+        self.assertEquals(data, d.find('NEW FILE'))
+        self.assertEquals(free - 4, d.bam.blocks_free)
+        
+    def test_interleave(self):
+        d = d64.load(self.get_disk('BARD1A.D64'), writable=True)
+        d.write_file('SPREAD', 'x' * 600)
+        e = d.find_entries('SPREAD')[0]
+        sectors = [(e.track, e.sector)] + [(t, s) 
+            for b, t, s in d.disk.walk_sectors(e.track, e.sector) if t]
+        self.assertEquals(3, len(sectors))
+        self.assertEquals((sectors[0][1] + 10) % 21, sectors[1][1])
+        
+    def test_empty_file(self):
+        d = d64.load(self.get_disk('1984-05.d64'), writable=True)
+        d.write_file('EMPTY', '')
+        self.assertEquals('', d.find('EMPTY'))
+        
+    def test_delete_file(self):
+        d = d64.load(self.get_disk('1984-05.d64'), writable=True)
+        free = d.bam.blocks_free
+        size = d.entries[1].size
+        d.delete_file('PROPS')
+        self.assertEquals(49, len(d.entries))
+        self.assertRaises(FileNotFoundError, d.find, 'PROPS')
+        self.assertEquals(free + size, d.bam.blocks_free)
+        
+    def test_disk_full(self):
+        d = d64.load(self.get_disk('1984-05.d64'), writable=True)
+        self.assertRaises(DiskFullError, d.write_file, 'BIG', 'x' * 254 * 200)
+        
+    def test_disk_full_leaves_bam(self):
+        # More blocks are free than the data tracks hold, counting the
+        # directory track, which files are never written to.
+        d = d64.D64Disk(bytearray(d64.build([('BIG', 2, 'x' * 254 * 650)])))
+        free = d.bam.total_free
+        self.assert_(free > 20 > d.bam.data_blocks_free)
+        self.assertRaises(DiskFullError, d.write_file, 'MORE', 'x' * 254 * 20)
+        self.assertEquals(free, d.bam.total_free)
+        self.assertEquals(1, len(d.entries))
+        
+    def test_extend_directory(self):
+        d = d81.load(self.get_disk('bbs/drive9.d81'), writable=True)
+        sectors = len(d.directory_sectors)
+        for i in range(8 * sectors + 8):
+            d.write_file('FILE %d' % i, 'data %d' % i)
+        self.assert_(len(d.directory_sectors) > sectors)
+        self.assertEquals('data 15', d.find('FILE 15'))
+        
+    def test_save(self):
+        d = d64.load(self.get_disk('1984-05.d64'), writable=True)
+        d.write_file('SAVED', 'saved bytes')
+        
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'saved.d64')
+            d.save(filename)
+            saved = d64.load(filename)
+            self.assertEquals('saved bytes', saved.find('SAVED'))
+            self.assertEquals(d.bam.blocks_free, saved.bam.blocks_free)
+        finally:
+            shutil.rmtree(path)
+            
+    def test_mapped_save(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'mapped.d64')
+            shutil.copy(self.get_disk('1984-05.d64'), filename)
+            d = d64.load(filename, mapped=True, writable=True)
+            d.write_file('MAPPED', 'mapped bytes')
+            d.save()
+            self.assertEquals('mapped bytes', d64.load(filename).find('MAPPED'))
+            self.assertRaises(ValueError, d64.load(filename, writable=True).save)
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()  
@@ -0,0 +1,64 @@
+"Unit tests for images carrying per-sector error bytes."
+from __future__ import with_statement
+
+import unittest
+from c64.formats import d64, d71
+from c64.formats.cbmdos import BadSectorError
+from c64.formats.loaders import SIZES
+
+
+FILES = [('FIRST', 2, 'a' * 600), ('SECOND', 2, 'b' * 300)]
+
+
+def with_errors(bytes, description, flagged=()):
+    "Append error bytes to an image, flagging the given linear blocks."
+    errors = bytearray('\x01' * description.total_sectors)
+    for block, code in flagged:
+        errors[block] = code
+    return bytes + str(errors)
+
+
+class ErrorByteTests(unittest.TestCase):
+    def setUp(self):
+        self.desc = d64.GEOMETRIES[0]
+        self.bytes = d64.build(FILES, 'ERRORS')
+        
+    def test_sizes(self):
+        self.assertEquals(175531, self.desc.error_image_size)
+        self.assertEquals(351062, d71.GEOMETRIES[0].error_image_size)
+        self.assert_(175531 in SIZES)
+        
+    def test_no_errors(self):
+        d = d64.D64Disk(self.bytes)
+        self.assertEquals(None, d.disk.errors)
+        self.assertEquals(1, d.disk.sector_error(18, 0))
+        self.assertEquals([], d.disk.bad_sectors())
+        self.assertEquals({}, d.disk.error_summary())
+        
+    def test_clean_error_bytes(self):
+        d = d64.D64Disk(with_errors(self.bytes, self.desc))
+        self.assertEquals(self.desc.total_sectors, len(d.disk.errors))
+        self.assertEquals(['FIRST', 'SECOND'], [e.name for e in d.entries])
+        self.assertEquals({}, d.disk.error_summary())
+        
+    def test_flagged_sector(self):
+        d = d64.D64Disk(self.bytes)
+        first = d.find_entries('FIRST')[0]
+        block = self.desc.block_number(first.track, first.sector)
+        bad = d64.D64Disk(with_errors(self.bytes, self.desc, 
+            [(block, 0x05), (0, 0x02)]))
+        
+        self.assert_(bad.disk.is_bad(first.track, first.sector))
+        self.failIf(bad.disk.is_bad(18, 0))
+        self.assertEquals(
+            [((1, 0), 0x02), ((first.track, first.sector), 0x05)],
+            sorted(bad.disk.bad_sectors()))
+        self.assertEquals({20: 1, 23: 1}, bad.disk.error_summary())
+        
+        # Errors are only enforced on request.
+        self.assertEquals('a' * 600, bad.find('FIRST'))
+        bad.disk.check_errors = True
+        self.assertRaises(BadSectorError, bad.find, 'FIRST')
+        self.assertRaises(BadSectorError, bad.disk.get_sector, 
+            first.track, first.sector)
+        self.assertEquals('b' * 300, bad.find('SECOND'))
@@ -0,0 +1,61 @@
+"Unit tests for the G64 GCR image format."
+from __future__ import with_statement
+
+import unittest
+from c64.formats import d64, g64
+from c64.formats.cbmdos import BadSectorError
+
+
+FILES = [('FIRST', 2, 'a' * 600), ('SECOND', 2, ''.join(map(chr, range(256))))]
+
+
+class G64Tests(unittest.TestCase):
+    def setUp(self):
+        self.d64_bytes = d64.build(FILES, 'GCR DISK', 'GC')
+        self.bytes = g64.encode(self.d64_bytes)
+        
+    def test_gcr_tables(self):
+        for n in range(256):
+            self.assertEquals(chr(n), 
+                g64._decode_bits(''.join(g64._BITS[ord(c)] 
+                    for c in g64._encode_bytes(chr(n) * 4)), 0, 4)[0])
+        self.assertEquals(768, g64._DECODE_BYTE.count(None))
+        
+    def test_round_trip(self):
+        desc, image = g64.decode(self.bytes)
+        self.assertEquals(35, desc.tracks)
+        self.assertEquals(self.d64_bytes, image[:desc.image_size])
+        self.assertEquals('\x01' * desc.total_sectors, 
+            image[desc.image_size:])
+            
+    def test_disk(self):
+        d = g64.G64Disk(self.bytes)
+        self.assertEquals('GCR DISK', d.disk_name)
+        self.assertEquals('GC', d.disk_id)
+        self.assertEquals(['FIRST', 'SECOND'], [e.name for e in d.entries])
+        self.assertEquals(FILES[1][2], d.find('SECOND'))
+        self.assertEquals({}, d.disk.error_summary())
+        
+    def test_unaligned_track(self):
+        # Shift track 1 by three bits; syncs need not be byte-aligned.
+        tracks = g64._read_tracks(self.bytes)
+        bits = '111' + ''.join(g64._BITS[ord(c)] for c in tracks[1])[:-3]
+        shifted = ''.join(chr(int(bits[i:i+8], 2)) 
+            for i in range(0, len(bits), 8))
+        sectors = g64.decode_track(shifted)
+        self.assertEquals(21, len(sectors))
+        self.assertEquals((1, self.d64_bytes[256:512]), sectors[1])
+        
+    def test_damaged_sector(self):
+        # Corrupt the data block of track 18, sector 1 (the directory.)
+        bytes = bytearray(self.bytes)
+        ofs = 12 + 84 * 8 + 17 * (2 + g64.MAX_TRACK_SIZE) + 2 + 362 + 40
+        bytes[ofs:ofs+4] = '\x00' * 4
+        d = g64.G64Disk(str(bytes))
+        self.assertEquals({24: 1}, d.disk.error_summary())
+        d = g64.G64Disk(str(bytes), lazy=True)
+        d.disk.check_errors = True
+        self.assertRaises(BadSectorError, lambda: d.entries)
+        
+    def test_not_g64(self):
+        self.assertRaises(g64.G64FormatError, g64.G64Disk, self.d64_bytes)
@@ -0,0 +1,70 @@
+"Unit tests for the extended disk geometries."
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+from c64.formats import d64, d71, d80
+from c64.formats.check import check_disk
+from c64.formats.loaders import get_loader
+
+
+FILES = [('FILE %d' % i, 2, 'x' * (i * 300)) for i in range(12)]
+
+
+class GeometryTests(unittest.TestCase):
+    def check_disk(self, d, blocks_free):
+        self.assertEquals([f[0] for f in FILES], [e.name for e in d.entries])
+        self.assertEquals(FILES[5][2], d.find('FILE 5'))
+        used = sum(e.size for e in d.entries)
+        self.assertEquals(blocks_free - used, d.bam.blocks_free)
+        self.assert_(check_disk(d).ok, str(check_disk(d)))
+        
+    def test_image_sizes(self):
+        self.assertEquals([174848, 196608, 205312], 
+            [x.image_size for x in d64.GEOMETRIES])
+        self.assertEquals(349696, d71.GEOMETRIES[0].image_size)
+        self.assertEquals([533248, 1066496], 
+            [x.image_size for x in d80.GEOMETRIES])
+            
+    def test_d64_40(self):
+        bytes = d64.build(FILES, 'FORTY', tracks=40)
+        d = d64.D64Disk(bytes)
+        self.assertEquals(40, d.disk._desc.tracks)
+        self.check_disk(d, 664 + 85)
+        
+    def test_d64_42(self):
+        d = d64.D64Disk(d64.build(FILES, 'FORTY TWO', tracks=42))
+        self.assertEquals(42, d.disk._desc.tracks)
+        self.check_disk(d, 664 + 119)
+        
+    def test_d71(self):
+        d = d71.D71Disk(d71.build(FILES, 'DOUBLE', 'DS'))
+        self.assertEquals('DOUBLE', d.disk_name)
+        self.check_disk(d, 1328)
+        
+    def test_d80(self):
+        d = d80.D80Disk(d80.build(FILES, 'EIGHTY', '80'))
+        self.assertEquals('EIGHTY', d.disk_name)
+        self.assertEquals('80', d.disk_id)
+        self.check_disk(d, 2083 - 29 - 2)
+        
+    def test_d82(self):
+        d = d80.D82Disk(d80.build(FILES, 'EIGHTY TWO', double_sided=True))
+        self.check_disk(d, 4166 - 29 - 4)
+        
+    def test_detect_size(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'unknown.img')
+            with open(filename, 'wb') as f:
+                f.write(d80.build(FILES, double_sided=True))
+            d = get_loader(filename)(filename)
+            self.assertEquals('8250 Diskette', d.image_type)
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()  
@@ -0,0 +1,38 @@
+"Unit tests for disk geometry tables."
+from __future__ import with_statement
+
+import unittest
+from c64.formats.d64 import D64_Description
+from c64.formats.d81 import D81_Description
+
+
+class GeometryTests(unittest.TestCase):
+    def test_d64_total(self):
+        d = D64_Description()
+        self.assertEquals(683, d.total_sectors)
+        self.assertEquals(35, d.tracks)
+        
+    def test_d81_total(self):
+        d = D81_Description()
+        self.assertEquals(3200, d.total_sectors)
+        self.assertEquals(80, d.tracks)
+        
+    def test_track_offsets(self):
+        d = D64_Description()
+        for track in range(1, d.tracks + 1):
+            expected = sum(d.sectors_per_track[i] for i in range(1, track))
+            self.assertEquals(expected, d.track_offsets[track])
+            
+    def test_round_trip(self):
+        for d in (D64_Description(), D81_Description()):
+            for n in range(d.total_sectors):
+                self.assertEquals(n, d.block_number(*d.location(n)))
+                
+    def test_directory_block(self):
+        d = D64_Description()
+        self.assertEquals(357, d.block_number(18, 0))
+        self.assertEquals((18, 0), d.location(357))
+
+
+if __name__ == "__main__":
+    unittest.main()  
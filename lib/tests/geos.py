@@ -0,0 +1,57 @@
+"Unit tests for GEOS info blocks and VLIR files."
+from __future__ import with_statement
+
+import unittest
+from tests.disktest import DiskTestCase
+from c64.formats import d64
+from c64.formats.cbmdos import FormatError
+
+
+class GeosTests(DiskTestCase):
+    def setUp(self):
+        self.d = d64.load(self.get_disk('geos/GEOS64/APPS64.D64'))
+        
+    def test_info(self):
+        info = self.d.geos_info('GEOWRITE')
+        self.assertEquals('geoWrite    V2.1', info.geos_class)
+        self.assertEquals('Tony Requist', info.author)
+        self.assertEquals(6, info.geos_type)
+        self.assertEquals(1, info.structure)
+        self.assertEquals(0x400, info.load_address)
+        self.assert_(info.description.startswith('geoWrite (64 version)'))
+        
+    def test_icon(self):
+        rows = self.d.geos_info('GEOWRITE').icon_rows()
+        self.assertEquals((3, 21), self.d.geos_info('GEOWRITE').icon_size)
+        self.assertEquals(21, len(rows))
+        self.assertEquals('#' * 24, rows[0])
+        self.assertEquals('#' + '.' * 22 + '#', rows[1])
+        
+    def test_cache(self):
+        self.assert_(self.d.geos_info('GEOWRITE') is 
+            self.d.geos_info('GEOWRITE'))
+        entries = self.d.geos_entries()
+        self.assertEquals(13, len(entries))
+        self.assert_(dict((e.name, i) for e, i in entries)['GEOWRITE'] is
+            self.d.geos_info('GEOWRITE'))
+            
+    def test_vlir(self):
+        v = self.d.open_vlir('GEOWRITE')
+        self.assertEquals(9, len(v))
+        records = list(v)
+        self.assertEquals(10335, len(records[0]))
+        self.assertEquals(records[3], v.record(3))
+        self.assertEquals(records[3], v.open_record(3).read())
+        
+        # All the records together fill the blocks of the file, less 
+        # the index and info blocks.
+        e = self.d.find_entries('GEOWRITE')[0]
+        used = sum((len(r) + 253) // 254 for r in records if r)
+        self.assertEquals(e.size - 2, used)
+        
+    def test_not_vlir(self):
+        self.assertRaises(FormatError, self.d.open_vlir, 'calculator')
+
+
+if __name__ == "__main__":
+    unittest.main()
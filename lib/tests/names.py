@@ -0,0 +1,70 @@
+"Unit tests for container filename lookups."
+from __future__ import with_statement
+
+import unittest
+from c64.formats.names import *
+from tests.disktest import DiskTestCase
+from c64.formats import d64
+
+
+class Named(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class NameMatchTests(unittest.TestCase):
+    def test_exact(self):
+        self.assert_(name_matches('MENU', 'MENU'))
+        self.failIf(name_matches('MENU', 'MENUS'))
+        
+    def test_question(self):
+        self.assert_(name_matches('M?NU', 'MENU'))
+        self.failIf(name_matches('M?NU', 'MNU'))
+        
+    def test_star(self):
+        self.assert_(name_matches('ME*', 'MENU'))
+        self.assert_(name_matches('*', ''))
+        # Anything after the star is ignored, as in CBM-DOS.
+        self.assert_(name_matches('ME*XX', 'MENU'))
+        self.failIf(name_matches('MX*', 'MENU'))
+        
+    def test_fold_case(self):
+        self.assertEquals('MENU', fold_case('menu'))
+        self.assertEquals('MENU', fold_case('\xcd\xc5\xce\xd5'))
+        self.assert_(name_matches('m*', 'MENU', ignore_case=True))
+        
+        
+class NameIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex(Named(x) for x in ('A', 'AB', 'a', 'AB'))
+        
+    def test_exact(self):
+        self.assertEquals(2, len(self.index.lookup('AB')))
+        self.assertEquals(1, len(self.index.lookup('A')))
+        self.assertEquals([], self.index.lookup('B'))
+        
+    def test_ignore_case(self):
+        self.assertEquals(2, len(self.index.lookup('a', ignore_case=True)))
+        
+    def test_wildcard(self):
+        self.assertEquals(['A', 'AB', 'AB'], 
+            [e.name for e in self.index.lookup('A*')])
+
+
+class DiskLookupTests(DiskTestCase):
+    def test_find_ignore_case(self):
+        d = d64.load(self.get_disk('1984-05.d64'))
+        self.assertEquals(d.find('MENU'), d.find('menu', ignore_case=True))
+        
+    def test_find_lazy(self):
+        d = d64.load(self.get_disk('1984-05.d64'), lazy=True)
+        self.assertEquals(d64.load(self.get_disk('1984-05.d64')).find('MENU'), 
+            d.find('ME*'))
+        
+    def test_find_entries(self):
+        d = d64.load(self.get_disk('1984-05.d64'))
+        self.assertEquals(50, len(d.find_entries('*')))
+
+
+if __name__ == "__main__":
+    unittest.main()  
@@ -0,0 +1,72 @@
+"Unit tests for 1581 partitions and sub-directories."
+from __future__ import with_statement
+
+import unittest
+from c64.formats import d81
+from c64.formats.cbmdos import FormatError, DiskFullError
+from c64.formats.check import check_disk
+
+
+class PartitionTests(unittest.TestCase):
+    def setUp(self):
+        bytes = bytearray(d81.build([('TOP', 2, 'top' * 100)], 'PARENT', 'PA'))
+        self.d = d81.D81Disk(bytes)
+        self.sub = self.d.create_partition('SUB', 50, 5)
+        self.sub.write_file('INNER', 'inner' * 200)
+        self.sub.flush()
+        
+    def test_partition_entry(self):
+        e = self.d.find_entries('SUB')[0]
+        self.assertEquals('CBM', e.format)
+        self.assertEquals((50, 0), (e.track, e.sector))
+        self.assertEquals(200, e.size)
+        self.assertEquals([e.name], [p.name for p in self.d.partitions])
+        self.assertEquals(3160 - 2 - 200, self.d.bam.blocks_free)
+        
+    def test_shared_bytes(self):
+        self.assert_(self.sub.disk.bytes is self.d.disk.bytes)
+        sub = self.d.open_partition('SUB')
+        self.assertEquals('1581 Partition', sub.image_type)
+        self.assertEquals('SUB', sub.disk_name)
+        self.assertEquals('PA', sub.disk_id)
+        self.assertEquals(['INNER'], [e.name for e in sub.entries])
+        self.assertEquals('inner' * 200, sub.find('INNER'))
+        
+        # Files in the partition stay inside its tracks.
+        e = sub.entries[0]
+        self.assert_(all(50 <= t <= 54 for _, t, s in 
+            sub.disk.walk_sectors(e.track, e.sector) if t))
+        self.assertEquals(200 - 4 - e.size, sub.bam.total_free)
+        
+    def test_walk(self):
+        self.sub.create_partition('DEEPER', 52, 3)
+        listing = [(path, e.name) for path, e in self.d.walk()]
+        self.assertEquals([
+            ((), 'TOP'), ((), 'SUB'), 
+            (('SUB',), 'INNER'), (('SUB',), 'DEEPER')], listing)
+        self.assert_(check_disk(self.d).ok, str(check_disk(self.d)))
+            
+    def test_bad_partitions(self):
+        self.assertRaises(FormatError, self.d.create_partition, 'X', 39, 3)
+        self.assertRaises(FormatError, self.d.create_partition, 'X', 60, 2)
+        self.assertRaises(DiskFullError, self.d.create_partition, 'X', 52, 3)
+        self.assertRaises(FormatError, self.d.open_partition, 'TOP')
+        self.assertRaises(FormatError, self.sub.create_partition, 'X', 60, 3)
+        
+    def test_corrupt_partitions(self):
+        # Entries pointing back at SUB itself, and at a sub-directory
+        # outside of SUB's tracks, are not descended into.
+        self.d.create_partition('OTHER', 60, 3)
+        self.sub.add_entry('LOOP', d81.PARTITION, (50, 0), 200)
+        self.sub.add_entry('OUTSIDE', d81.PARTITION, (60, 0), 120)
+        self.sub.flush()
+        self.assertEquals([], self.sub.partitions)
+        listing = [(path, e.name) for path, e in self.d.walk()]
+        self.assertEquals([
+            ((), 'TOP'), ((), 'SUB'), ((), 'OTHER'), 
+            (('SUB',), 'INNER'), (('SUB',), 'LOOP'), (('SUB',), 'OUTSIDE')],
+            listing)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"Unit tests for REL file record access."
+from __future__ import with_statement
+
+import unittest
+from tests.disktest import DiskTestCase
+from c64.formats import d81
+from c64.formats.cbmdos import FormatError
+
+
+class RelativeFileTests(DiskTestCase):
+    def setUp(self):
+        self.d = d81.load(self.get_disk('bbs/drive8.d81'))
+        
+    def test_entries(self):
+        rel = [e for e in self.d.entries if e.filetype == 4]
+        self.assertEquals(4, len(rel))
+        self.assertEquals(['REL'] * 4, [e.format for e in rel])
+        
+    def test_side_sectors(self):
+        r = self.d.open_relative('\xbaPASSWORD FILE')
+        self.assertEquals(254, r.record_length)
+        # 52 blocks: the data, a super side sector and a side sector.
+        self.assertEquals(50, len(r.blocks))
+        self.assertEquals(50, len(r))
+        
+    def test_records(self):
+        r = self.d.open_relative('\xbaMOD FILE')
+        self.assertEquals(127, r.record_length)
+        self.assertEquals(12, len(r))
+        self.assertEquals(' 1\r 0\r 0\r', r.record(0)[:9])
+        self.assertEquals(r.record(11), r[-1])
+        self.assertEquals('\xff', r[11][0])
+        self.assertRaises(IndexError, r.record, 12)
+        
+        # Records spanning two blocks, and the bulk iterator, agree 
+        # with the file read as a flat chain.
+        data = self.d.find('\xbaMOD FILE')
+        records = list(r)
+        self.assertEquals([r[i] for i in range(len(r))], records)
+        self.assertEquals(data, ''.join(records)[:len(data)])
+        self.assertEquals(records[5:], list(r.records(5)))
+        
+    def test_not_rel(self):
+        name = [e.name for e in self.d.entries if e.filetype == 2][0]
+        self.assertRaises(FormatError, self.d.open_relative, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
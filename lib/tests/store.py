@@ -0,0 +1,78 @@
+"Unit tests for the deduplicating image store."
+from __future__ import with_statement
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from tests.disktest import DiskTestCase
+from c64.formats import g64
+from c64.store import ImageStore
+
+
+class ImageStoreTests(DiskTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ImageStore(self.path)
+        
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        
+    def check_round_trip(self, filename):
+        with open(filename, 'rb') as f:
+            expected = f.read()
+        image_hash = self.store.add(filename)
+        self.assertEquals(hashlib.sha1(expected).hexdigest(), image_hash)
+        self.assertEquals(expected, self.store.rebuild(image_hash))
+        return image_hash
+        
+    def test_d64(self):
+        h = self.check_round_trip(self.get_disk('1984-05.d64'))
+        self.assertEquals(50, len(self.store.files(h)))
+        
+    def test_d81(self):
+        self.check_round_trip(self.get_disk('bbs/drive8.d81'))
+        
+    def test_t64(self):
+        self.check_round_trip(self.get_disk('paradrd.t64'))
+        
+    def test_g64(self):
+        # The GCR file isn't the sector image, so it's stored as blocks.
+        with open(self.get_disk('1984-05.d64'), 'rb') as f:
+            bytes = g64.encode(f.read())
+        filename = os.path.join(self.path, 'disk.g64')
+        with open(filename, 'wb') as f:
+            f.write(bytes)
+        h = self.check_round_trip(filename)
+        self.assertEquals([], self.store.files(h))
+        
+    def test_shared_chunks(self):
+        a = self.store.add(self.get_disk('geos/GEOS64/GEOS64.D64'))
+        b = self.store.add(self.get_disk('geos/G641581/GEOS64.D81'))
+        shared = set(h for n, h in self.store.files(a)) &\
+            set(h for n, h in self.store.files(b))
+        self.assert_(shared)
+        
+    def test_packed_chunks(self):
+        h = self.check_round_trip(self.get_disk('1984-05.d64'))
+        # Sector chunks are packed, and blank runs take one manifest entry.
+        chunks = self.store.chunks
+        self.assert_(all(x in chunks.index for x in self.store.chunk_hashes(h)
+            if len(chunks.get(x)) < chunks.PACK_LIMIT))
+        sectors = self.store.manifest(h)['sectors']
+        self.assertEquals(683, sum(x[-1] for x in sectors))
+        self.assert_(len(sectors) < 683 // 4)
+        
+        # The index is read back by a new store.
+        store = ImageStore(self.path)
+        self.assert_(all(x in store.chunks for x in self.store.chunk_hashes(h)))
+        self.assertEquals(self.store.rebuild(h), store.rebuild(h))
+        
+    def test_add_twice(self):
+        a = self.store.add(self.get_disk('1984-05.d64'))
+        self.assertEquals(a, self.store.add(self.get_disk('1984-05.d64')))
+
+
+if __name__ == "__main__":
+    unittest.main()  
@@ -2,6 +2,7 @@ from __future__ import with_statement
 
 import os
 import unittest
+import struct
 from c64.formats import t64
 
 def rel(path):
@@ -12,6 +13,64 @@ class T64Tests(unittest.TestCase):
         t = t64.load(rel("fixtures/paradrd.t64"))
         f = t.find("FILE")
 
+        
+    def test_mapped(self):
+        t = t64.load(rel("fixtures/paradrd.t64"), mapped=True)
+        self.assertEquals(t.find("FILE"), 
+            t64.load(rel("fixtures/paradrd.t64")).find("FILE"))
+
+    def test_entries(self):
+        t = t64.load(rel("fixtures/paradrd.t64"))
+        self.assertEquals(None, t._raw_entries)
+        self.assertEquals(30, len(t.raw_entries))
+        self.assertEquals(['FILE'], [e.name for e in t.entries])
+        
+        e = t.entries[0]
+        self.assertEquals(1024, e.offset)
+        self.assertEquals(40307, e.length)
+        self.failIf(e.repaired)
+        self.assertEquals(t.bytes[1024:], t.find("FILE"))
+        self.assertEquals(t.find("FILE"), t.file(0))
+        
+    def test_payload_view(self):
+        t = t64.load(rel("fixtures/paradrd.t64"), mapped=True)
+        view = t.payload(t.entries[0])
+        self.assert_(isinstance(view, buffer))
+        self.assertEquals(40307, len(view))
+        
+    def test_repair(self):
+        # Three entries listed out of order; the first claims a bogus
+        # end address, and the header claims more entries than fit.
+        def entry(name, start, end, offset):
+            return struct.pack('<bbHHxxLxxxx16s', 1, -126, start, end,
+                offset, name.ljust(16))
+        header = 'C64S tape image file'.ljust(32, '\x00') +\
+            struct.pack('<xxHHxx24s', 200, 3, 'REPAIRS'.ljust(24))
+        directory = ''.join([
+            entry('LIAR', 0x801, 0xC3C6, 0xB0),
+            entry('LAST', 0x1000, 0, 0xC0),
+            entry('FIRST', 0x801, 0x811, 0xA0),
+            ])
+        bytes = header + directory + 'F' * 16 + 'L' * 16 + 'Z' * 10
+        t = t64.T64(bytes)
+        
+        self.assertEquals(3, len(t.raw_entries))
+        self.assertEquals('F' * 16, t.find('FIRST'))
+        self.assertEquals('L' * 16, t.find('LIAR'))
+        self.assertEquals('Z' * 10, t.find('LAST'))
+        self.assertEquals([False, True, True], 
+            [t.find_entries(x)[0].repaired for x in ('FIRST', 'LIAR', 'LAST')])
+        
+        # Entries sharing a payload are both bounded by the next one.
+        directory = ''.join([
+            entry('ONE', 0x801, 0xC3C6, 0xA0),
+            entry('TWO', 0x801, 0xC3C6, 0xA0),
+            entry('NEXT', 0x1000, 0, 0xB0),
+            ])
+        t = t64.T64(header + directory + 'F' * 16 + 'L' * 16)
+        self.assertEquals(['F' * 16, 'F' * 16, 'L' * 16], 
+            [t.find(x) for x in ('ONE', 'TWO', 'NEXT')])
+
 
 if __name__ == "__main__":
     unittest.main()  
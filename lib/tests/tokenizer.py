@@ -0,0 +1,72 @@
+"Unit tests for the BASIC tokenizer."
+from __future__ import with_statement
+
+import unittest
+from tests.disktest import DiskTestCase
+from tests.basic import program
+from c64.formats import basic, d64
+from c64.formats.basic_tokens import BASIC7_TOKEN_MAP
+from c64.formats.basic_tokenizer import Tokenizer, TokenizeError, tokenize
+
+
+class TokenizerTests(DiskTestCase):
+    def setUp(self):
+        self.t = Tokenizer()
+        
+    def test_longest_match(self):
+        self.assertEquals((10, '\x89 10'), self.t.line('10 goto 10'))
+        self.assertEquals((10, '\xcb \xa4 10'), self.t.line('10 go to 10'))
+        self.assertEquals((20, '\x84 1,A$'), self.t.line('20 input# 1,A$'))
+        self.assertEquals((30, '\xc4(\xff)'), self.t.line('30 str$(pi)'))
+        
+    def test_quotes_and_names(self):
+        self.assertEquals((10, '\x99"\x93PRINT\x99\x05"'), 
+            self.t.line('10 print"{clr}print{$99}{white}"'))
+        self.assertRaises(TokenizeError, self.t.line, '10 print "{bogus}"')
+        self.assertRaises(TokenizeError, self.t.line, '10 {UNKNOWN}')
+        self.assertRaises(TokenizeError, self.t.line, 'print')
+        
+    def test_rem_and_data(self):
+        self.assertEquals((10, '\x83 -1,+2:\x99 \xab1'),
+            self.t.line('10 data -1,+2:print -1'))
+        self.assertEquals((10, '\x8f -1:+2'), self.t.line('10 rem -1:+2'))
+        
+    def test_links(self):
+        lines = [(10, '\x99 "HI"'), (20, '\x89 10')]
+        self.assertEquals(program(lines), 
+            tokenize('10 print "HI"\n\n20 goto 10\n'))
+        self.assertEquals(program(lines, 0x1c01), 
+            tokenize('10 print "HI"\n20 goto 10', 0x1c01))
+            
+    def test_two_byte_tokens(self):
+        t = Tokenizer(BASIC7_TOKEN_MAP)
+        self.assertEquals((10, '\xfe\x02 1:\x99 \xce\x02(1)'),
+            t.line('10 bank 1:print pot(1)'))
+        text = '10 bank 1\n20 do:loop'
+        b = basic.Basic(tokenize(text, 0x1c01, BASIC7_TOKEN_MAP))
+        self.assertEquals(text, b.list())
+        
+    def test_fresh_token_maps(self):
+        # Each map gets its own tokenizer, even where a freed map's id
+        # would be reused.
+        for i in range(20):
+            tokens = {0x80 + i: 'kw%d' % (i,)}
+            self.assertEquals(program([(10, chr(0x80 + i))]), 
+                tokenize('10 kw%d' % (i,), tokens=tokens))
+        
+    def test_round_trip(self):
+        d = d64.load(self.get_disk('1984-05.d64'))
+        count = 0
+        for e in d.entries:
+            bytes = d.find(e.name)
+            b = basic.Basic(bytes)
+            lines = [l.line for l in b.lines()]
+            if not lines or b.ml_bytes or not b.verify():
+                continue
+            self.assertEquals(bytes, tokenize('\n'.join(lines), b.load_address))
+            count += 1
+        self.assert_(count > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()